@@ -0,0 +1,246 @@
+# =====================================================
+# alerts.py – Event-Driven Alert Rules Engine
+# Evaluated inline on meter events + status changes
+# Rules: progress thresholds, stall detection, rate drop
+# State per (machine, rule, work order) of the machine's current
+# job, checkpointed to alert_state in batches (no re-fire on restart)
+# =====================================================
+import os
+import json
+import asyncio
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import or_
+
+import clock
+from database import SessionLocal
+from models import Machine, AlertState
+
+# =====================================================
+# RULE CONFIG
+# Override with ALERT_RULES (JSON string) or ALERT_RULES_FILE
+# =====================================================
+DEFAULT_RULES = {
+    # Progress thresholds in percent of target_qty
+    "progress": {"enabled": True, "warning": 75, "critical": 90},
+    # Running machine with no meter for factor × seconds_per_meter (never below min_seconds)
+    "stall": {"enabled": True, "factor": 3.0, "min_seconds": 30},
+    # Actual rate over the last `window` meters below `ratio` × ideal rate
+    "rate_drop": {"enabled": True, "window": 10, "ratio": 0.6},
+}
+
+RULES_FILE = os.getenv("ALERT_RULES_FILE", os.path.join(os.path.dirname(__file__), "alert_rules.json"))
+CHECKPOINT_INTERVAL = float(os.getenv("ALERT_CHECKPOINT_S", 5))  # dirty alert states → alert_state
+
+
+def load_rules() -> Dict:
+    rules = {name: dict(cfg) for name, cfg in DEFAULT_RULES.items()}
+    overrides = {}
+    try:
+        if os.getenv("ALERT_RULES"):
+            overrides = json.loads(os.getenv("ALERT_RULES"))
+        elif os.path.exists(RULES_FILE):
+            with open(RULES_FILE, "r", encoding="utf-8") as f:
+                overrides = json.load(f)
+    except Exception as e:
+        logging.error(f"Alert rules config invalid, using defaults: {e}")
+    for name, cfg in overrides.items():
+        rules.setdefault(name, {}).update(cfg)
+    return rules
+
+
+LEVEL_OK, LEVEL_WARNING, LEVEL_CRITICAL, LEVEL_COMPLETED = 0, 1, 2, 3
+
+# =====================================================
+# ENGINE
+# =====================================================
+class AlertEngine:
+    def __init__(self, publish: Callable[[Dict], Awaitable], rules: Dict = None):
+        self.publish = publish
+        self.rules = rules or load_rules()
+        self.lock = threading.Lock()
+        self.state: Dict[Tuple[int, str, str], int] = {}  # (machine_id, rule, work_order) → level
+        self._work_orders: Dict[int, Optional[str]] = {}  # machine_id → work order its state belongs to
+        self._dirty: Dict[Tuple[int, str, str], Tuple[int, str]] = {}  # key → (level, message) to persist
+        self._pruned: Dict[int, Optional[str]] = {}  # machine_id → work order whose rows are the only ones kept
+        self._meters: Dict[int, deque] = {}
+        self._stall_timers: Dict[int, asyncio.TimerHandle] = {}
+
+    # -------------------------------
+    # STARTUP
+    # -------------------------------
+    def load(self):
+        """Restore the alert levels of each machine's current job and arm stall timers for running machines."""
+        db = SessionLocal()
+        try:
+            machines = db.query(Machine).all()
+            self._work_orders = {m.id: m.work_order for m in machines}
+            for a in db.query(AlertState).all():
+                if a.work_order == self._work_orders.get(a.machine_id):
+                    self.state[(a.machine_id, a.rule, a.work_order)] = a.level
+                else:
+                    self._pruned[a.machine_id] = self._work_orders.get(a.machine_id)  # left by a previous job
+            for m in machines:
+                if m.status == "running":
+                    self._arm_stall(m)
+            logging.info(f"🔔 Alert engine loaded {len(self.state)} persisted alert states")
+        finally:
+            db.close()
+
+    # -------------------------------
+    # EVENT HOOKS
+    # -------------------------------
+    def on_meter(self, m: Machine, now: datetime = None, meters: int = 1):
+        """Call after produced_qty was incremented for a running machine."""
+        now = now or clock.now()
+        self._check_progress(m)
+        self._check_rate(m, now, meters)
+        self._set(m, "stall", LEVEL_OK)
+        self._arm_stall(m)
+
+    def on_status(self, m: Machine, old_status: str, new_status: str):
+        if new_status == "running":
+            self._meters.pop(m.id, None)
+            self._arm_stall(m)
+            return
+        self._cancel_stall(m.id)
+        self._set(m, "stall", LEVEL_OK)
+        self._set(m, "rate_drop", LEVEL_OK)
+        if new_status == "completed":
+            self._check_progress(m)
+
+    # -------------------------------
+    # RULES
+    # -------------------------------
+    def _check_progress(self, m: Machine):
+        cfg = self.rules.get("progress", {})
+        if not cfg.get("enabled") or not m.target_qty or not m.work_order:
+            return
+        percent = (m.produced_qty / m.target_qty) * 100
+        if percent >= 100 or m.status == "completed":
+            self._set(m, "progress", LEVEL_COMPLETED, f"✅ Machine {m.name} COMPLETED")
+        elif percent >= cfg["critical"]:
+            self._set(m, "progress", LEVEL_CRITICAL, f"⚠ {m.name} CRITICAL {percent:.1f}%")
+        elif percent >= cfg["warning"]:
+            self._set(m, "progress", LEVEL_WARNING, f"⚠ {m.name} Warning {percent:.1f}%")
+        else:
+            self._set(m, "progress", LEVEL_OK)
+
+    def _check_rate(self, m: Machine, now: datetime, meters: int):
+        cfg = self.rules.get("rate_drop", {})
+        if not cfg.get("enabled") or not m.seconds_per_meter:
+            return
+        window = self._meters.setdefault(m.id, deque(maxlen=int(cfg["window"]) + 1))
+        window.append((now.timestamp(), meters))
+        if len(window) < window.maxlen:
+            return
+        elapsed = window[-1][0] - window[0][0]
+        produced = sum(q for _, q in list(window)[1:])
+        if elapsed <= 0 or not produced:
+            return
+        ratio = m.seconds_per_meter / (elapsed / produced)
+        if ratio < cfg["ratio"]:
+            self._set(m, "rate_drop", LEVEL_WARNING, f"🐢 {m.name} rate dropped to {ratio * 100:.0f}% of target")
+        else:
+            self._set(m, "rate_drop", LEVEL_OK)
+
+    def _stall_timeout(self, m: Machine) -> float:
+        cfg = self.rules.get("stall", {})
+        return max(cfg["min_seconds"], cfg["factor"] * (m.seconds_per_meter or 0))
+
+    def _arm_stall(self, m: Machine):
+        cfg = self.rules.get("stall", {})
+        if not cfg.get("enabled") or not m.work_order:
+            return
+        self._cancel_stall(m.id)
+        timeout = self._stall_timeout(m)
+        timer = clock.call_later(timeout, self._stall_fired, m.id, m.name, m.work_order, timeout)
+        if timer:
+            self._stall_timers[m.id] = timer
+
+    def _cancel_stall(self, machine_id: int):
+        timer = self._stall_timers.pop(machine_id, None)
+        if timer:
+            timer.cancel()
+
+    def _stall_fired(self, machine_id: int, name: str, work_order: str, timeout: float):
+        self._stall_timers.pop(machine_id, None)
+        self._store(machine_id, "stall", LEVEL_CRITICAL, work_order,
+                    f"🛑 {name} STALLED – running but no meter for {timeout:.0f}s")
+
+    # -------------------------------
+    # STATE + DELIVERY
+    # -------------------------------
+    def _set(self, m: Machine, rule: str, level: int, message: str = None):
+        self._store(m.id, rule, level, m.work_order, message)
+
+    def _store(self, machine_id: int, rule: str, level: int, work_order: str, message: str = None):
+        key = (machine_id, rule, work_order)
+        with self.lock:
+            if self._work_orders.get(machine_id, work_order) != work_order:
+                self._prune(machine_id, work_order)  # new job → fresh alert cycle
+            self._work_orders[machine_id] = work_order
+            last_level = self.state.get(key, LEVEL_OK)
+            if level == last_level:
+                return
+            self.state[key] = level
+            self._dirty[key] = (level, message)
+        if level > LEVEL_OK and level != last_level:
+            payload = {"alert": message, "machine_id": machine_id, "level": level, "rule": rule}
+            try:
+                asyncio.get_running_loop().create_task(self.publish(payload))
+            except RuntimeError:
+                logging.warning(f"Alert not delivered (no event loop): {message}")
+
+    def _prune(self, machine_id: int, work_order: Optional[str]):
+        """Drop the state of the machine's previous jobs (lock held); rows go at the next checkpoint."""
+        for key in [k for k in self.state if k[0] == machine_id and k[2] != work_order]:
+            del self.state[key]
+        for key in [k for k in self._dirty if k[0] == machine_id and k[2] != work_order]:
+            del self._dirty[key]
+        self._pruned[machine_id] = work_order
+
+    # -------------------------------
+    # CHECKPOINT (supervisor job, off the event loop)
+    # -------------------------------
+    def checkpoint(self):
+        """Persist dirty alert states in one transaction and delete rows of previous jobs."""
+        with self.lock:
+            dirty, self._dirty = self._dirty, {}
+            pruned, self._pruned = self._pruned, {}
+        if not dirty and not pruned:
+            return
+        db = SessionLocal()
+        try:
+            for machine_id, work_order in pruned.items():
+                stale = (AlertState.work_order.isnot(None) if work_order is None else
+                         or_(AlertState.work_order.is_(None), AlertState.work_order != work_order))
+                db.query(AlertState).filter(AlertState.machine_id == machine_id, stale).delete(
+                    synchronize_session=False)
+            existing = {}
+            if dirty:
+                existing = {(r.machine_id, r.rule, r.work_order): r for r in db.query(AlertState).filter(
+                    AlertState.machine_id.in_({mid for mid, _, _ in dirty}))}
+            now = clock.now()
+            for key, (level, message) in dirty.items():
+                row = existing.get(key)
+                if not row:
+                    row = AlertState(machine_id=key[0], rule=key[1], work_order=key[2])
+                    db.add(row)
+                row.level, row.message, row.updated_at = level, message, now
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            with self.lock:  # retry next time, unless newer changes replaced them meanwhile
+                for key, value in dirty.items():
+                    if self._work_orders.get(key[0]) == key[2]:
+                        self._dirty.setdefault(key, value)
+                for machine_id, work_order in pruned.items():
+                    self._pruned.setdefault(machine_id, work_order)
+            logging.error(f"Alert state checkpoint error: {e}")
+        finally:
+            db.close()
@@ -0,0 +1,149 @@
+# =====================================================
+# benchmarks/erp_replay.py – ERP Sync Throughput Replay
+# Replays generated or recorded work-order sets from the fake
+# ERPNext through get_work_orders / auto_assign_work_orders
+# against a scratch plant; measures sync cycle time and
+# assignments per second for each backlog size.
+#
+# Usage:
+#   python benchmarks/erp_replay.py --backlogs 10,100,1000,10000
+#   python benchmarks/erp_replay.py --orders recorded.json --latency-ms 80 --error-rate 0.1
+# =====================================================
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_erpnext import FakeERPNext, make_backlog, load_orders, LOCATIONS  # noqa: E402
+
+
+def configure_env(db_path: str, erp_url: str, timeout: int):
+    # erpnext_sync / database read these at import time
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{db_path}",
+        "ERP_URL": erp_url,
+        "ERP_API_KEY": "replay",
+        "ERP_API_SECRET": "replay",
+        "ERP_TIMEOUT": str(timeout),
+        "QUERY_LOG": "0",
+    })
+
+
+def reset_plant(machines_per_site: int):
+    from database import SessionLocal
+    from models import Machine, ERPNextMetadata
+
+    db = SessionLocal()
+    try:
+        db.query(ERPNextMetadata).delete()
+        db.query(Machine).delete()
+        for s, loc in enumerate(LOCATIONS):
+            for i in range(machines_per_site):
+                db.add(Machine(
+                    id=s * 100 + i + 1, location=loc, name=f"Machine {i + 1}", status="free",
+                    target_qty=0, produced_qty=0, pipe_size="20", seconds_per_meter=20,
+                    work_order="", erpnext_work_order_id="", is_locked=False
+                ))
+        db.commit()
+    finally:
+        db.close()
+
+
+def count_assigned():
+    from database import SessionLocal
+    from models import Machine
+
+    db = SessionLocal()
+    try:
+        return db.query(Machine).filter(Machine.erpnext_work_order_id != "").count()
+    finally:
+        db.close()
+
+
+def replay(orders, cycles: int, machines_per_site: int):
+    import erpnext_sync
+
+    reset_plant(machines_per_site)
+    fetch_times, cycle_times, assigned_per_cycle = [], [], []
+    for _ in range(cycles):
+        t0 = time.perf_counter()
+        fetched = erpnext_sync.get_work_orders()
+        fetch_times.append(time.perf_counter() - t0)
+
+        before = count_assigned()
+        t0 = time.perf_counter()
+        erpnext_sync.auto_assign_work_orders()
+        cycle_times.append(time.perf_counter() - t0)
+        assigned_per_cycle.append(count_assigned() - before)
+
+    total_cycle = sum(cycle_times)
+    return {
+        "backlog": len(orders),
+        "fetched": len(fetched),
+        "cycles": cycles,
+        "fetch_ms_p50": round(statistics.median(fetch_times) * 1000, 2),
+        "cycle_ms_p50": round(statistics.median(cycle_times) * 1000, 2),
+        "cycle_ms_max": round(max(cycle_times) * 1000, 2),
+        "first_cycle_ms": round(cycle_times[0] * 1000, 2),
+        "assigned": sum(assigned_per_cycle),
+        "assignments_per_s": round(sum(assigned_per_cycle) / total_cycle, 1) if total_cycle else 0,
+        "orders_per_s": round(len(orders) * cycles / total_cycle, 1) if total_cycle else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ERP sync throughput replay")
+    parser.add_argument("--backlogs", default="10,100,1000,10000", help="comma separated backlog sizes")
+    parser.add_argument("--orders", default=None, help="recorded work-order JSON (replaces generated backlogs)")
+    parser.add_argument("--cycles", type=int, default=3, help="sync cycles per backlog (1st assigns, rest steady state)")
+    parser.add_argument("--machines", type=int, default=12, help="free machines per location")
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--timeout-rate", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--erp-timeout", type=int, default=5, help="client ERP_TIMEOUT seconds")
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+
+    fake = FakeERPNext().start()
+    fake.configure(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, timeout_rate=args.timeout_rate,
+                   error_rate=args.error_rate, hang_s=args.erp_timeout + 1)
+    db_path = os.path.join(tempfile.mkdtemp(prefix="taco_erp_"), "replay.db")
+    configure_env(db_path, fake.url, args.erp_timeout)
+
+    from database import init_db
+    init_db()
+
+    sets = [("recorded", load_orders(args.orders))] if args.orders else [
+        (f"generated-{n}", make_backlog(n)) for n in (int(x) for x in args.backlogs.split(","))
+    ]
+    results = []
+    print(f"{'set':<18}{'backlog':>8}{'fetch ms':>10}{'cycle ms':>10}{'1st ms':>10}{'assigned':>10}{'assign/s':>10}{'orders/s':>10}")
+    try:
+        for name, orders in sets:
+            fake.load(orders)
+            r = {"set": name, **replay(orders, args.cycles, args.machines)}
+            results.append(r)
+            print(f"{name:<18}{r['backlog']:>8}{r['fetch_ms_p50']:>10}{r['cycle_ms_p50']:>10}{r['first_cycle_ms']:>10}"
+                  f"{r['assigned']:>10}{r['assignments_per_s']:>10}{r['orders_per_s']:>10}")
+    finally:
+        fake.stop()
+
+    out = args.out or os.path.join(RESULTS_DIR, f"erp_replay_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({"config": vars(args), "fake_stats": fake.stats, "results": results}, f, indent=2)
+    print(f"Saved → {out}")
+
+
+if __name__ == "__main__":
+    main()
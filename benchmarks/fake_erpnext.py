@@ -0,0 +1,216 @@
+# =====================================================
+# benchmarks/fake_erpnext.py – Local ERPNext Stand-In
+# Implements the /api/resource/Work Order GET/PUT surface used
+# by erpnext_sync.py, with injectable latency, timeouts, 5xx
+# errors and generated or recorded work-order backlogs.
+#
+# Standalone:
+#   python benchmarks/fake_erpnext.py --port 8090 --backlog 1000 --latency-ms 50 --error-rate 0.05
+#   ERP_URL=http://127.0.0.1:8090 ERP_API_KEY=x ERP_API_SECRET=y uvicorn main:app
+# Runtime control:
+#   POST /__fake/config {"latency_ms": 200, "timeout_rate": 0.1}
+#   GET  /__fake/stats
+# =====================================================
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, unquote
+
+RESOURCE = "/api/resource/Work Order"
+PIPE_SIZES = ["20", "25", "32", "63", "110"]
+LOCATIONS = ["Modan", "Baldeya", "Al-Khraj"]
+
+
+def make_backlog(n: int, locations=LOCATIONS, seed: int = 1, prefix: str = "MFG-WO-FAKE"):
+    rnd = random.Random(seed)
+    return [{
+        "name": f"{prefix}-{i:05d}",
+        "qty": rnd.choice([50, 100, 200, 500]),
+        "produced_qty": 0,
+        "status": "Not Started",
+        "custom_machine_id": None,
+        "custom_pipe_size": rnd.choice(PIPE_SIZES),
+        "custom_location": rnd.choice(locations),
+    } for i in range(n)]
+
+
+def load_orders(path: str):
+    """Recorded sets: either an ERPNext response {"data": [...]} or a plain list."""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return data.get("data", []) if isinstance(data, dict) else data
+
+
+class FakeERPNext:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.lock = threading.Lock()
+        self.orders = {}
+        self.config = {
+            "latency_ms": 0.0,       # added to every request
+            "jitter_ms": 0.0,        # uniform ± jitter
+            "timeout_rate": 0.0,     # fraction of requests that hang for hang_s
+            "hang_s": 30.0,
+            "error_rate": 0.0,       # fraction of requests answered with 5xx
+            "page_length": 0,        # default page size when the client sends none (real ERPNext: 20)
+        }
+        self.stats = {"get": 0, "put": 0, "errors_injected": 0, "timeouts_injected": 0}
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def load(self, orders):
+        with self.lock:
+            self.orders = {o["name"]: dict(o) for o in orders}
+
+    def configure(self, **cfg):
+        with self.lock:
+            self.config.update({k: v for k, v in cfg.items() if k in self.config})
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    # -------------------------------
+    # FAULT INJECTION
+    # -------------------------------
+    def _inject(self):
+        """→ HTTP status to fail with, or None to serve normally."""
+        cfg = dict(self.config)
+        delay = cfg["latency_ms"] + random.uniform(-cfg["jitter_ms"], cfg["jitter_ms"])
+        if delay > 0:
+            time.sleep(delay / 1000)
+        roll = random.random()
+        if roll < cfg["timeout_rate"]:
+            self.stats["timeouts_injected"] += 1
+            time.sleep(cfg["hang_s"])
+            return 504
+        if roll < cfg["timeout_rate"] + cfg["error_rate"]:
+            self.stats["errors_injected"] += 1
+            return random.choice([500, 502, 503])
+        return None
+
+    # -------------------------------
+    # RESOURCE LOGIC
+    # -------------------------------
+    def list_orders(self, query):
+        fields = json.loads(query.get("fields", ['["name"]'])[0])
+        filters = json.loads(query.get("filters", ["[]"])[0])
+        start = int(query.get("limit_start", [0])[0])
+        length = int(query.get("limit_page_length", [self.config["page_length"]])[0])
+        with self.lock:
+            rows = list(self.orders.values())
+        for field, op, value in filters:
+            if op == "in":
+                rows = [r for r in rows if r.get(field) in value]
+            elif op in ("=", "=="):
+                rows = [r for r in rows if r.get(field) == value]
+            elif op == "!=":
+                rows = [r for r in rows if r.get(field) != value]
+        rows = rows[start:start + length] if length else rows[start:]
+        return [{f: r.get(f) for f in fields} for r in rows]
+
+    def update_order(self, name, body):
+        with self.lock:
+            wo = self.orders.get(name)
+            if wo is None:
+                return None
+            wo.update(body)
+            return dict(wo)
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _body(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                path = unquote(url.path)
+                if path == "/__fake/stats":
+                    return self._send(200, {**fake.stats, "orders": len(fake.orders), "config": fake.config})
+                if path != RESOURCE:
+                    return self._send(404, {"exc_type": "DoesNotExistError"})
+                fake.stats["get"] += 1
+                failure = fake._inject()
+                if failure:
+                    return self._send(failure, {"exc_type": "InjectedFailure"})
+                self._send(200, {"data": fake.list_orders(parse_qs(url.query))})
+
+            def do_PUT(self):
+                path = unquote(urlparse(self.path).path)
+                if not path.startswith(RESOURCE + "/"):
+                    return self._send(404, {"exc_type": "DoesNotExistError"})
+                fake.stats["put"] += 1
+                body = self._body()
+                failure = fake._inject()
+                if failure:
+                    return self._send(failure, {"exc_type": "InjectedFailure"})
+                wo = fake.update_order(path[len(RESOURCE) + 1:], body)
+                if wo is None:
+                    return self._send(404, {"exc_type": "DoesNotExistError"})
+                self._send(200, {"data": wo})
+
+            def do_POST(self):
+                if urlparse(self.path).path == "/__fake/config":
+                    fake.configure(**self._body())
+                    return self._send(200, fake.config)
+                self._send(404, {"exc_type": "DoesNotExistError"})
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local ERPNext stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--backlog", type=int, default=100, help="generated Not Started work orders")
+    parser.add_argument("--orders", default=None, help="recorded work orders JSON (overrides --backlog)")
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--timeout-rate", type=float, default=0)
+    parser.add_argument("--hang-s", type=float, default=30)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--page-length", type=int, default=0)
+    args = parser.parse_args()
+
+    fake = FakeERPNext(args.host, args.port)
+    fake.load(load_orders(args.orders) if args.orders else make_backlog(args.backlog))
+    fake.configure(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, timeout_rate=args.timeout_rate,
+                   hang_s=args.hang_s, error_rate=args.error_rate, page_length=args.page_length)
+    print(f"Fake ERPNext serving {len(fake.orders)} work orders at {fake.url}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+# =====================================================
+# benchmarks/load_test.py – Live Dashboard Load Test
+# Seeds a scratch plant, starts the real app under uvicorn,
+# attaches N WebSocket clients + HTTP pollers, drives machine
+# actions and reports tick lag, broadcast latency, dashboard
+# p50/p99 and DB write throughput. Results saved as JSON.
+#
+# Usage:
+#   python benchmarks/load_test.py --sites 3 --machines 12 --running 0.8 \
+#       --clients 50 --pollers 4 --duration 60
+#   python benchmarks/load_test.py ... --compare benchmarks/results/<previous>.json
+# Requires: uvicorn, websockets, httpx
+# =====================================================
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+sys.path.insert(0, ROOT)
+
+# Lower is better for all compared metrics except the ones listed here
+HIGHER_IS_BETTER = {"db.log_rows_per_s", "db.commits_per_s", "dashboard_http.rps", "broadcast.frames_per_client_s"}
+COMPARE_KEYS = [
+    "tick.lag_p99_ms", "tick.duration_p99_ms", "broadcast.latency_p50_ms", "broadcast.latency_p99_ms",
+    "dashboard_http.p50_ms", "dashboard_http.p99_ms", "dashboard_http.rps",
+    "db.log_rows_per_s", "db.commits_per_s", "dashboard_build.p99_ms",
+]
+
+# =====================================================
+# PLANT SEEDING (scratch database)
+# =====================================================
+def seed_plant(db_path: str, sites: int, machines: int, running: float, seconds_per_meter: float, seed: int):
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["QUERY_LOG"] = "0"
+    from database import SessionLocal, init_db
+    from models import Machine
+
+    init_db()
+    rnd = random.Random(seed)
+    db = SessionLocal()
+    try:
+        for s in range(sites):
+            for i in range(machines):
+                is_running = rnd.random() < running
+                db.add(Machine(
+                    id=s * 1000 + i + 1,
+                    location=f"Site-{s + 1}",
+                    name=f"Machine {i + 1}",
+                    status="running" if is_running else rnd.choice(["free", "paused", "stopped"]),
+                    work_order=f"LOAD-WO-{s + 1}-{i + 1}",
+                    erpnext_work_order_id=f"LOAD-WO-{s + 1}-{i + 1}",
+                    pipe_size=rnd.choice(["20", "32", "63", "110"]),
+                    target_qty=1_000_000,
+                    produced_qty=0,
+                    seconds_per_meter=seconds_per_meter,
+                    last_tick_time=datetime.now(timezone.utc)
+                ))
+        db.commit()
+    finally:
+        db.close()
+    return [(f"Site-{s + 1}", s * 1000 + i + 1) for s in range(sites) for i in range(machines)]
+
+
+def start_server(db_path: str, port: int, frame_ms: int):
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": f"sqlite:///{db_path}",
+        "ERP_URL": "",                # no ERPNext traffic during load tests
+        "BROADCAST_INTERVAL_MS": str(frame_ms),
+        "QUERY_LOG": "0",
+    })
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env
+    )
+
+# =====================================================
+# PROMETHEUS SCRAPE HELPERS (/metrics from metrics.py)
+# =====================================================
+_LINE = re.compile(r'^(\w+?)(_bucket|_sum|_count)?(\{[^}]*\})? (\S+)$')
+
+
+def parse_metrics(text: str):
+    """→ {name: {"buckets": {le: cumulative}, "sum": x, "count": n, "value": v}} (labels summed)"""
+    out = {}
+    for line in text.splitlines():
+        if line.startswith("#"):
+            continue
+        m = _LINE.match(line)
+        if not m:
+            continue
+        name, suffix, labels, value = m.groups()
+        entry = out.setdefault(name, {"buckets": {}, "sum": 0.0, "count": 0.0, "value": 0.0})
+        value = float(value)
+        if suffix == "_bucket":
+            le = re.search(r'le="([^"]+)"', labels).group(1)
+            le = float("inf") if le == "+Inf" else float(le)
+            entry["buckets"][le] = entry["buckets"].get(le, 0) + value
+        elif suffix == "_sum":
+            entry["sum"] += value
+        elif suffix == "_count":
+            entry["count"] += value
+        else:
+            entry["value"] += value
+    return out
+
+
+def hist_delta(after, before, name):
+    a, b = after.get(name), before.get(name, {"buckets": {}, "sum": 0, "count": 0})
+    if not a:
+        return None
+    return {
+        "buckets": {le: n - b["buckets"].get(le, 0) for le, n in a["buckets"].items()},
+        "sum": a["sum"] - b["sum"],
+        "count": a["count"] - b["count"]
+    }
+
+
+def hist_quantile(h, q):
+    """Prometheus-style histogram_quantile with linear interpolation (ms)."""
+    if not h or not h["count"]:
+        return None
+    rank, prev_le, prev_n = q * h["count"], 0.0, 0
+    for le in sorted(h["buckets"]):
+        n = h["buckets"][le]
+        if n >= rank:
+            if le == float("inf"):
+                return round(prev_le * 1000, 2)
+            frac = (rank - prev_n) / (n - prev_n) if n > prev_n else 0
+            return round((prev_le + (le - prev_le) * frac) * 1000, 2)
+        prev_le, prev_n = le, n
+    return None
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * q))], 2)
+
+# =====================================================
+# LOAD GENERATORS
+# =====================================================
+async def ws_client(url, stop, latencies, counts, idx):
+    import websockets
+    try:
+        async with websockets.connect(url, max_size=None) as ws:
+            while not stop.is_set():
+                try:
+                    msg = await asyncio.wait_for(ws.recv(), 1)
+                except asyncio.TimeoutError:
+                    continue
+                received = time.time()
+                data = json.loads(msg)
+                if "sent_at" in data:
+                    latencies.append((received - data["sent_at"]) * 1000)
+                counts[idx] = counts.get(idx, 0) + 1
+    except Exception as e:
+        counts.setdefault("errors", []).append(str(e))
+
+
+async def http_poller(client, base, stop, latencies, errors):
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        try:
+            r = await client.get(f"{base}/api/dashboard")
+            r.raise_for_status()
+            latencies.append((time.perf_counter() - t0) * 1000)
+        except Exception:
+            errors.append(1)
+
+
+async def action_driver(client, base, stop, machines, rate, errors, done):
+    interval = 1 / rate if rate > 0 else None
+    while interval and not stop.is_set():
+        location, mid = random.choice(machines)
+        action = random.choices(["start", "pause", "stop"], weights=[6, 2, 1])[0]
+        try:
+            r = await client.post(f"{base}/api/machine/{action}", json={"location": location, "machine_id": mid})
+            r.raise_for_status()
+            done.append(action)
+        except Exception:
+            errors.append(1)
+        await asyncio.sleep(interval)
+
+
+async def wait_ready(client, base, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get(f"{base}/metrics")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.3)
+    raise RuntimeError("server did not become ready")
+
+
+def count_logs(db_path):
+    import sqlite3
+    con = sqlite3.connect(db_path)
+    try:
+        return con.execute("SELECT COUNT(*) FROM production_logs").fetchone()[0]
+    finally:
+        con.close()
+
+# =====================================================
+# RUN
+# =====================================================
+async def run(args, db_path, machines):
+    import httpx
+
+    base = f"http://127.0.0.1:{args.port}"
+    ws_url = f"ws://127.0.0.1:{args.port}/ws/dashboard"
+    async with httpx.AsyncClient(timeout=30) as client:
+        await wait_ready(client, base)
+        stop = asyncio.Event()
+        ws_lat, ws_counts, http_lat, errors, actions = [], {}, [], [], []
+
+        clients = [asyncio.create_task(ws_client(ws_url, stop, ws_lat, ws_counts, i)) for i in range(args.clients)]
+        await asyncio.sleep(args.warmup)
+        before = parse_metrics((await client.get(f"{base}/metrics")).text)
+        logs_before = count_logs(db_path)
+        ws_lat.clear()
+        ws_counts.clear()
+        http_lat.clear()
+
+        started = time.monotonic()
+        workers = [asyncio.create_task(http_poller(client, base, stop, http_lat, errors)) for _ in range(args.pollers)]
+        workers.append(asyncio.create_task(action_driver(client, base, stop, machines, args.action_rate, errors, actions)))
+        await asyncio.sleep(args.duration)
+        elapsed = time.monotonic() - started
+
+        after = parse_metrics((await client.get(f"{base}/metrics")).text)
+        logs_after = count_logs(db_path)
+        stop.set()
+        await asyncio.gather(*workers, *clients, return_exceptions=True)
+
+    lag = hist_delta(after, before, "meter_tick_lag_seconds")
+    tick = hist_delta(after, before, "meter_tick_duration_seconds")
+    build = hist_delta(after, before, "dashboard_build_seconds")
+    commits = hist_delta(after, before, "db_commit_duration_seconds")
+    frames = sum(v for k, v in ws_counts.items() if k != "errors")
+
+    return {
+        "tick": {
+            "lag_p50_ms": hist_quantile(lag, 0.5), "lag_p99_ms": hist_quantile(lag, 0.99),
+            "duration_p50_ms": hist_quantile(tick, 0.5), "duration_p99_ms": hist_quantile(tick, 0.99),
+            "ticks": lag["count"] if lag else 0
+        },
+        "broadcast": {
+            "latency_p50_ms": percentile(ws_lat, 0.5), "latency_p95_ms": percentile(ws_lat, 0.95),
+            "latency_p99_ms": percentile(ws_lat, 0.99),
+            "frames_per_client_s": round(frames / max(args.clients, 1) / elapsed, 2),
+            "ws_errors": len(ws_counts.get("errors", []))
+        },
+        "dashboard_http": {
+            "p50_ms": percentile(http_lat, 0.5), "p99_ms": percentile(http_lat, 0.99),
+            "rps": round(len(http_lat) / elapsed, 1), "errors": len(errors)
+        },
+        "dashboard_build": {"p50_ms": hist_quantile(build, 0.5), "p99_ms": hist_quantile(build, 0.99)},
+        "db": {
+            "log_rows_per_s": round((logs_after - logs_before) / elapsed, 1),
+            "commits_per_s": round((commits["count"] if commits else 0) / elapsed, 1),
+            "commit_p99_ms": hist_quantile(commits, 0.99)
+        },
+        "actions": len(actions),
+        "elapsed_s": round(elapsed, 1)
+    }
+
+# =====================================================
+# COMPARE
+# =====================================================
+def dig(d, path):
+    for part in path.split("."):
+        d = d.get(part) if isinstance(d, dict) else None
+    return d
+
+
+def compare(current, previous, threshold):
+    regressions = []
+    print(f"\n{'metric':<34}{'previous':>12}{'current':>12}{'change':>10}")
+    for key in COMPARE_KEYS:
+        old, new = dig(previous["results"], key), dig(current["results"], key)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old if old else 0.0
+        worse = change < -threshold if key in HIGHER_IS_BETTER else change > threshold
+        flag = "  ⚠ REGRESSION" if worse else ""
+        print(f"{key:<34}{old:>12}{new:>12}{change:>+9.0%}{flag}")
+        if worse:
+            regressions.append(key)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Live dashboard load test")
+    parser.add_argument("--sites", type=int, default=3)
+    parser.add_argument("--machines", type=int, default=12, help="machines per site")
+    parser.add_argument("--running", type=float, default=0.8, help="fraction of machines running")
+    parser.add_argument("--seconds-per-meter", type=float, default=1.0)
+    parser.add_argument("--clients", type=int, default=20, help="WebSocket clients")
+    parser.add_argument("--pollers", type=int, default=2, help="concurrent /api/dashboard pollers")
+    parser.add_argument("--action-rate", type=float, default=2.0, help="machine actions per second")
+    parser.add_argument("--frame-ms", type=int, default=250, help="BROADCAST_INTERVAL_MS for the server")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--label", default="")
+    parser.add_argument("--out", default=None, help="result JSON path (default benchmarks/results/)")
+    parser.add_argument("--compare", default=None, help="previous result JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="regression threshold (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="taco_load_")
+    db_path = os.path.join(workdir, "load.db")
+    machines = seed_plant(db_path, args.sites, args.machines, args.running, args.seconds_per_meter, args.seed)
+    random.seed(args.seed)
+    print(f"Seeded {len(machines)} machines ({args.running:.0%} running) → {db_path}")
+
+    server = start_server(db_path, args.port, args.frame_ms)
+    try:
+        results = asyncio.run(run(args, db_path, machines))
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+    report = {
+        "label": args.label,
+        "at": datetime.now(timezone.utc).isoformat(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        "results": results
+    }
+    print(json.dumps(results, indent=2))
+
+    out = args.out or os.path.join(RESULTS_DIR, f"load_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved → {out}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+        regressions = compare(report, previous, args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
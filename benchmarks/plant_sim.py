@@ -0,0 +1,378 @@
+# =====================================================
+# benchmarks/plant_sim.py – Accelerated Plant Simulator
+# Replays a shift (or several) on virtual time against a
+# scratch database, driving the real code paths step by step:
+# main.meter_tick, scheduler.assign_scheduled_jobs / record_history,
+# the alert engine (stall timers fire on the SimClock), the OEE
+# engine and the dashboard publisher / change feed. The same seed
+# and backlog give the same result on every run.
+#
+# Usage:
+#   python benchmarks/plant_sim.py --hours 24 --jobs 300 --strategy priority
+#   python benchmarks/plant_sim.py --backlog planned.json --plant-url sqlite:///production.db --speed 3600
+# =====================================================
+import os
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import statistics
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_erpnext import PIPE_SIZES  # noqa: E402
+
+# Monday 06:00 plant time (UTC+3) = start of shift A
+DEFAULT_START = "2026-01-05T03:00:00+00:00"
+
+
+def configure_env(db_path: str):
+    # database / erpnext_sync read these at import time; no ERP → sync loops stay idle
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{db_path}",
+        "ERP_URL": "",
+        "QUERY_LOG": "0",
+    })
+
+
+def _epoch(dt: datetime) -> float:
+    return (dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)).timestamp()
+
+
+def make_jobs(n: int, locations, seed: int):
+    rnd = random.Random(seed)
+    return [{
+        "work_order": f"SIM-WO-{i:05d}",
+        "location": rnd.choice(locations),
+        "pipe_size": rnd.choice(PIPE_SIZES),
+        "qty": rnd.choice([50, 100, 200, 500]),
+        "priority": rnd.randint(0, 3),
+    } for i in range(n)]
+
+
+def load_jobs(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return data.get("jobs", []) if isinstance(data, dict) else data
+
+
+def _percentiles(samples):
+    if not samples:
+        return {"n": 0}
+    ordered = sorted(samples)
+    return {
+        "n": len(samples),
+        "p50_ms": round(statistics.median(ordered) * 1000, 3),
+        "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+        "total_s": round(sum(ordered), 3),
+    }
+
+# =====================================================
+# SIMULATION
+# =====================================================
+class PlantSimulation:
+    """
+    Steps fall on whole virtual seconds (the real meter tick rate). Each
+    step fires due timers, then runs whichever periodic jobs fall on it,
+    in the production order: assignment → operators → meter tick →
+    history → dashboard frame. Seconds where nothing is due (no meter,
+    timer or interval) are skipped; --every-second steps through them
+    and gives the same result, slower.
+    """
+
+    def __init__(self, args):
+        import clock
+        import main
+        import scheduler
+        from models import ScheduledJob
+
+        self.args = args
+        self.main, self.scheduler = main, scheduler
+        self.start = datetime.fromisoformat(args.start).timestamp()
+        self.end = self.start + args.hours * 3600
+        self.clock = clock.SimClock(self.start)
+        clock.install(self.clock)
+        self.order = {
+            "fifo": (ScheduledJob.id,),
+            "priority": (ScheduledJob.priority.desc(), ScheduledJob.id),
+            "shortest": (ScheduledJob.qty, ScheduledJob.id),
+            "longest": (ScheduledJob.qty.desc(), ScheduledJob.id),
+        }[args.strategy]
+        self.timings = defaultdict(list)
+        self.alerts = Counter()
+        self.assigned_at = {}      # machine id → virtual time its current job was assigned
+        self.completions = []      # (virtual ts, work order)
+        self.erp_updates = 0
+
+    # -------------------------------
+    # SETUP
+    # -------------------------------
+    def load_plant(self):
+        from database import SessionLocal
+        from models import Machine
+
+        if not self.args.plant_url:
+            self.main.seed_machines()
+            return
+        from sqlalchemy import create_engine, select
+        source = create_engine(self.args.plant_url)
+        with source.connect() as conn:
+            rows = conn.execute(select(Machine.id, Machine.location, Machine.name,
+                                       Machine.pipe_size, Machine.seconds_per_meter)).all()
+        source.dispose()
+        db = SessionLocal()
+        try:
+            for mid, location, name, pipe_size, spm in rows:
+                db.add(Machine(id=mid, location=location, name=name, status="free", target_qty=0,
+                               produced_qty=0, pipe_size=pipe_size, seconds_per_meter=spm or 20,
+                               work_order="", erpnext_work_order_id="", is_locked=False))
+            db.commit()
+        finally:
+            db.close()
+
+    def load_backlog(self):
+        from database import SessionLocal
+        from models import Machine, ScheduledJob
+
+        db = SessionLocal()
+        try:
+            locations = sorted({loc for (loc,) in db.query(Machine.location).distinct()})
+            jobs = load_jobs(self.args.backlog) if self.args.backlog else make_jobs(self.args.jobs, locations,
+                                                                                      self.args.seed)
+            for j in jobs:
+                db.add(ScheduledJob(work_order=j["work_order"], location=j["location"],
+                                    pipe_size=j.get("pipe_size"), qty=j.get("qty", 100),
+                                    produced_qty=j.get("produced_qty", 0), priority=j.get("priority", 0),
+                                    timestamp=self.clock.now()))
+            db.commit()
+            return len(jobs)
+        finally:
+            db.close()
+
+    async def _collect_alert(self, payload):
+        self.alerts[payload.get("rule")] += 1
+
+    def _collect_erp(self, work_order, status):
+        self.erp_updates += 1  # counted, never sent: the simulation has no ERPNext
+
+    # -------------------------------
+    # OPERATORS
+    # -------------------------------
+    async def operators(self, db, t: float):
+        """Start a machine once its newly assigned job has been set up (changeover)."""
+        from models import Machine
+
+        for m in db.query(Machine).filter(Machine.status == "paused").all():
+            if not self.scheduler._has_unfinished_job(m):
+                continue
+            since = self.assigned_at.setdefault(m.id, t)
+            if t - since >= self.args.changeover:
+                self.assigned_at.pop(m.id, None)
+                await self.main.update_machine_status(db, m, "running")
+
+    # -------------------------------
+    # RUN
+    # -------------------------------
+    def _timed(self, name: str, fn, *args):
+        t0 = time.perf_counter()
+        result = fn(*args)
+        self.timings[name].append(time.perf_counter() - t0)
+        return result
+
+    async def _timed_async(self, name: str, coro):
+        t0 = time.perf_counter()
+        result = await coro
+        self.timings[name].append(time.perf_counter() - t0)
+        return result
+
+    async def run(self):
+        from database import SessionLocal
+        from transitions import seed_open_intervals
+
+        main, scheduler, args = self.main, self.scheduler, self.args
+        self.load_plant()
+        jobs = self.load_backlog()
+        main.alert_engine.publish = self._collect_alert
+        main.push_work_order_status = self._collect_erp
+        main.alert_engine.load()
+        main.oee_engine.load()
+        seed_open_intervals()
+        main.publisher.feed.listeners += 1  # one change-feed client → frames are built
+
+        wall0 = time.perf_counter()
+        steps, marks = 0, main.publisher.marks
+        t = self.start
+        while t < self.end:
+            self.clock.advance(t)
+            offset = int(t - self.start)
+            db = SessionLocal()
+            try:
+                if offset % args.assign_interval == 0:
+                    self._timed("assign", scheduler.assign_scheduled_jobs, db, self.order)
+                    await self._timed_async("operators", self.operators(db, t))
+                if await self._timed_async("meter_tick", main.meter_tick(db)):
+                    self.completions.extend(self._completed_since(db, t))
+                if offset % args.history_interval == 0:
+                    self._timed("history", scheduler.record_history, db)
+            finally:
+                db.close()
+            if main.publisher.marks != marks:
+                marks = main.publisher.marks
+                await self._timed_async("dashboard_frame", main.publisher.flush())
+            await asyncio.sleep(0)  # let alert deliveries run
+            steps += 1
+            t = t + 1 if args.every_second else self._next_step(t)
+            if args.speed:
+                ahead = (t - self.start) / args.speed - (time.perf_counter() - wall0)
+                if ahead > 0:
+                    await asyncio.sleep(ahead)
+            if args.until_done and offset % args.assign_interval == 0 and self._done():
+                break
+        self.clock.advance(t)
+        main.oee_engine.checkpoint()
+        return self.report(jobs, steps, t, time.perf_counter() - wall0)
+
+    def _next_step(self, t: float) -> float:
+        """Earliest second after t at which any code path has work."""
+        from database import SessionLocal
+        from models import Machine
+
+        offset = t - self.start
+        due = [
+            self.start + (offset // self.args.assign_interval + 1) * self.args.assign_interval,
+            self.start + (offset // self.args.history_interval + 1) * self.args.history_interval,
+        ]
+        timer = self.clock.next_timer()
+        if timer is not None:
+            due.append(self.start + math.ceil(timer - self.start))
+        db = SessionLocal()
+        try:
+            for last_tick, spm, produced, target in db.query(
+                Machine.last_tick_time, Machine.seconds_per_meter, Machine.produced_qty, Machine.target_qty
+            ).filter(Machine.status == "running"):
+                if not last_tick or not spm:
+                    return t + 1
+                if produced < target:
+                    due.append(self.start + math.ceil(_epoch(last_tick) + spm - self.start))
+        finally:
+            db.close()
+        return max(t + 1, min(due))
+
+    def _completed_since(self, db, t: float):
+        from models import MachineTransition
+
+        at = datetime.fromtimestamp(t, timezone.utc)
+        return [(t, wo) for (wo,) in db.query(MachineTransition.work_order).filter(
+            MachineTransition.to_status == "completed", MachineTransition.at >= at)]
+
+    def _done(self) -> bool:
+        from database import SessionLocal
+        from models import Machine, ScheduledJob
+
+        db = SessionLocal()
+        try:
+            waiting = db.query(ScheduledJob).filter(ScheduledJob.assigned_machine_id == None).count()
+            busy = db.query(Machine).filter(Machine.status.in_(("running", "paused"))).all()
+            return not waiting and not any(self.scheduler._has_unfinished_job(m) for m in busy)
+        finally:
+            db.close()
+
+    # -------------------------------
+    # REPORT
+    # -------------------------------
+    def report(self, jobs: int, steps: int, t_end: float, wall_s: float):
+        from database import SessionLocal
+        from models import ProductionLog, ProductionHistory, MachineTransition, ScheduledJob
+        from sqlalchemy import func
+        from transitions import time_in_state
+
+        start_dt = datetime.fromtimestamp(self.start, timezone.utc)
+        end_dt = datetime.fromtimestamp(t_end, timezone.utc)
+        db = SessionLocal()
+        try:
+            meters = db.query(func.coalesce(func.sum(ProductionLog.produced_qty), 0)).scalar()
+            rows = {
+                "production_logs": db.query(ProductionLog).count(),
+                "production_history": db.query(ProductionHistory).count(),
+                "machine_transitions": db.query(MachineTransition).count(),
+            }
+            assigned = db.query(ScheduledJob).filter(ScheduledJob.assigned_machine_id != None).count()
+        finally:
+            db.close()
+
+        by_location = time_in_state(start_dt, end_dt, ("location",))["rows"]
+        oee = self.main.oee_engine.query(start_dt, end_dt, "location")["rows"]
+        virtual_s = t_end - self.start
+        completed = len(self.completions)
+        return {
+            "start": start_dt.isoformat(),
+            "end": end_dt.isoformat(),
+            "virtual_hours": round(virtual_s / 3600, 2),
+            "wall_s": round(wall_s, 2),
+            "speedup": round(virtual_s / wall_s, 1) if wall_s else None,
+            "steps": steps,
+            "jobs": jobs,
+            "assigned": assigned,
+            "completed": completed,
+            "makespan_h": round((self.completions[-1][0] - self.start) / 3600, 2) if completed else None,
+            "meters": int(meters),
+            "alerts": dict(self.alerts),
+            "erp_updates": self.erp_updates,
+            "utilization": [{
+                "location": r["location"],
+                "running_pct": round(100 * r["running_s"] / r["total_s"], 1) if r["total_s"] else 0.0,
+                "downtime_s": r["downtime_s"],
+            } for r in by_location],
+            "oee": [{"location": r["key"], "oee": r["oee"], "throughput_mph": r["throughput_mph"]} for r in oee],
+            "rows": rows,
+            "code_paths": {name: _percentiles(samples) for name, samples in sorted(self.timings.items())},
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Accelerated deterministic plant simulation")
+    parser.add_argument("--hours", type=float, default=24, help="virtual hours to simulate")
+    parser.add_argument("--start", default=DEFAULT_START, help="virtual start (ISO, with offset)")
+    parser.add_argument("--jobs", type=int, default=200, help="generated backlog size (ignored with --backlog)")
+    parser.add_argument("--backlog", default=None, help="planned jobs JSON: [{work_order, location, qty, ...}]")
+    parser.add_argument("--plant-url", default=None, help="copy machines from this database (default: seed plant)")
+    parser.add_argument("--strategy", choices=("fifo", "priority", "shortest", "longest"), default="fifo",
+                        help="order in which waiting jobs are assigned")
+    parser.add_argument("--changeover", type=float, default=600, help="seconds from assignment to start")
+    parser.add_argument("--assign-interval", type=int, default=10, help="seconds between assignment passes")
+    parser.add_argument("--history-interval", type=int, default=30, help="seconds between history snapshots")
+    parser.add_argument("--speed", type=float, default=0, help="virtual seconds per wall second (0 = flat out)")
+    parser.add_argument("--every-second", action="store_true", help="step every virtual second (no skipping)")
+    parser.add_argument("--until-done", action="store_true", help="stop once the backlog is finished")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--db", default=None, help="scratch database path (default: new temp file)")
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="taco_sim_"), "sim.db")
+    if os.path.exists(db_path):
+        sys.exit(f"{db_path} exists; the simulator only writes to a fresh scratch database")
+    configure_env(db_path)
+
+    result = asyncio.run(PlantSimulation(args).run())
+    print(json.dumps(result, indent=2))
+
+    out = args.out or os.path.join(RESULTS_DIR, f"plant_sim_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({"config": vars(args), "scratch_db": db_path, "result": result}, f, indent=2)
+    print(f"Saved → {out}")
+
+
+if __name__ == "__main__":
+    main()
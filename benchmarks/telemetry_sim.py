@@ -0,0 +1,112 @@
+# =====================================================
+# benchmarks/telemetry_sim.py – Counter Telemetry Simulator
+# Simulates PLC/encoder counters for many machines and
+# load-tests POST /api/telemetry/ingest
+# Usage:
+#   python benchmarks/telemetry_sim.py --url http://127.0.0.1:8000 \
+#       --rate 5000 --batch 200 --workers 4 --duration 30 --dup-rate 0.05 --shuffle
+# =====================================================
+import time
+import random
+import argparse
+import threading
+import statistics
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+class Counter:
+    """Cumulative length counter of one extruder (meters)."""
+
+    def __init__(self, machine_id: int, speed: float):
+        self.machine_id = machine_id
+        self.speed = speed  # meters per second
+        self.seq = 0
+        self.length = random.uniform(0, 1000)  # counters don't start at zero
+        self.last = time.monotonic()
+
+    def read(self) -> dict:
+        now = time.monotonic()
+        self.length += (now - self.last) * self.speed
+        self.last = now
+        self.seq += 1
+        return {
+            "machine_id": self.machine_id,
+            "seq": self.seq,
+            "length": round(self.length, 3),
+            "ts": datetime.now(timezone.utc).isoformat()
+        }
+
+
+def machine_ids(url: str):
+    data = requests.get(f"{url}/api/dashboard", timeout=10).json()
+    return [m["id"] for loc in data["locations"] for m in loc["machines"]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Telemetry ingestion load test")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--rate", type=int, default=2000, help="target readings per second (all machines)")
+    parser.add_argument("--batch", type=int, default=200, help="readings per request")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent sender threads")
+    parser.add_argument("--duration", type=float, default=20, help="seconds")
+    parser.add_argument("--speed", type=float, default=0.05, help="meters per second per machine")
+    parser.add_argument("--dup-rate", type=float, default=0.0, help="fraction of readings re-sent")
+    parser.add_argument("--shuffle", action="store_true", help="send readings out of order inside a batch")
+    args = parser.parse_args()
+
+    ids = machine_ids(args.url)
+    counters = [Counter(mid, args.speed) for mid in ids]
+    print(f"Simulating {len(counters)} counters → {args.rate} readings/s, batch {args.batch}, {args.workers} workers")
+
+    lock = threading.Lock()
+    latencies, totals = [], {"sent": 0, "accepted": 0, "duplicates": 0, "out_of_order": 0, "errors": 0}
+    per_worker_rate = args.rate / args.workers
+    deadline = time.monotonic() + args.duration
+
+    def worker(idx: int):
+        session = requests.Session()
+        mine = counters[idx::args.workers] or counters
+        interval = args.batch / per_worker_rate
+        next_send = time.monotonic()
+        while time.monotonic() < deadline:
+            batch = [random.choice(mine).read() for _ in range(args.batch)]
+            if args.dup_rate:
+                batch += random.sample(batch, int(len(batch) * args.dup_rate))
+            if args.shuffle:
+                random.shuffle(batch)
+            t0 = time.perf_counter()
+            try:
+                res = session.post(f"{args.url}/api/telemetry/ingest", json={"readings": batch}, timeout=10).json()
+            except Exception:
+                with lock:
+                    totals["errors"] += 1
+                continue
+            elapsed = (time.perf_counter() - t0) * 1000
+            with lock:
+                latencies.append(elapsed)
+                totals["sent"] += len(batch)
+                for k in ("accepted", "duplicates", "out_of_order"):
+                    totals[k] += res.get(k, 0)
+            next_send += interval
+            time.sleep(max(0.0, next_send - time.monotonic()))
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        list(pool.map(worker, range(args.workers)))
+    wall = time.monotonic() - started
+
+    latencies.sort()
+    p = lambda q: latencies[min(len(latencies) - 1, int(len(latencies) * q))] if latencies else 0
+    print(f"Sent {totals['sent']} readings in {wall:.1f}s → {totals['sent'] / wall:.0f} readings/s")
+    print(f"accepted={totals['accepted']} duplicates={totals['duplicates']} "
+          f"out_of_order={totals['out_of_order']} errors={totals['errors']}")
+    if latencies:
+        print(f"request latency ms: p50={p(0.5):.1f} p99={p(0.99):.1f} mean={statistics.mean(latencies):.1f}")
+    print("server:", requests.get(f"{args.url}/api/telemetry/stats", timeout=10).json())
+
+
+if __name__ == "__main__":
+    main()
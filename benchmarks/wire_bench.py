@@ -0,0 +1,101 @@
+# =====================================================
+# benchmarks/wire_bench.py – Dashboard Frame Wire Benchmark
+# Compares payload size and encode time per wire format
+# Usage: python benchmarks/wire_bench.py [--sites 3] [--machines 12]
+# =====================================================
+import os
+import sys
+import gzip
+import json
+import time
+import argparse
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wire import WireFormat, compact_frame, expand_frame, dumps, orjson, msgpack  # noqa: E402
+
+SITES = ["Modan", "Baldeya", "Al-Khraj", "Site-4", "Site-5", "Site-6"]
+STATUSES = ["running", "running", "running", "paused", "stopped", "free"]
+
+
+def build_frame(sites: int, machines: int, seed: int = 1) -> dict:
+    """Same keys and value types as main.get_dashboard_data()."""
+    rnd = random.Random(seed)
+    locations = []
+    for s in range(sites):
+        name = SITES[s] if s < len(SITES) else f"Site-{s + 1}"
+        rows, next_job = [], None
+        for i in range(machines):
+            status = rnd.choice(STATUSES)
+            target, produced = 100, rnd.randint(0, 100)
+            job = None
+            if status != "free":
+                remaining = target - produced
+                job = {
+                    "work_order": f"MFG-WO-2026-{s:02d}{i:03d}",
+                    "size": rnd.choice(["20", "25", "32", "63", "110"]),
+                    "total_qty": target,
+                    "completed_qty": produced,
+                    "remaining_qty": remaining,
+                    "remaining_time": remaining * 20.0,
+                    "progress_percent": produced / target * 100,
+                    "erp_status": "In Progress",
+                    "erp_comments": None
+                }
+                if status == "stopped" and next_job is None:
+                    next_job = {
+                        "machine_id": s * 100 + i, "work_order": job["work_order"], "pipe_size": job["size"],
+                        "total_qty": target, "produced_qty": produced, "remaining_time": remaining * 20.0
+                    }
+            rows.append({"id": s * 100 + i, "name": f"Machine {i + 1}", "status": status, "job": job, "next_job": next_job})
+        locations.append({"name": name, "machines": rows})
+    return {"locations": locations}
+
+
+def timed(fn, frame, rounds: int):
+    payload = fn(frame)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn(frame)
+    return payload, (time.perf_counter() - start) / rounds * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dashboard frame wire benchmark")
+    parser.add_argument("--sites", type=int, default=3)
+    parser.add_argument("--machines", type=int, default=12)
+    parser.add_argument("--rounds", type=int, default=500)
+    args = parser.parse_args()
+
+    frame = build_frame(args.sites, args.machines)
+    assert expand_frame(compact_frame(frame)) == frame, "compact frame is not lossless"
+
+    cases = [
+        ("send_json (baseline)", lambda f: json.dumps(f).encode()),
+        ("json (fast encoder)", WireFormat("json").encode),
+        ("json + gzip (HTTP)", lambda f: gzip.compress(dumps(f), 6)),
+        ("json + deflate", WireFormat("json", "deflate").encode),
+        ("compact", WireFormat("compact").encode),
+        ("compact + deflate", WireFormat("compact", "deflate").encode),
+    ]
+    if msgpack is not None:
+        cases += [
+            ("msgpack", WireFormat("msgpack").encode),
+            ("msgpack + deflate", WireFormat("msgpack", "deflate").encode),
+        ]
+
+    machines = args.sites * args.machines
+    print(f"Dashboard frame: {args.sites} sites × {args.machines} machines = {machines} machines")
+    print(f"orjson: {'yes' if orjson else 'no (stdlib json)'} | msgpack: {'yes' if msgpack else 'no'}")
+    print(f"{'format':<24}{'bytes':>10}{'vs base':>10}{'encode µs':>12}")
+    base = None
+    for name, fn in cases:
+        payload, us = timed(fn, frame, args.rounds)
+        size = len(payload.encode() if isinstance(payload, str) else payload)
+        base = base or size
+        print(f"{name:<24}{size:>10}{size / base:>9.0%}{us:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
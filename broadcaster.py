@@ -0,0 +1,101 @@
+# =====================================================
+# broadcaster.py – Coalescing Dashboard Publisher
+# Marks dashboard state dirty and emits at most one merged
+# frame per interval; alerts bypass coalescing (priority lane)
+# =====================================================
+import os
+import time
+import asyncio
+import logging
+from typing import Callable, Dict, Optional
+
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from change_feed import ChangeFeed
+
+# Minimum spacing between two full dashboard frames (default 250 ms)
+FRAME_INTERVAL = float(os.getenv("BROADCAST_INTERVAL_MS", 250)) / 1000
+
+
+class CoalescingPublisher:
+    """
+    Every producer (meter counter, machine actions, ERP sync, scheduler)
+    calls mark_dirty() instead of rebuilding the dashboard itself.
+    The run() loop wakes on the first dirty mark, builds ONE frame and
+    sleeps for the rest of the interval, so N events inside a window
+    cost a single get_dashboard_data() call.
+    Each built frame is also recorded in the change feed, which
+    long-poll / SSE clients read from.
+    """
+
+    def __init__(self, manager, build_frame: Callable[[Session], Dict], interval: float = FRAME_INTERVAL,
+                 feed: Optional[ChangeFeed] = None):
+        self.manager = manager
+        self.build_frame = build_frame
+        self.interval = interval
+        self.feed = feed or ChangeFeed()
+        self.frames_sent = 0
+        self.marks = 0
+        self._dirty = asyncio.Event()
+        self._extra: Dict = {}
+        self._stale = True  # feed behind the DB (nobody was listening)
+
+    # -------------------------------
+    # PRODUCER API
+    # -------------------------------
+    def mark_dirty(self, **extra):
+        """Request a dashboard frame; extra keys are merged into the next frame."""
+        self.marks += 1
+        self._extra.update(extra)
+        self._dirty.set()
+
+    async def publish_now(self, data: Dict):
+        """Priority lane: send immediately (alerts), never coalesced."""
+        entry = self.feed.record_event(data)
+        await self.manager.broadcast({**data, "version": entry["v"]})
+
+    # -------------------------------
+    # FRAME LOOP
+    # -------------------------------
+    def _build(self, extra: Dict) -> Optional[Dict]:
+        db = SessionLocal()
+        try:
+            frame = self.build_frame(db)
+        finally:
+            db.close()
+        frame.update(extra)
+        self._stale = False
+        if self.feed.record_frame(frame) is None:
+            return None
+        frame["version"] = self.feed.version
+        return frame
+
+    def refresh(self):
+        """Bring the feed up to date before serving a long-poll / SSE client."""
+        if self._stale:
+            self._build({})
+
+    async def flush(self):
+        self._dirty.clear()
+        extra, self._extra = self._extra, {}
+        if not self.manager.active_connections and not self.feed.listeners:
+            self._stale = True
+            return
+        frame = self._build(extra)
+        if frame is None or not self.manager.active_connections:
+            return
+        frame["sent_at"] = time.time()  # lets clients measure broadcast → receive latency
+        await self.manager.broadcast(frame)
+        self.frames_sent += 1
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        logging.info(f"📡 Dashboard publisher started ({self.interval * 1000:.0f} ms frames)")
+        while True:
+            await self._dirty.wait()
+            started = loop.time()
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"PUBLISHER ERROR: {e}")
+            await asyncio.sleep(max(0.0, self.interval - (loop.time() - started)))
@@ -0,0 +1,122 @@
+# =====================================================
+# change_feed.py – Versioned Dashboard Change Feed
+# Every published frame is diffed per machine against the last
+# one; changed machines are stored under a new version in a
+# bounded log. Long-poll and SSE clients ask for "everything
+# since version N" and get only the machines that changed.
+# =====================================================
+import os
+import asyncio
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+# Versions kept for catch-up (~5 min of 250 ms frames); also the WebSocket replay buffer
+CHANGE_FEED_SIZE = int(os.getenv("CHANGE_FEED_SIZE", 1200))
+
+
+class ChangeFeed:
+    def __init__(self, size: int = CHANGE_FEED_SIZE):
+        self.version = 0
+        self.machines: Dict[int, Dict] = {}      # id → last machine dict (+ "location")
+        self.location_order: List[str] = []
+        self.log: deque = deque(maxlen=size)     # {"v", "changes", "removed", "alerts", "extra"}
+        self.listeners = 0                       # open long-polls + SSE streams
+        self._changed = asyncio.Event()
+
+    # -------------------------------
+    # WRITERS (publisher)
+    # -------------------------------
+    def record_frame(self, frame: Dict) -> Optional[Dict]:
+        """Diff a full dashboard frame; → the new log entry, or None if nothing changed."""
+        seen, changes = set(), []
+        order = []
+        for loc in frame.get("locations", []):
+            order.append(loc["name"])
+            for m in loc["machines"]:
+                seen.add(m["id"])
+                row = {**m, "location": loc["name"]}
+                if self.machines.get(m["id"]) != row:
+                    self.machines[m["id"]] = row
+                    changes.append(row)
+        removed = [mid for mid in self.machines if mid not in seen]
+        for mid in removed:
+            del self.machines[mid]
+        self.location_order = order
+
+        extra = {k: v for k, v in frame.items() if k not in ("locations", "sent_at")}
+        if not changes and not removed and not extra:
+            return None
+        return self._append({"changes": changes, "removed": removed, "alerts": [], "extra": extra})
+
+    def record_event(self, data: Dict) -> Dict:
+        """Priority events (alerts) get their own version."""
+        return self._append({"changes": [], "removed": [], "alerts": [data], "extra": {}})
+
+    def _append(self, entry: Dict) -> Dict:
+        self.version += 1
+        entry["v"] = self.version
+        entry["at"] = time.time()
+        self.log.append(entry)
+        # Wake every waiter; new waiters get a fresh event
+        self._changed.set()
+        self._changed = asyncio.Event()
+        return entry
+
+    # -------------------------------
+    # READERS
+    # -------------------------------
+    def snapshot(self) -> Dict:
+        locations = {name: [] for name in self.location_order}
+        for row in self.machines.values():
+            m = dict(row)
+            locations.setdefault(m.pop("location"), []).append(m)
+        return {
+            "version": self.version,
+            "snapshot": [{"name": name, "machines": ms} for name, ms in locations.items()],
+        }
+
+    def can_replay(self, since: int) -> bool:
+        """True when every version after `since` is still in the log."""
+        if since > self.version:
+            return False  # client from before a server restart
+        return since == self.version or (bool(self.log) and self.log[0]["v"] <= since + 1)
+
+    def entries_since(self, since: int) -> List[Dict]:
+        return [e for e in self.log if e["v"] > since]
+
+    def since(self, since: Optional[int]) -> Dict:
+        """
+        Merged changes after `since` (latest row per machine wins),
+        or a full snapshot when the client is unknown or too far behind.
+        """
+        if since is None or not self.can_replay(since):
+            return self.snapshot()
+        changes: Dict[int, Dict] = {}
+        removed, alerts, extra = set(), [], {}
+        for e in self.entries_since(since):
+            for row in e["changes"]:
+                changes[row["id"]] = row
+                removed.discard(row["id"])
+            for mid in e["removed"]:
+                changes.pop(mid, None)
+                removed.add(mid)
+            alerts.extend(e["alerts"])
+            extra.update(e["extra"])
+        return {
+            "version": self.version,
+            "changes": list(changes.values()),
+            "removed": sorted(removed),
+            "alerts": alerts,
+            **extra,
+        }
+
+    async def wait(self, since: int, timeout: float) -> bool:
+        """Block until version > since or timeout; → True if something changed."""
+        if self.version > since:
+            return True
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.version > since
@@ -0,0 +1,100 @@
+# =====================================================
+# clock.py – Injectable Time Source
+# Every tick / status / alert / OEE / history timestamp asks
+# this module for "now". In production it is the wall clock;
+# the plant simulator installs a SimClock so the same code runs
+# on virtual time (benchmarks/plant_sim.py).
+# =====================================================
+import time as _time
+import asyncio
+import heapq
+import itertools
+from datetime import datetime, timezone
+from typing import Callable, List, Optional
+
+
+class WallClock:
+    def time(self) -> float:
+        return _time.time()
+
+    def now(self) -> datetime:
+        return datetime.now(timezone.utc)
+
+    def call_later(self, delay: float, callback: Callable, *args):
+        """Timer handle with .cancel(); None outside an event loop."""
+        try:
+            return asyncio.get_running_loop().call_later(delay, callback, *args)
+        except RuntimeError:
+            return None
+
+
+class SimTimer:
+    __slots__ = ("cancelled",)
+
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class SimClock(WallClock):
+    """
+    Virtual time that only moves when advance() is called; timers
+    fire in deadline order (ties in arming order) during advance,
+    so a run is reproducible step for step.
+    """
+
+    def __init__(self, start: float):
+        self.t = float(start)
+        self._timers: List[tuple] = []  # (deadline, seq, timer, callback, args)
+        self._seq = itertools.count()
+
+    def time(self) -> float:
+        return self.t
+
+    def now(self) -> datetime:
+        return datetime.fromtimestamp(self.t, timezone.utc)
+
+    def call_later(self, delay: float, callback: Callable, *args) -> SimTimer:
+        timer = SimTimer()
+        heapq.heappush(self._timers, (self.t + max(0.0, delay), next(self._seq), timer, callback, args))
+        return timer
+
+    def next_timer(self) -> Optional[float]:
+        while self._timers and self._timers[0][2].cancelled:
+            heapq.heappop(self._timers)
+        return self._timers[0][0] if self._timers else None
+
+    def advance(self, to: float) -> int:
+        """Move to `to`, firing every timer due on the way; → timers fired."""
+        fired = 0
+        while self._timers and self._timers[0][0] <= to:
+            deadline, _, timer, callback, args = heapq.heappop(self._timers)
+            if timer.cancelled:
+                continue
+            self.t = max(self.t, deadline)
+            callback(*args)
+            fired += 1
+        self.t = max(self.t, float(to))
+        return fired
+
+
+_clock = WallClock()
+
+
+def install(clock: WallClock):
+    global _clock
+    _clock = clock
+
+
+def time() -> float:
+    return _clock.time()
+
+
+def now() -> datetime:
+    return _clock.now()
+
+
+def call_later(delay: float, callback: Callable, *args):
+    return _clock.call_later(delay, callback, *args)
@@ -2,9 +2,9 @@
 # database.py – Future-Proof Version for Taco Group HDPE
 # Steps 1 → 42 + Step 43 (ScheduledJob Table)
 # =====================================================
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
-from datetime import datetime, timezone
 import os
 
 # =====================================================
@@ -12,13 +12,64 @@ import os
 # =====================================================
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./production.db")
 
+# Reporting reads go to their own pool (file opened read-only for SQLite,
+# or DATABASE_READ_URL, e.g. a replica, for other databases)
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+READ_POOL_SIZE = int(os.getenv("READ_POOL_SIZE", 4))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
 engine = create_engine(
     DATABASE_URL,
-    connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {},
+    connect_args={"check_same_thread": False} if IS_SQLITE else {},
     pool_pre_ping=True,
     future=True
 )
 
+
+def _sqlite_file(url: str):
+    db = make_url(url).database
+    return None if not db or db == ":memory:" else os.path.abspath(db)
+
+
+if IS_SQLITE and _sqlite_file(DATABASE_URL):
+    @event.listens_for(engine, "connect")
+    def _sqlite_write_pragmas(dbapi_conn, _record):
+        # WAL: readers never block the meter counter's writes and vice versa
+        cur = dbapi_conn.cursor()
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=NORMAL")
+        cur.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cur.close()
+
+    read_engine = create_engine(
+        DATABASE_READ_URL or f"sqlite:///file:{_sqlite_file(DATABASE_URL)}?mode=ro&uri=true",
+        connect_args={"check_same_thread": False},
+        pool_size=READ_POOL_SIZE,
+        max_overflow=0,
+        future=True
+    )
+
+    @event.listens_for(read_engine, "connect")
+    def _sqlite_read_pragmas(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        cur.execute("PRAGMA query_only=ON")
+        cur.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cur.close()
+elif DATABASE_READ_URL:
+    read_engine = create_engine(DATABASE_READ_URL, pool_size=READ_POOL_SIZE, max_overflow=0,
+                                pool_pre_ping=True, future=True)
+else:
+    read_engine = engine  # in-memory SQLite: nothing to isolate
+
+# Time every statement; slow ones are logged with their query plan
+if os.getenv("QUERY_LOG", "1") == "1":
+    from query_log import install_query_log
+    install_query_log(engine)
+    if read_engine is not engine:
+        install_query_log(read_engine)
+
 SessionLocal = sessionmaker(
     autocommit=False,
     autoflush=False,
@@ -26,75 +77,21 @@ SessionLocal = sessionmaker(
     expire_on_commit=False
 )
 
-Base = declarative_base()
-
-# =====================================================
-# TABLE DEFINITIONS – FUTURE-PROOF
-# =====================================================
-
-class Machine(Base):
-    __tablename__ = "machines"
-    __table_args__ = {"extend_existing": True}
-
-    id = Column(Integer, primary_key=True, index=True)
-    location = Column(String, index=True, nullable=False)
-    name = Column(String, nullable=False)
-    status = Column(String, default="free")
-    work_order = Column(String, nullable=True)
-    pipe_size = Column(String, nullable=True)
-    target_qty = Column(Integer, default=0)
-    produced_qty = Column(Integer, default=0)
-    seconds_per_meter = Column(Float, default=0)
-    last_tick_time = Column(DateTime, nullable=True)
-    erpnext_work_order_id = Column(String, nullable=True)
-
-
-class ProductionLog(Base):
-    __tablename__ = "production_logs"
-    __table_args__ = {"extend_existing": True}
-
-    id = Column(Integer, primary_key=True, index=True)
-    machine_id = Column(Integer, nullable=False)
-    location = Column(String, nullable=False)
-    work_order = Column(String, nullable=True)
-    pipe_size = Column(String, nullable=True)
-    target_qty = Column(Integer, nullable=False, default=0)
-    produced_qty = Column(Integer, default=0)
-    remaining_qty = Column(Integer, default=0)
-    status = Column(String, nullable=False, default="running")
-    timestamp = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-
-
-class ERPNextMetadata(Base):
-    __tablename__ = "erpnext_metadata"
-    __table_args__ = {"extend_existing": True}
-
-    id = Column(Integer, primary_key=True, index=True)
-    machine_id = Column(Integer, nullable=False)
-    work_order = Column(String, nullable=False)
-    erp_status = Column(String, default="Not Started")
-    erp_comments = Column(String, nullable=True)
-    last_synced = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+# Read-only sessions for reports/exports (never used for writes)
+ReadSessionLocal = sessionmaker(
+    autocommit=False,
+    autoflush=False,
+    bind=read_engine,
+    expire_on_commit=False
+)
 
+Base = declarative_base()
 
 # =====================================================
-# STEP 43 → SCHEDULED JOBS TABLE
+# TABLE DEFINITIONS live in models.py (single source of truth;
+# a second copy here registered duplicate indexes and broke
+# create_all on a fresh database)
 # =====================================================
-class ScheduledJob(Base):
-    __tablename__ = "scheduled_jobs"
-    __table_args__ = {"extend_existing": True}
-
-    id = Column(Integer, primary_key=True, index=True)
-    work_order = Column(String, nullable=False)
-    location = Column(String, nullable=False)
-    pipe_size = Column(String, nullable=True)
-    qty = Column(Integer, default=0)
-    produced_qty = Column(Integer, default=0)
-    priority = Column(Integer, default=0)  # Higher = urgent
-    assigned_machine_id = Column(Integer, nullable=True)  # None = not assigned
-    eta_seconds = Column(Float, nullable=True)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-
 
 # =====================================================
 # HELPER FUNCTION TO CREATE ALL TABLES
@@ -105,4 +102,53 @@ def init_db():
     ERPNext metadata, and ScheduledJob for Step 43.
     Safe to call multiple times without breaking existing tables.
     """
-    Base.metadata.create_all(bind=engine)  
\ No newline at end of file
+    import models  # noqa: F401 – register tables on Base
+    Base.metadata.create_all(bind=engine)
+    ensure_schema()
+
+
+# Tables whose unique key changed: rebuilt (rows kept) when this constraint is missing
+REKEYED_TABLES = {"alert_state": "uq_alert_state_machine_rule_wo"}
+
+# Indexes replaced by a wider one in models.py (dropped so writes don't maintain both):
+# timestamp → idx_production_log_ts_cover, work_order_ts → idx_production_log_work_order_cover
+RETIRED_INDEXES = ("idx_production_log_timestamp", "idx_production_log_work_order_ts")
+
+
+def ensure_schema():
+    """
+    create_all() never alters existing tables: add columns and
+    indexes declared in models.py that an older database lacks,
+    and rebuild tables whose unique key has changed.
+    """
+    from sqlalchemy import inspect, text
+
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}"
+                default = getattr(column.default, "arg", None)
+                if default is not None and not callable(default):
+                    ddl += f" DEFAULT {int(default) if isinstance(default, bool) else repr(default)}"
+                conn.execute(text(ddl))
+        for name, constraint in REKEYED_TABLES.items():
+            if inspector.has_table(name) and constraint not in {u["name"] for u in inspector.get_unique_constraints(name)}:
+                table = Base.metadata.tables[name]
+                rows = [{k: v for k, v in row.items() if k in table.columns}
+                        for row in conn.execute(text(f"SELECT * FROM {name}")).mappings()]
+                table.drop(conn)
+                table.create(conn)
+                if rows:
+                    conn.execute(table.insert(), rows)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    with engine.begin() as conn:
+        for name in RETIRED_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))  
\ No newline at end of file
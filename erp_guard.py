@@ -0,0 +1,171 @@
+# =====================================================
+# erp_guard.py – Circuit Breaker + Dedicated ERP Executor
+# ERP outages fail fast instead of waiting TIMEOUT per call,
+# and ERP work never runs on the default executor that
+# FastAPI uses for sync endpoints
+# =====================================================
+import os
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from functools import partial
+
+import requests
+
+from metrics import ERP_CIRCUIT, ERP_PENDING
+
+FAILURE_THRESHOLD = int(os.getenv("ERP_BREAKER_FAILURES", 3))    # consecutive failures → open
+RESET_TIMEOUT = float(os.getenv("ERP_BREAKER_RESET_S", 30))       # open → half-open after
+HALF_OPEN_PROBES = int(os.getenv("ERP_BREAKER_PROBES", 1))        # concurrent trial calls
+ERP_WORKERS = int(os.getenv("ERP_WORKERS", 2))
+ERP_MAX_PENDING = int(os.getenv("ERP_MAX_PENDING", 50))           # queued + running ERP jobs
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class ERPBusyError(Exception):
+    pass
+
+# =====================================================
+# CIRCUIT BREAKER
+# =====================================================
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = FAILURE_THRESHOLD,
+                 reset_timeout: float = RESET_TIMEOUT, half_open_probes: int = HALF_OPEN_PROBES):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+        self.rejected = 0
+        self.on_close = None  # called (outside the lock) when the circuit closes again
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    return False
+                self.state, self.probes = HALF_OPEN, 0
+                logging.info(f"ERP circuit '{self.name}' half-open – probing")
+            if self.state == HALF_OPEN:
+                if self.probes >= self.half_open_probes:
+                    self.rejected += 1
+                    return False
+                self.probes += 1
+            return True
+
+    def record_success(self):
+        with self._lock:
+            reopened = self.state != CLOSED
+            if reopened:
+                logging.info(f"ERP circuit '{self.name}' closed")
+            self.state, self.failures, self.probes = CLOSED, 0, 0
+        if reopened and self.on_close:
+            self.on_close()
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    logging.warning(f"ERP circuit '{self.name}' OPEN after {self.failures} failures "
+                                    f"– failing fast for {self.reset_timeout:.0f}s")
+                self.state, self.opened_at, self.probes = OPEN, time.monotonic(), 0
+
+    def call(self, fn, *args, **kwargs):
+        if not self.allow():
+            raise CircuitOpenError(f"ERP circuit '{self.name}' is open")
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if is_outage(e):
+                self.record_failure()
+            else:
+                self.record_success()  # ERP answered (e.g. 4xx) → it is up
+            raise
+        self.record_success()
+        return result
+
+    def snapshot(self):
+        return {"state": self.state, "failures": self.failures, "rejected": self.rejected,
+                "retry_in_s": max(0.0, round(self.reset_timeout - (time.monotonic() - self.opened_at), 1))
+                if self.state == OPEN else 0.0}
+
+
+def is_outage(e: Exception) -> bool:
+    """Connection problems, timeouts and 5xx count against the breaker; 4xx do not."""
+    if isinstance(e, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(e, requests.HTTPError) and e.response is not None:
+        return e.response.status_code >= 500
+    return not isinstance(e, requests.RequestException)
+
+# =====================================================
+# BOUNDED EXECUTOR
+# =====================================================
+class BoundedExecutor:
+    """ThreadPoolExecutor with a cap on queued + running jobs (rejects when full)."""
+
+    def __init__(self, workers: int = ERP_WORKERS, max_pending: int = ERP_MAX_PENDING):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="erp")
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.pending = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        if not self.slots.acquire(blocking=False):
+            self.rejected += 1
+            raise ERPBusyError("ERP executor queue full")
+        with self._lock:
+            self.pending += 1
+        try:
+            future = self.pool.submit(fn, *args, **kwargs)
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, _future):
+        with self._lock:
+            self.pending -= 1
+        self.slots.release()
+
+    async def run(self, fn, *args, **kwargs):
+        return await asyncio.wrap_future(self.submit(partial(fn, *args, **kwargs)))
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+erp_breaker = CircuitBreaker("erpnext")
+erp_executor = BoundedExecutor()
+ERP_CIRCUIT.callback = lambda: {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}[erp_breaker.state]
+ERP_PENDING.callback = lambda: erp_executor.pending
+
+
+async def run_erp(fn, *args, **kwargs):
+    """Await ERP work on the dedicated executor."""
+    return await erp_executor.run(fn, *args, **kwargs)
+
+
+def submit_erp(fn, *args, **kwargs) -> bool:
+    """Fire-and-forget ERP work (status pushes); never blocks the event loop. → False if rejected."""
+    try:
+        erp_executor.submit(fn, *args, **kwargs)
+        return True
+    except ERPBusyError:
+        logging.warning(f"ERP executor full – dropped {getattr(fn, '__name__', fn)}{args}")
+        return False
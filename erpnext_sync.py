@@ -8,13 +8,18 @@ import os
 import requests
 import asyncio
 import logging
+import threading
 from datetime import datetime
 from dotenv import load_dotenv
 from sqlalchemy.exc import SQLAlchemyError
-from typing import List, Dict
+from typing import List, Dict, Tuple
 
 from database import SessionLocal
 from models import Machine, ERPNextMetadata
+from oee import oee_engine
+from transitions import record_transition
+from metrics import ERP_SECONDS, ERP_ERRORS
+from erp_guard import erp_breaker, run_erp, submit_erp, is_outage, CircuitOpenError
 
 # =====================================================
 # Logging Configuration
@@ -57,31 +62,140 @@ def get_work_orders() -> List[Dict]:
         "filters": '[["status","in",["Not Started","In Process"]]]'
     }
 
+    def fetch():
+        with ERP_SECONDS.time(op="get_work_orders"):
+            resp = requests.get(url, headers=HEADERS, params=params, timeout=TIMEOUT)
+            resp.raise_for_status()
+            return resp.json().get("data", []) or []
+
     try:
-        resp = requests.get(url, headers=HEADERS, params=params, timeout=TIMEOUT)
-        resp.raise_for_status()
-        data = resp.json().get("data", []) or []
+        data = erp_breaker.call(fetch)
         logging.info(f"Fetched {len(data)} work orders from ERPNext")
         return data
+    except CircuitOpenError:
+        ERP_ERRORS.inc(op="circuit_open")
+        logging.debug("ERP fetch skipped – circuit open")
+        return []
     except Exception as e:
+        ERP_ERRORS.inc(op="get_work_orders")
         logging.error(f"ERP fetch error: {e}")
         return []
 
 # =====================================================
 # Update ERP Work Order Status (Optional)
 # =====================================================
-def update_work_order_status(erp_work_order_id: str, status: str):
+_local = threading.local()
+
+def _session() -> requests.Session:
+    """Keep-alive session per ERP executor thread (requests.Session isn't shared across threads)."""
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = _local.session = requests.Session()
+    return session
+
+def update_work_order_status(erp_work_order_id: str, status: str, seq: int = None) -> bool:
+    """PUT one status; kept in status_outbox when ERP can't take it now (open circuit / outage)."""
+    if seq is None:
+        seq = status_outbox.begin(erp_work_order_id)
+    url = f"{ERP_URL}/api/resource/Work Order/{erp_work_order_id}"
+
+    def put():
+        with ERP_SECONDS.time(op="update_work_order_status"):
+            _session().put(
+                url,
+                json={"status": status},
+                headers=HEADERS,
+                timeout=TIMEOUT
+            ).raise_for_status()
+
     try:
-        url = f"{ERP_URL}/api/resource/Work Order/{erp_work_order_id}"
-        requests.put(
-            url,
-            json={"status": status},
-            headers=HEADERS,
-            timeout=TIMEOUT
-        ).raise_for_status()
+        erp_breaker.call(put)
+        status_outbox.sent(erp_work_order_id, seq)
         logging.info(f"ERP Work Order {erp_work_order_id} → {status}")
+        return True
+    except CircuitOpenError:
+        ERP_ERRORS.inc(op="circuit_open")
+        status_outbox.failed(erp_work_order_id, status, seq)
+        logging.warning(f"ERP circuit open – status {status} for {erp_work_order_id} queued for resend")
     except Exception as e:
+        ERP_ERRORS.inc(op="update_work_order_status")
+        if is_outage(e):
+            status_outbox.failed(erp_work_order_id, status, seq)
         logging.error(f"ERP status update failed: {e}")
+    return False
+
+def push_work_order_status(erp_work_order_id: str, status: str) -> bool:
+    """Fire-and-forget status push (after the local commit); → False if it went to the outbox."""
+    if not erp_work_order_id:
+        return False
+    seq = status_outbox.begin(erp_work_order_id)
+    if submit_erp(update_work_order_status, erp_work_order_id, status, seq):
+        return True
+    status_outbox.failed(erp_work_order_id, status, seq)
+    return False
+
+def update_work_order_statuses(updates: List[Tuple[str, str]]) -> int:
+    """
+    Fan several (work order, status) pushes out over the ERP executor: they
+    run in parallel up to ERP_WORKERS, so one slow call doesn't hold up the
+    rest and the executor's cap still holds. Never blocks; → pushes queued.
+    """
+    queued = sum(push_work_order_status(wo, status) for wo, status in updates if wo)
+    logging.info(f"ERP batch: {queued} status update(s) queued")
+    return queued
+
+# =====================================================
+# Status Outbox (pushes ERP didn't take)
+# =====================================================
+class StatusOutbox:
+    """
+    Latest undelivered status per work order. Pushes rejected by a full
+    executor, an open circuit or an ERP outage land here and are resent
+    when the circuit closes or on the next sync pass; a newer push for
+    the same work order supersedes a pending one, and a stale failure
+    (an older push finishing after a newer one) is ignored.
+    """
+
+    def __init__(self):
+        self.pending: Dict[str, str] = {}
+        self.latest: Dict[str, int] = {}  # work order → seq of its newest push, until delivered
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def begin(self, work_order: str) -> int:
+        with self._lock:
+            self._seq += 1
+            self.latest[work_order] = self._seq
+            self.pending.pop(work_order, None)
+            return self._seq
+
+    def failed(self, work_order: str, status: str, seq: int):
+        with self._lock:
+            if self.latest.get(work_order) == seq:
+                self.pending[work_order] = status
+
+    def sent(self, work_order: str, seq: int):
+        with self._lock:
+            if self.latest.get(work_order) == seq:
+                del self.latest[work_order]
+
+    def take(self) -> List[Tuple[str, str]]:
+        with self._lock:
+            items, self.pending = list(self.pending.items()), {}
+        return items
+
+status_outbox = StatusOutbox()
+
+def resend_pending_statuses() -> int:
+    """Queue every outbox entry again; → number resent."""
+    items = status_outbox.take()
+    if not items:
+        return 0
+    resent = sum(push_work_order_status(wo, status) for wo, status in items)
+    logging.info(f"ERP outbox: {resent}/{len(items)} pending status update(s) resent")
+    return resent
+
+erp_breaker.on_close = resend_pending_statuses
 
 # =====================================================
 # Auto-Assign ERP Work Orders to Machines (Safe)
@@ -138,6 +252,7 @@ def auto_assign_work_orders() -> None:
             selected_machine.pipe_size = pipe_size
             selected_machine.target_qty = qty
             selected_machine.produced_qty = produced
+            record_transition(db, selected_machine, selected_machine.status, "paused", cause="erp_assign")
             selected_machine.status = "paused"
             selected_machine.is_locked = True
 
@@ -160,6 +275,7 @@ def auto_assign_work_orders() -> None:
                 meta.last_synced = datetime.now()
 
             db.commit()
+            oee_engine.on_status(selected_machine)
             logging.info(f"Assigned ERP WO {wo_name} → Machine {selected_machine.name}")
 
             # Optional: Update ERPNext status to In Process
@@ -182,7 +298,7 @@ async def erpnext_sync_loop(interval: int = 10):
     logging.info("🚀 ERPNext Production Sync Loop Started")
     while True:
         try:
-            await asyncio.to_thread(auto_assign_work_orders)
+            await run_erp(auto_assign_work_orders)
         except Exception as e:
             logging.error(f"ERP Sync Loop error: {e}")
         await asyncio.sleep(interval)
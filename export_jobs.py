@@ -0,0 +1,341 @@
+# =====================================================
+# export_jobs.py – Background Production Export Jobs
+# Large exports run as jobs on a small dedicated pool instead of
+# inside the request: submit filters, poll progress, download
+# the gzip CSV (or columnar) files, optionally one per location.
+# A finished export is handed out again for the same request
+# while its data cannot have changed.
+# =====================================================
+import os
+import re
+import csv
+import gzip
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone, time as dtime
+from typing import Dict, List, Literal, Optional
+
+from fastapi import APIRouter
+from fastapi.responses import FileResponse
+from pydantic import BaseModel
+from sqlalchemy import func
+
+from database import ReadSessionLocal
+from models import ProductionLog
+from report import LOG_FIELDS, NO_META, REPORT_EXECUTOR, _parse_date, _log_rows, _erp_metadata, busy_response
+from report_cache import report_cache, closed_before
+from wire import FastJSONResponse
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # columnar exports fall back to gzip column-chunked NDJSON
+    pyarrow = None
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "exports"))
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", 1))              # exports running at once
+EXPORT_MAX_QUEUED = int(os.getenv("EXPORT_MAX_QUEUED", 16))       # queued + running before 503
+EXPORT_RETENTION_H = float(os.getenv("EXPORT_RETENTION_H", 24))   # finished files kept on disk
+EXPORT_FRESH_S = float(os.getenv("EXPORT_FRESH_S", 60))           # reuse window for ranges that include today
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+router = APIRouter(prefix="/api/report/exports", tags=["Production Report"])
+
+
+class ExportRequest(BaseModel):
+    start_date: Optional[str] = None   # YYYY-MM-DD
+    end_date: Optional[str] = None     # YYYY-MM-DD (inclusive, as /export)
+    location: Optional[str] = None
+    format: Literal["csv", "columnar"] = "csv"
+    split_by_location: bool = False
+
+# =====================================================
+# WORKER (runs in the export pool; writes only to job_dir)
+# =====================================================
+def _part_name(part: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_-]+", "_", part).strip("_") or "unknown"
+
+
+class _PartWriter:
+    """
+    One output file: gzip CSV, parquet, or gzip NDJSON. The NDJSON
+    fallback is a {"fields": [...]} header line followed by one
+    {"columns": {...}} chunk per write, so nothing is held in memory.
+    """
+
+    def __init__(self, job_dir: str, part: str, fmt: str):
+        self.part, self.fmt, self.rows = part, fmt, 0
+        stem = f"production_{_part_name(part)}"
+        if fmt == "csv":
+            self.name = f"{stem}.csv.gz"
+            self._file = gzip.open(os.path.join(job_dir, self.name), "wt", newline="", encoding="utf-8")
+            self._csv = csv.writer(self._file)
+            self._csv.writerow(LOG_FIELDS)
+        elif pyarrow is not None:
+            self.name = f"{stem}.parquet"
+            self._schema = pyarrow.schema([
+                ("machine_id", pyarrow.int64()), ("machine_name", pyarrow.string()),
+                ("location", pyarrow.string()), ("work_order", pyarrow.string()),
+                ("pipe_size", pyarrow.string()), ("produced_qty", pyarrow.int64()),
+                ("timestamp", pyarrow.string()), ("erp_status", pyarrow.string()),
+                ("erp_comments", pyarrow.string()),
+            ])
+            self._parquet = pyarrow.parquet.ParquetWriter(os.path.join(job_dir, self.name), self._schema,
+                                                          compression="zstd")
+        else:
+            self.name = f"{stem}.columns.ndjson.gz"
+            self._file = gzip.open(os.path.join(job_dir, self.name), "wt", encoding="utf-8")
+            self._file.write(json.dumps({"fields": LOG_FIELDS}) + "\n")
+        self.path = os.path.join(job_dir, self.name)
+
+    def write(self, rows: List[list]):
+        self.rows += len(rows)
+        if self.fmt == "csv":
+            self._csv.writerows(rows)
+        elif pyarrow is not None:
+            columns = list(zip(*rows))
+            self._parquet.write_table(pyarrow.table(
+                {f: list(col) for f, col in zip(LOG_FIELDS, columns)}, schema=self._schema))
+        else:
+            columns = dict(zip(LOG_FIELDS, zip(*rows)))
+            self._file.write(json.dumps({"columns": columns}, separators=(",", ":")) + "\n")
+
+    def close(self) -> Dict:
+        if self.fmt != "csv" and pyarrow is not None:
+            self._parquet.close()
+        else:
+            self._file.close()
+        return {"part": self.part, "name": self.name, "rows": self.rows, "bytes": os.path.getsize(self.path)}
+
+
+def _write_progress(job_dir: str, progress: Dict):
+    tmp = os.path.join(job_dir, "progress.json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(progress, f)
+    os.replace(tmp, os.path.join(job_dir, "progress.json"))
+
+
+def build_export(job_dir: str, start_dt: Optional[datetime], end_dt: Optional[datetime],
+                 location: Optional[str], fmt: str, split: bool) -> Dict:
+    """Stream the export one UTC day at a time (newest first, as /export) so memory stays flat."""
+    t0 = time.perf_counter()
+    db = ReadSessionLocal()
+    try:
+        first = start_dt
+        if first is None:
+            first = db.query(func.min(ProductionLog.timestamp)).scalar()
+        last_day = end_dt.date() if end_dt else datetime.now(timezone.utc).date()
+        days = [] if first is None else [
+            last_day - timedelta(days=i) for i in range((last_day - first.date()).days + 1)
+        ]
+        meta = _erp_metadata(db)
+        writers: Dict[str, _PartWriter] = {}
+        total = 0
+        _write_progress(job_dir, {"days_done": 0, "days_total": len(days), "rows": 0})
+
+        for i, day in enumerate(days):
+            lo = datetime.combine(day, dtime())
+            if start_dt and start_dt > lo:
+                lo = start_dt
+            if end_dt and day == end_dt.date():
+                rows = _log_rows(db, location, lo, end_dt, end_inclusive=True)
+            else:
+                rows = _log_rows(db, location, lo, datetime.combine(day + timedelta(days=1), dtime()))
+
+            parts: Dict[str, List[list]] = {}
+            for machine_id, machine_name, machine_location, work_order, pipe_size, produced_qty, timestamp in rows:
+                erp = meta.get(work_order, NO_META)
+                parts.setdefault(machine_location if split else "all", []).append([
+                    machine_id, machine_name, machine_location, work_order, pipe_size, produced_qty,
+                    timestamp.isoformat(), erp[0], erp[1]
+                ])
+            for part, part_rows in parts.items():
+                if part not in writers:
+                    writers[part] = _PartWriter(job_dir, part, fmt)
+                writers[part].write(part_rows)
+            total += len(rows)
+            _write_progress(job_dir, {"days_done": i + 1, "days_total": len(days), "rows": total})
+
+        files = [w.close() for w in writers.values()]
+        return {"rows": total, "files": files, "elapsed_s": round(time.perf_counter() - t0, 2)}
+    finally:
+        db.close()
+
+# =====================================================
+# JOB REGISTRY (server process)
+# =====================================================
+class ExportJob:
+    def __init__(self, key: str, request: ExportRequest):
+        self.id = uuid.uuid4().hex[:16]
+        self.key = key
+        self.request = request
+        self.status = QUEUED
+        self.generation = report_cache.generation  # history edits since → not reusable
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.dir = os.path.join(EXPORT_DIR, self.id)
+
+    def closed_range(self) -> bool:
+        """True when every day in range has closed, i.e. the export can never change."""
+        end = _parse_date(self.request.end_date)
+        return end is not None and end.date() < closed_before(datetime.fromtimestamp(self.created_at, timezone.utc))
+
+    def progress(self) -> Dict:
+        try:
+            with open(os.path.join(self.dir, "progress.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def to_dict(self, reused: bool = False) -> Dict:
+        progress = self.progress()
+        data = {
+            "id": self.id,
+            # The progress file appears once a worker picks the job up
+            "status": RUNNING if self.status == QUEUED and progress else self.status,
+            "request": self.request.model_dump(),
+            "created_at": datetime.fromtimestamp(self.created_at, timezone.utc).isoformat(),
+            "finished_at": datetime.fromtimestamp(self.finished_at, timezone.utc).isoformat()
+            if self.finished_at else None,
+            "progress": progress,
+            "reused": reused,
+        }
+        if self.result:
+            data["rows"] = self.result["rows"]
+            data["elapsed_s"] = self.result["elapsed_s"]
+            data["files"] = [{**f, "url": f"{router.prefix}/{self.id}/files/{f['name']}"}
+                             for f in self.result["files"]]
+        if self.error:
+            data["error"] = self.error
+        return data
+
+
+class ExportManager:
+    def __init__(self):
+        self.jobs: Dict[str, ExportJob] = {}
+        self._pool = None
+
+    def pool(self):
+        if self._pool is None:
+            if REPORT_EXECUTOR == "process":
+                self._pool = ProcessPoolExecutor(max_workers=EXPORT_WORKERS,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix="export")
+        return self._pool
+
+    @staticmethod
+    def key(request: ExportRequest) -> str:
+        return hashlib.blake2b(json.dumps(request.model_dump(), sort_keys=True).encode(), digest_size=12).hexdigest()
+
+    def _reusable(self, job: ExportJob) -> bool:
+        if job.status in (QUEUED, RUNNING):
+            return True
+        if job.status != DONE or job.generation != report_cache.generation:
+            return False
+        if not all(os.path.exists(os.path.join(job.dir, f["name"])) for f in job.result["files"]):
+            return False
+        return job.closed_range() or time.time() - job.finished_at < EXPORT_FRESH_S
+
+    def submit(self, request: ExportRequest):
+        """→ (job, reused), or (None, False) when the export queue is full."""
+        self.prune()
+        key = self.key(request)
+        for job in sorted(self.jobs.values(), key=lambda j: j.created_at, reverse=True):
+            if job.key == key and self._reusable(job):
+                return job, True
+
+        if sum(j.status in (QUEUED, RUNNING) for j in self.jobs.values()) >= EXPORT_MAX_QUEUED:
+            return None, False
+        job = ExportJob(key, request)
+        os.makedirs(job.dir, exist_ok=True)
+        self.jobs[job.id] = job
+        future = self.pool().submit(build_export, job.dir, _parse_date(request.start_date),
+                                    _parse_date(request.end_date), request.location,
+                                    request.format, request.split_by_location)
+        future.add_done_callback(lambda f: self._finish(job, f))
+        logging.info(f"📦 Export {job.id} queued: {request.model_dump()}")
+        return job, False
+
+    def _finish(self, job: ExportJob, future):
+        job.finished_at = time.time()
+        if future.cancelled():
+            job.status, job.error = FAILED, "cancelled"
+            return
+        error = future.exception()
+        if error is not None:
+            job.status, job.error = FAILED, f"{type(error).__name__}: {error}"
+            logging.error(f"Export {job.id} failed: {job.error}")
+            return
+        job.result, job.status = future.result(), DONE
+        logging.info(f"📦 Export {job.id} done: {job.result['rows']} rows in {job.result['elapsed_s']}s")
+
+    def get(self, job_id: str) -> Optional[ExportJob]:
+        return self.jobs.get(job_id)
+
+    def prune(self):
+        """Forget finished jobs past retention and remove their files (also leftovers from a restart)."""
+        cutoff = time.time() - EXPORT_RETENTION_H * 3600
+        for job in [j for j in self.jobs.values() if j.finished_at and j.finished_at < cutoff]:
+            del self.jobs[job.id]
+            shutil.rmtree(job.dir, ignore_errors=True)
+        if os.path.isdir(EXPORT_DIR):
+            for name in os.listdir(EXPORT_DIR):
+                path = os.path.join(EXPORT_DIR, name)
+                if name not in self.jobs and os.path.getmtime(path) < cutoff:
+                    shutil.rmtree(path, ignore_errors=True)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+export_manager = ExportManager()
+
+
+def shutdown_exports():
+    export_manager.shutdown()
+
+# =====================================================
+# API
+# =====================================================
+@router.post("")
+def submit_export(request: ExportRequest):
+    job, reused = export_manager.submit(request)
+    if job is None:
+        return busy_response()
+    return FastJSONResponse(job.to_dict(reused), status_code=200 if reused else 202)
+
+
+@router.get("")
+def list_exports():
+    jobs = sorted(export_manager.jobs.values(), key=lambda j: j.created_at, reverse=True)
+    return FastJSONResponse({"exports": [j.to_dict() for j in jobs]})
+
+
+@router.get("/{job_id}")
+def get_export(job_id: str):
+    job = export_manager.get(job_id)
+    if job is None:
+        return FastJSONResponse({"error": "Unknown export"}, status_code=404)
+    return FastJSONResponse(job.to_dict())
+
+
+@router.get("/{job_id}/files/{name}")
+def download_export(job_id: str, name: str):
+    job = export_manager.get(job_id)
+    if job is None or job.status != DONE:
+        return FastJSONResponse({"error": "Export not ready"}, status_code=404)
+    if name not in {f["name"] for f in job.result["files"]}:
+        return FastJSONResponse({"error": "Unknown file"}, status_code=404)
+    media_type = "application/vnd.apache.parquet" if name.endswith(".parquet") else "application/gzip"
+    return FileResponse(os.path.join(job.dir, name), media_type=media_type, filename=name)
@@ -2,74 +2,16 @@
 # 🔒 main.py – Taco Group Live Production Dashboard (FINAL LOCKED)
 # Updates: Async ERPNext Sync, Logging, Production Ready
 # =====================================================
-# =====================================================
-# 🔒 main.py – Taco Group Live Production Dashboard (FINAL LOCKED)
-# Updated: Serve frontend folder + WebSocket + APIs
-# =====================================================
-
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse
-from fastapi.staticfiles import StaticFiles
-from fastapi.middleware.cors import CORSMiddleware
 import os
-import asyncio
-import logging
-
-# =====================================================
-# APP INIT
-# =====================================================
-app = FastAPI(title="Taco Group Live Production")
-
-# CORS for LAN / other devices
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# =====================================================
-# FRONTEND FOLDER SETUP
-# =====================================================
-# Path to frontend folder (adjust if needed)
-
-frontend_path = os.path.join(os.path.dirname(__file__), "../Frontend")
-
-# Mount frontend folder as static
-app.mount("/static", StaticFiles(directory=frontend_path), name="static")
-
-# Serve index.html at root
-@app.get("/")
-async def get_dashboard():
-    file_path = os.path.join(frontend_path, "index.html")
-    if not os.path.exists(file_path):
-        return HTMLResponse("<h1>Dashboard HTML not found!</h1>", status_code=404)
-    
-    with open(file_path, "r", encoding="utf-8") as f:
-        html_content = f.read()
-    return HTMLResponse(content=html_content)
-
-# =====================================================
-# EXAMPLE WEBSOCKET (frontend will connect here)
-# =====================================================
-@app.websocket("/ws/dashboard")
-async def ws_dashboard(ws: WebSocket):
-    await ws.accept()
-    try:
-        while True:
-            await ws.receive_text()  # Just keep connection alive
-    except WebSocketDisconnect:
-        print("Client disconnected from WebSocket")
-
-import os
-import asyncio
 import logging
 from datetime import datetime, timezone
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends
-from fastapi.responses import HTMLResponse
+from typing import Optional, List, Literal
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, Request
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from sqlalchemy.orm import Session
+from sqlalchemy.exc import SQLAlchemyError
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
@@ -81,14 +23,38 @@ ERP_URL = os.getenv("ERP_URL")
 ERP_API_KEY = os.getenv("ERP_API_KEY")
 ERP_API_SECRET = os.getenv("ERP_API_SECRET")
 DATABASE_URL = os.getenv("DATABASE_URL")
+LONGPOLL_TIMEOUT = float(os.getenv("LONGPOLL_TIMEOUT_S", 25))   # max wait of /api/dashboard/changes
+SSE_KEEPALIVE = float(os.getenv("SSE_KEEPALIVE_S", 15))         # comment line to keep proxies open
 
 # =====================================================
 # Import project modules
 # =====================================================
+import clock
 from database import engine, SessionLocal, init_db
 from models import Machine, ProductionLog, ScheduledJob, ERPNextMetadata
-from erpnext_sync import update_work_order_status, get_work_orders, auto_assign_work_orders
-from report import router as report_router  # Production Report Router
+from erpnext_sync import push_work_order_status, update_work_order_statuses, get_work_orders
+from erp_guard import run_erp, erp_executor, erp_breaker, ERPBusyError
+from report import router as report_router, shutdown_reports  # Production Report Router
+from export_jobs import router as export_router, shutdown_exports  # Background export jobs
+from timeseries import router as timeseries_router, hourly_rollup, ROLLUP_INTERVAL_S
+from work_orders import router as work_orders_router  # Work-order traceability
+from broadcaster import CoalescingPublisher
+from change_feed import ChangeFeed
+from wire import WireFormat, DEFAULT_FORMAT, FastJSONResponse, dumps
+from alerts import AlertEngine, CHECKPOINT_INTERVAL as ALERT_CHECKPOINT_S
+from oee import router as oee_router, oee_engine
+from transitions import router as transitions_router, apply_status, seed_open_intervals
+from telemetry import router as telemetry_router, ingestor, MACHINE_RELOAD_S as TELEMETRY_MACHINE_RELOAD_S
+from meter_engine import router as live_router, meter_engine, credit_meters, METER_ENGINE, METER_WATCH_INTERVAL
+from supervisor import router as supervisor_router, supervisor
+import scheduler  # ERP sync, history snapshots, ScheduledJob assignment
+from query_log import router as query_log_router
+from static_assets import router as static_router
+from metrics import (
+    router as metrics_router, PrometheusMiddleware, instrument_sessions,
+    METER_TICK_SECONDS, METER_TICK_LAG, DASHBOARD_BUILD_SECONDS,
+    BROADCAST_SECONDS, BROADCAST_FRAMES, WS_CLIENTS
+)
 
 # =====================================================
 # Logging
@@ -111,12 +77,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# gzip negotiated per request via Accept-Encoding (small payloads skipped)
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+app.add_middleware(PrometheusMiddleware)
+
 app.include_router(report_router)
+app.include_router(export_router)
+app.include_router(timeseries_router)
+app.include_router(work_orders_router)
+app.include_router(oee_router)
+app.include_router(transitions_router)
+app.include_router(telemetry_router)
+app.include_router(live_router)
+app.include_router(supervisor_router)
+app.include_router(metrics_router)
+app.include_router(query_log_router)
+app.include_router(static_router)  # / and /static/* served from memory
 
 # =====================================================
 # Database setup
 # =====================================================
 init_db()
+instrument_sessions(SessionLocal)
 
 def get_db():
     db = SessionLocal()
@@ -125,45 +107,69 @@ def get_db():
     finally:
         db.close()
 
-# =====================================================
-# Serve dashboard HTML
-# =====================================================
-@app.get("/")
-async def get_dashboard():
-    file_path = os.path.join(os.path.dirname(__file__), "index.html")
-    if not os.path.exists(file_path):
-        return HTMLResponse("<h1>Dashboard HTML not found!</h1>", status_code=404)
-    with open(file_path, "r", encoding="utf-8") as f:
-        html_content = f.read()
-    return HTMLResponse(content=html_content)
-
 # =====================================================
 # WebSocket Manager
 # =====================================================
 class ConnectionManager:
-    def __init__(self):
+    def __init__(self, feed: ChangeFeed):
         self.active_connections: list[WebSocket] = []
+        self.formats: dict[WebSocket, WireFormat] = {}
+        self.feed = feed
 
-    async def connect(self, ws: WebSocket):
+    async def connect(self, ws: WebSocket, since: Optional[int] = None):
         await ws.accept()
+        fmt = self.formats[ws] = WireFormat.negotiate(ws.query_params)
+        await self.resume(ws, fmt, since)
         self.active_connections.append(ws)
 
+    async def resume(self, ws: WebSocket, fmt: WireFormat, since: Optional[int]):
+        """
+        Catch a (re)connecting client up from the change feed's ring buffer:
+        only the machines changed after `since`, or an in-memory snapshot
+        when the gap is no longer buffered. No DB access either way.
+        Loops until no new version was recorded while sending, so the
+        client is registered for live frames with no gap.
+        """
+        cursor = since
+        while cursor is None or cursor != self.feed.version:
+            payload = self.feed.since(cursor)
+            if "snapshot" in payload:
+                payload = {"locations": payload.pop("snapshot"), **payload, "resume": "snapshot"}
+            else:
+                payload["resume"] = "changes"
+            await fmt.send(ws, fmt.encode(payload))
+            BROADCAST_FRAMES.inc(kind="resume")
+            cursor = payload["version"]
+
     def disconnect(self, ws: WebSocket):
         if ws in self.active_connections:
             self.active_connections.remove(ws)
+        self.formats.pop(ws, None)
 
     async def broadcast(self, data: dict):
-        for ws in list(self.active_connections):
-            try:
-                await ws.send_json(data)
-            except Exception:
-                self.disconnect(ws)
-
-manager = ConnectionManager()
+        # Encode once per negotiated format, not once per client
+        encoded = {}
+        with BROADCAST_SECONDS.time():
+            for ws in list(self.active_connections):
+                fmt = self.formats.get(ws, DEFAULT_FORMAT)
+                if fmt.key not in encoded:
+                    encoded[fmt.key] = fmt.encode(data)
+                try:
+                    await fmt.send(ws, encoded[fmt.key])
+                except Exception:
+                    self.disconnect(ws)
+        BROADCAST_FRAMES.inc(kind="alert" if "alert" in data else "dashboard")
+
+feed = ChangeFeed()
+manager = ConnectionManager(feed)
+WS_CLIENTS.callback = lambda: len(manager.active_connections)
 
 @app.websocket("/ws/dashboard")
 async def ws_dashboard(ws: WebSocket):
-    await manager.connect(ws)
+    # ws://host/ws/dashboard?since=<last version seen> resumes a dropped session
+    since = ws.query_params.get("since", "")
+    publisher.refresh()  # one DB build if nobody was listening; otherwise a no-op
+    await manager.connect(ws, int(since) if since.isdigit() else None)
     try:
         while True:
             await ws.receive_text()  # keep connection alive
@@ -173,6 +179,7 @@ async def ws_dashboard(ws: WebSocket):
 # =====================================================
 # Dashboard Data Helpers
 # =====================================================
+@DASHBOARD_BUILD_SECONDS.timed()
 def get_dashboard_data(db: Session):
     response = []
     machines = db.query(Machine).all()
@@ -220,16 +227,73 @@ def get_dashboard_data(db: Session):
 
     return response
 
+# Coalesced dashboard frames (at most one per BROADCAST_INTERVAL_MS)
+publisher = CoalescingPublisher(manager, lambda db: {"locations": get_dashboard_data(db)}, feed=feed)
+
+# Alerts are evaluated inline on meter/status events and sent on the priority lane
+alert_engine = AlertEngine(publisher.publish_now)
+
+scheduler.on_change = publisher.mark_dirty
+
 # =====================================================
 # API Endpoints
 # =====================================================
 @app.get("/api/dashboard")
 def dashboard(db: Session = Depends(get_db)):
-    return {"locations": get_dashboard_data(db)}
+    return FastJSONResponse({"locations": get_dashboard_data(db), "version": publisher.feed.version})
+
+# =====================================================
+# Change Feed (WebSocket fallback: long-poll + SSE)
+# =====================================================
+@app.get("/api/dashboard/changes")
+async def dashboard_changes(since: Optional[int] = None, timeout: float = LONGPOLL_TIMEOUT):
+    """Changed machines after `since`; blocks up to `timeout` s when there are none yet."""
+    feed = publisher.feed
+    publisher.refresh()
+    if since is not None and feed.can_replay(since):
+        feed.listeners += 1
+        try:
+            await feed.wait(since, max(0.0, min(timeout, LONGPOLL_TIMEOUT)))
+        finally:
+            feed.listeners -= 1
+    return FastJSONResponse(feed.since(since))
+
+@app.get("/api/dashboard/stream")
+async def dashboard_stream(request: Request, since: Optional[int] = None):
+    """Server-sent events; resumes from Last-Event-ID after a reconnect."""
+    last_event_id = request.headers.get("last-event-id", "")
+    if since is None and last_event_id.isdigit():
+        since = int(last_event_id)
+    feed = publisher.feed
+    publisher.refresh()
+
+    async def events():
+        cursor = since
+        feed.listeners += 1
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                if cursor is None or cursor != feed.version:
+                    payload = feed.since(cursor)
+                    cursor = payload["version"]
+                    kind = b"snapshot" if "snapshot" in payload else b"changes"
+                    yield b"id: %d\nevent: %s\ndata: %s\n\n" % (cursor, kind, dumps(payload))
+                elif not await feed.wait(cursor, SSE_KEEPALIVE):
+                    if await request.is_disconnected():
+                        break
+                    yield b": keepalive\n\n"
+        finally:
+            feed.listeners -= 1
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.get("/api/job_queue")
-def job_queue(db: Session = Depends(get_db)):
-    work_orders = get_work_orders()
+async def job_queue():
+    try:
+        work_orders = await run_erp(get_work_orders)
+    except ERPBusyError:
+        work_orders = []
     queue = []
     for wo in work_orders:
         if wo.get("status") == "Completed":
@@ -242,18 +306,18 @@ def job_queue(db: Session = Depends(get_db)):
             "location": wo.get("custom_location"),
             "machine_id": wo.get("custom_machine_id")
         })
-    return {"queue": queue}
+    return {"queue": queue, "erp": erp_breaker.state}
 
 @app.get("/api/production_logs")
 def production_logs(db: Session = Depends(get_db), limit: int = 50):
     logs = db.query(ProductionLog).order_by(ProductionLog.timestamp.desc()).limit(limit).all()
-    return {"logs": [ {
+    return FastJSONResponse({"logs": [ {
         "machine_id": l.machine_id,
         "work_order": l.work_order,
         "pipe_size": l.pipe_size,
         "produced_qty": l.produced_qty,
         "timestamp": l.timestamp.isoformat()
-    } for l in logs ]}
+    } for l in logs ]})
 
 # =====================================================
 # Pydantic Models
@@ -265,23 +329,27 @@ class MachineAction(BaseModel):
 class MachineRename(MachineAction):
     new_name: str
 
+class BatchItem(MachineAction):
+    action: Literal["start", "pause", "stop"]
+
+class MachineBatch(BaseModel):
+    actions: List[BatchItem]
+
 # =====================================================
 # Machine Helpers
 # =====================================================
 def get_machine(db: Session, location: str, machine_id: int):
     return db.query(Machine).filter(Machine.id == machine_id, Machine.location == location).first()
 
-async def update_machine_status(db: Session, m: Machine, new_status: str):
-    m.status = new_status
-    if new_status == "running":
-        m.is_locked = True
-        m.last_tick_time = datetime.now(timezone.utc)
-        update_work_order_status(m.erpnext_work_order_id, "In Process")
-    elif new_status == "completed":
-        m.is_locked = False
-        update_work_order_status(m.erpnext_work_order_id, "Completed")
+async def update_machine_status(db: Session, m: Machine, new_status: str, cause: str = "operator"):
+    old_status = m.status
+    erp_update = apply_status(db, m, new_status, cause)
     db.commit()
-    await manager.broadcast({"locations": get_dashboard_data(db)})
+    if erp_update:
+        push_work_order_status(*erp_update)  # only once the change is committed
+    oee_engine.on_status(m)
+    alert_engine.on_status(m, old_status, new_status)
+    publisher.mark_dirty()
 
 @app.post("/api/machine/start")
 async def start_machine(data: MachineAction, db: Session = Depends(get_db)):
@@ -296,9 +364,12 @@ async def pause_machine(data: MachineAction, db: Session = Depends(get_db)):
     m = get_machine(db, data.location, data.machine_id)
     if not m:
         return {"ok": False}
-    m.status = "paused"
+    old_status = m.status
+    apply_status(db, m, "paused")
     db.commit()
-    await manager.broadcast({"locations": get_dashboard_data(db)})
+    oee_engine.on_status(m)
+    alert_engine.on_status(m, old_status, "paused")
+    publisher.mark_dirty()
     return {"ok": True}
 
 @app.post("/api/machine/stop")
@@ -309,6 +380,57 @@ async def stop_machine(data: MachineAction, db: Session = Depends(get_db)):
     await update_machine_status(db, m, "stopped")
     return {"ok": True}
 
+BATCH_STATUS = {"start": "running", "pause": "paused", "stop": "stopped"}
+
+@app.post("/api/machine/batch")
+async def machine_batch(data: MachineBatch, db: Session = Depends(get_db)):
+    """
+    Apply many start/pause/stop actions with one lookup, one commit and
+    one coalesced frame; ERP updates fan out over the ERP executor.
+    Same per-action rules as the single endpoints.
+    """
+    ids = {a.machine_id for a in data.actions}
+    machines = {m.id: m for m in db.query(Machine).filter(Machine.id.in_(ids)).all()} if ids else {}
+    results, changed, erp_updates = [], [], []
+
+    for a in data.actions:
+        result = {"machine_id": a.machine_id, "location": a.location, "action": a.action, "ok": False}
+        results.append(result)
+        m = machines.get(a.machine_id)
+        if not m or m.location != a.location:
+            result["error"] = "machine not found"
+            continue
+        if a.action == "start" and not m.work_order:
+            result["error"] = "no work order"
+            continue
+        old_status = m.status
+        erp_update = apply_status(db, m, BATCH_STATUS[a.action], cause="batch")
+        if erp_update and erp_update[0]:
+            erp_updates.append(erp_update)
+            result["erp"] = "queued"
+        changed.append((m, old_status, m.status))
+        result.update(ok=True, status=m.status)
+
+    if changed:
+        try:
+            db.commit()
+        except SQLAlchemyError as e:
+            db.rollback()
+            logging.error(f"Machine batch failed: {e}")
+            for r in results:
+                if r["ok"]:
+                    r.update(ok=False, error="transaction failed")
+                    r.pop("erp", None)
+            return {"ok": False, "results": results}
+        for m, old_status, new_status in changed:
+            oee_engine.on_status(m)
+            alert_engine.on_status(m, old_status, new_status)
+        publisher.mark_dirty()
+        if erp_updates:
+            update_work_order_statuses(erp_updates)
+
+    return {"ok": all(r["ok"] for r in results), "results": results}
+
 @app.post("/api/machine/rename")
 async def rename_machine(data: MachineRename, db: Session = Depends(get_db)):
     m = get_machine(db, data.location, data.machine_id)
@@ -316,129 +438,142 @@ async def rename_machine(data: MachineRename, db: Session = Depends(get_db)):
         return {"ok": False}
     m.name = data.new_name
     db.commit()
-    await manager.broadcast({"locations": get_dashboard_data(db)})
+    publisher.mark_dirty()  # report caches resolve names when serving; nothing to invalidate
     return {"ok": True}
 
 # =====================================================
-# Automatic Meter Counter
+# Telemetry Hooks (real counters → same engines as simulated meters)
 # =====================================================
-async def automatic_meter_counter():
-    while True:
-        db = SessionLocal()
-        try:
-            machines = db.query(Machine).filter(Machine.status == "running").all()
-            now = datetime.now(timezone.utc)
-            updated = False
-            for m in machines:
-                if not m.seconds_per_meter or not m.work_order:
-                    continue
-                if not m.last_tick_time:
-                    m.last_tick_time = now
-                    continue
-                diff = (now - m.last_tick_time).total_seconds()
-                if diff >= m.seconds_per_meter and m.produced_qty < m.target_qty:
-                    m.produced_qty += 1
-                    m.last_tick_time = now
-                    updated = True
-                    db.add(ProductionLog(
-                        machine_id=m.id,
-                        work_order=m.work_order,
-                        pipe_size=m.pipe_size,
-                        produced_qty=1,
-                        timestamp=now
-                    ))
-                    meta = db.query(ERPNextMetadata).filter(ERPNextMetadata.work_order == m.work_order).first()
-                    if meta:
-                        meta.erp_status = "In Progress"
-                        meta.last_synced = now
-                    if m.produced_qty >= m.target_qty:
-                        m.produced_qty = m.target_qty
-                        await update_machine_status(db, m, "completed")
-                        if meta:
-                            meta.erp_status = "Completed"
-            if updated:
-                db.commit()
-                await manager.broadcast({"locations": get_dashboard_data(db)})
-        except Exception as e:
-            logging.error(f"AUTO METER ERROR: {e}")
-        finally:
-            db.close()
-        await asyncio.sleep(1)
+def on_telemetry_meter(m: Machine, ts: datetime, meters: int):
+    oee_engine.on_meter(m, ts, meters)
+    alert_engine.on_meter(m, ts, meters)
+
+def on_meter_completed(m: Machine, erp_update: Optional[tuple]):
+    """A completion (meter tick / telemetry) was committed: ERP push, OEE, alerts."""
+    if erp_update:
+        push_work_order_status(*erp_update)
+    oee_engine.on_status(m)
+    alert_engine.on_status(m, "running", "completed")
+
+ingestor.on_meter = on_telemetry_meter
+ingestor.on_complete = on_meter_completed
+ingestor.on_flush = publisher.mark_dirty
 
 # =====================================================
-# Production Alerts
+# Meter Engine Hooks (board records from the engine process)
 # =====================================================
-alert_history = {}
+def on_board_meter(m, ts: float, meters: int, completed: bool):
+    at = datetime.fromtimestamp(ts, timezone.utc)
+    oee_engine.on_meter(m, at, meters)
+    if not completed:
+        alert_engine.on_meter(m, at, meters)
 
-async def production_alerts():
-    while True:
-        db = SessionLocal()
-        try:
-            machines = db.query(Machine).filter(Machine.target_qty > 0).all()
-            for m in machines:
-                if not m.work_order or m.status != "running":
-                    continue
-                percent = (m.produced_qty / m.target_qty) * 100
-                last_level = alert_history.get(m.id, 0)
-                alert_level = 0
-                message = None
-                if percent >= 100:
-                    alert_level = 3
-                    message = f"✅ Machine {m.name} COMPLETED"
-                elif percent >= 90:
-                    alert_level = 2
-                    message = f"⚠ {m.name} CRITICAL {percent:.1f}%"
-                elif percent >= 75:
-                    alert_level = 1
-                    message = f"⚠ {m.name} Warning {percent:.1f}%"
-                if alert_level > 0 and alert_level != last_level:
-                    alert_history[m.id] = alert_level
-                    await manager.broadcast({"alert": message, "machine_id": m.id, "level": alert_level})
-                elif percent < 75:
-                    alert_history[m.id] = 0
-        except Exception as e:
-            logging.error(f"ALERT LOOP ERROR: {e}")
-        finally:
-            db.close()
-        await asyncio.sleep(5)
+def on_board_status(m, old_status: str, new_status: str):
+    oee_engine.on_status(m)
+    alert_engine.on_status(m, old_status, new_status)
 
 # =====================================================
-# ERPNext Sync Loop
+# Automatic Meter Counter
 # =====================================================
-async def erpnext_sync_loop(interval: int = 10):
-    logging.info("🚀 ERPNext Sync Loop started")
-    while True:
-        try:
-            await asyncio.to_thread(auto_assign_work_orders)
-        except Exception as e:
-            logging.error(f"ERP Sync Loop error: {e}")
-        await asyncio.sleep(interval)
+async def meter_tick(db: Session) -> bool:
+    """One in-process pass over running machines (caller closes db); → True if meters were added."""
+    machines = db.query(Machine).filter(Machine.status == "running").all()
+    now = clock.now()
+
+    def on_meter(m: Machine, completing: bool):
+        oee_engine.on_meter(m, now)
+        if not completing:
+            alert_engine.on_meter(m, now)
+
+    due = credit_meters(db, machines, now, on_meter, on_meter_completed)
+    if due:
+        publisher.mark_dirty()
+    oee_engine.maybe_checkpoint()
+    return bool(due)
+
+async def automatic_meter_counter():
+    db = SessionLocal()
+    try:
+        await meter_tick(db)
+    finally:
+        db.close()
+
+def observe_meter_tick(lag: float, duration: float):
+    METER_TICK_LAG.observe(lag)
+    METER_TICK_SECONDS.observe(duration)
+
+# =====================================================
+# Background Jobs (supervisor.py)
+# =====================================================
+def register_jobs():
+    supervisor.service("dashboard_publisher", publisher.run)
+    if METER_ENGINE == "process":
+        # Tick + telemetry flush in their own process; this one follows the shared board
+        supervisor.every("meter_board_watch", METER_WATCH_INTERVAL,
+                         lambda: meter_engine.watch(on_board_meter, on_board_status, publisher.mark_dirty,
+                                                    oee_engine.maybe_checkpoint),
+                         max_runtime=5)
+    else:
+        supervisor.every("meter_tick", 1.0, automatic_meter_counter, max_runtime=10,
+                         on_done=observe_meter_tick, max_backoff=5)
+    supervisor.service("telemetry_ingestor", ingestor.run)
+    supervisor.every("telemetry_machine_ids", TELEMETRY_MACHINE_RELOAD_S, ingestor.reload_machine_ids,
+                     thread=True, max_runtime=30)
+    supervisor.every("alert_checkpoint", ALERT_CHECKPOINT_S, alert_engine.checkpoint, thread=True,
+                     max_runtime=30)
+    supervisor.every("production_rollup", ROLLUP_INTERVAL_S, hourly_rollup.run_once, thread=True,
+                     jitter=5, max_runtime=600)
+    if METER_ENGINE != "process" or meter_engine.owner:
+        scheduler.register_jobs(supervisor)  # one worker writes history / assigns jobs
 
 # =====================================================
 # Startup Event
 # =====================================================
+def seed_machines():
+    """12 machines per location when the machines table is empty."""
+    db = SessionLocal()
+    try:
+        if db.query(Machine).count() == 0:
+            locations = {"Modan": 1, "Baldeya": 100, "Al-Khraj": 200}
+            for loc, start_id in locations.items():
+                for i in range(12):
+                    db.add(Machine(
+                        id=start_id + i,
+                        location=loc,
+                        name=f"Machine {i + 1}",
+                        status="free",
+                        target_qty=100,
+                        produced_qty=0,
+                        pipe_size="20",
+                        seconds_per_meter=20
+                    ))
+            db.commit()
+    finally:
+        db.close()
+
 @app.on_event("startup")
 async def startup_event():
-    db = SessionLocal()
-    # Seed machines if none exist
-    if db.query(Machine).count() == 0:
-        locations = {"Modan": 1, "Baldeya": 100, "Al-Khraj": 200}
-        for loc, start_id in locations.items():
-            for i in range(12):
-                db.add(Machine(
-                    id=start_id + i,
-                    location=loc,
-                    name=f"Machine {i + 1}",
-                    status="free",
-                    target_qty=100,
-                    produced_qty=0,
-                    pipe_size="20",
-                    seconds_per_meter=20
-                ))
-        db.commit()
-    db.close()
-
-    # Start background async tasks
-    asyncio.create_task(automatic_meter_counter())
-    asyncio.create_task(production_alerts())
-    asyncio.create_task(erpnext_sync_loop())
+    seed_machines()
+
+    alert_engine.load()
+    oee_engine.load()
+    seed_open_intervals()
+    ingestor.load()
+
+    if METER_ENGINE == "process":
+        meter_engine.start()
+        ingestor.forward = meter_engine.forward  # every worker: the engine owns produced_qty
+
+    # Start background jobs
+    register_jobs()
+    supervisor.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await supervisor.stop()
+    meter_engine.stop()
+    oee_engine.checkpoint()
+    alert_engine.checkpoint()
+    erp_executor.shutdown()
+    shutdown_reports()
+    shutdown_exports()
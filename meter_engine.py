@@ -0,0 +1,601 @@
+# =====================================================
+# meter_engine.py – Out-of-Process Meter Engine
+# The 1 s meter tick and the telemetry flush run in their own
+# process, so HTTP / WebSocket load can't delay a tick and ticks
+# don't hold the server's GIL. The engine publishes every machine
+# as a fixed-layout record in shared memory (MachineBoard); the
+# web process reads counters straight from it (no DB query, no
+# serialization) and turns new meters / completions into the
+# in-process OEE, alert and dashboard hooks. Telemetry received
+# by any worker reaches the engine through its relay socket.
+# =====================================================
+import os
+import sys
+import time
+import signal
+import struct
+import asyncio
+import logging
+import tempfile
+import threading
+import multiprocessing
+from multiprocessing.connection import Client, Listener
+from datetime import timezone
+from multiprocessing import shared_memory
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi import APIRouter
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+import clock
+from database import SessionLocal
+from models import Machine, ProductionLog, ERPNextMetadata
+from supervisor import Supervisor
+from transitions import STATUSES, apply_status
+from wire import FastJSONResponse
+
+METER_ENGINE = os.getenv("METER_ENGINE", "inprocess")                # inprocess | process
+METER_BOARD_NAME = os.getenv("METER_BOARD_NAME", "taco_meter_board")  # shared by every web worker
+METER_BOARD_CAPACITY = int(os.getenv("METER_BOARD_CAPACITY", 1024))   # machine records
+METER_WATCH_INTERVAL = float(os.getenv("METER_WATCH_MS", 200)) / 1000  # web-side board polling
+ENGINE_STALE_S = 5.0       # no heartbeat for this long → engine considered dead
+ENGINE_RESTART_S = 5.0     # minimum spacing between engine restarts
+STOP_EXIT_CODES = (0, -signal.SIGTERM, -signal.SIGINT)  # asked to stop (service going down) → no restart
+
+# =====================================================
+# SHARED TICK (engine process, or in-process via main.meter_tick)
+# =====================================================
+def credit_meters(db: Session, machines: List[Machine], now,
+                  on_meter: Callable[[Machine, bool], None],
+                  on_complete: Callable[[Machine, Optional[tuple]], None]) -> List[Machine]:
+    """
+    Add one meter to every running machine whose seconds_per_meter has
+    elapsed; machines reaching target are completed in the same
+    transaction. One commit, then the hooks: on_meter(m, completing) for
+    each metered machine, on_complete(m, erp_update) for each completed
+    one (ERP push + side effects). → the metered machines.
+    """
+    from telemetry import ingestor
+
+    due = []
+    for m in machines:
+        if not m.seconds_per_meter or not m.work_order:
+            continue
+        if ingestor.is_live(m.id):
+            continue  # real counter reporting → no simulated meters
+        if not m.last_tick_time:
+            m.last_tick_time = now
+            continue
+        last_tick = m.last_tick_time
+        if last_tick.tzinfo is None:  # SQLite returns naive datetimes
+            last_tick = last_tick.replace(tzinfo=timezone.utc)
+        diff = (now - last_tick).total_seconds()
+        if diff >= m.seconds_per_meter and m.produced_qty < m.target_qty:
+            due.append(m)
+
+    # ERP metadata of every metered work order in one query (first row per work order)
+    metadata = {}
+    if due:
+        for meta in db.query(ERPNextMetadata).filter(
+            ERPNextMetadata.work_order.in_({m.work_order for m in due})
+        ).order_by(ERPNextMetadata.id):
+            metadata.setdefault(meta.work_order, meta)
+
+    logs = []
+    for m in due:
+        m.produced_qty += 1
+        m.last_tick_time = now
+        logs.append({
+            "machine_id": m.id,
+            "location": m.location,
+            "work_order": m.work_order,
+            "pipe_size": m.pipe_size,
+            "target_qty": m.target_qty,
+            "produced_qty": 1,
+            "remaining_qty": m.remaining(),
+            "status": m.status,
+            "timestamp": now
+        })
+
+    completed = []
+    for m in due:
+        meta = metadata.get(m.work_order)
+        if meta:
+            meta.erp_status = "In Progress"
+            meta.last_synced = now
+        if m.produced_qty >= m.target_qty:
+            m.produced_qty = m.target_qty
+            completed.append((m, apply_status(db, m, "completed", "meter")))
+            if meta:
+                meta.erp_status = "Completed"
+    if due:
+        # One executemany and one commit, issued last: the write lock is taken only for the
+        # commit, and meters, logs and completions land together or not at all
+        db.execute(insert(ProductionLog), logs)
+        db.commit()
+    done = {m.id for m, _ in completed}
+    for m in due:
+        on_meter(m, m.id in done)
+    for m, erp_update in completed:
+        on_complete(m, erp_update)
+    return due
+
+# =====================================================
+# MACHINE BOARD (shared memory, one writer)
+# Header + fixed 136-byte records. Each record carries its own
+# sequence number (seqlock): the writer makes it odd, writes the
+# body, makes it even; readers retry while it is odd or moved.
+# =====================================================
+BOARD_MAGIC = 0x54414331  # "TAC1"
+HEADER = struct.Struct("<QIIIIQddd16s")  # seq, magic, capacity, count, pid, ticks, heartbeat, tick_s, lag_s, key
+RECORD = struct.Struct("<QiBB2xiifddQI32s16s32s")
+# seq, machine_id, status, live, produced_qty, target_qty, seconds_per_meter,
+# last_meter, updated, meters (credited since engine start), completions, work_order, location, name
+SEQ = struct.Struct("<Q")
+NO_STATUS = 255
+
+
+def _text(value: Optional[str], size: int) -> bytes:
+    return (value or "").encode("utf-8")[:size]
+
+
+def _untext(raw: bytes) -> str:
+    return raw.rstrip(b"\0").decode("utf-8", "ignore")
+
+
+def _attach(name: str, own_child: bool) -> shared_memory.SharedMemory:
+    shm = shared_memory.SharedMemory(name=name)
+    if not own_child:
+        # Another worker's segment: its resource tracker must not unlink it when this
+        # process exits (Python < 3.13). The engine shares the owner's tracker instead.
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+    return shm
+
+
+class MachineBoard:
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        self.shm = shm
+        self.buf = shm.buf
+        self.owner = owner
+        self.slots: Dict[int, int] = {}  # writer: machine id → record index
+
+    @classmethod
+    def create(cls, name: str = METER_BOARD_NAME, capacity: int = METER_BOARD_CAPACITY) -> "MachineBoard":
+        shm = shared_memory.SharedMemory(name=name, create=True, size=HEADER.size + capacity * RECORD.size)
+        board = cls(shm, owner=True)
+        HEADER.pack_into(board.buf, 0, 0, BOARD_MAGIC, capacity, 0, 0, 0, 0.0, 0.0, 0.0, os.urandom(16))
+        return board
+
+    @classmethod
+    def attach(cls, name: str = METER_BOARD_NAME, own_child: bool = False) -> "MachineBoard":
+        board = cls(_attach(name, own_child), owner=False)
+        if board.header()["magic"] != BOARD_MAGIC:
+            board.close()
+            raise ValueError(f"Shared memory '{name}' is not a machine board")
+        return board
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+    # -------------------------------
+    # WRITER (engine process)
+    # -------------------------------
+    def _write_header(self, **fields):
+        h = self.header()
+        h.update(fields)
+        seq = SEQ.unpack_from(self.buf, 0)[0]
+        SEQ.pack_into(self.buf, 0, seq + 1)
+        HEADER.pack_into(self.buf, 0, seq + 1, BOARD_MAGIC, h["capacity"], h["count"], h["pid"],
+                         h["ticks"], h["heartbeat"], h["tick_s"], h["lag_s"], h["key"])
+        SEQ.pack_into(self.buf, 0, seq + 2)
+
+    def beat(self, ticks: int, tick_s: float, lag_s: float):
+        self._write_header(pid=os.getpid(), ticks=ticks, heartbeat=time.time(), tick_s=tick_s, lag_s=lag_s)
+
+    def publish(self, m: Machine, meters: int, completions: int, last_meter: float, live: bool):
+        slot = self.slots.get(m.id)
+        if slot is None:
+            slot = len(self.slots)
+            if slot >= self.header()["capacity"]:
+                return  # board full (raise METER_BOARD_CAPACITY)
+            self.slots[m.id] = slot
+            self._write_header(count=len(self.slots))
+        off = HEADER.size + slot * RECORD.size
+        seq = SEQ.unpack_from(self.buf, off)[0]
+        SEQ.pack_into(self.buf, off, seq + 1)
+        RECORD.pack_into(
+            self.buf, off, seq + 1, m.id,
+            STATUSES.index(m.status) if m.status in STATUSES else NO_STATUS, bool(live),
+            m.produced_qty or 0, m.target_qty or 0, m.seconds_per_meter or 0.0,
+            last_meter, time.time(), meters, completions,
+            _text(m.work_order, 32), _text(m.location, 16), _text(m.name, 32)
+        )
+        SEQ.pack_into(self.buf, off, seq + 2)
+
+    # -------------------------------
+    # READERS (any process, no locks, no DB)
+    # -------------------------------
+    def _consistent(self, off: int, layout: struct.Struct) -> Optional[tuple]:
+        for _ in range(1000):
+            seq = SEQ.unpack_from(self.buf, off)[0]
+            if seq & 1:
+                continue  # writer mid-record
+            values = layout.unpack_from(self.buf, off)
+            if SEQ.unpack_from(self.buf, off)[0] == seq:
+                return values
+        return None
+
+    def header(self) -> Dict:
+        values = self._consistent(0, HEADER) or HEADER.unpack_from(self.buf, 0)
+        return dict(zip(("seq", "magic", "capacity", "count", "pid", "ticks", "heartbeat", "tick_s", "lag_s",
+                         "key"), values))
+
+    def read(self) -> Dict[int, "LiveMachine"]:
+        out = {}
+        for slot in range(self.header()["count"]):
+            values = self._consistent(HEADER.size + slot * RECORD.size, RECORD)
+            if values is not None:
+                rec = LiveMachine(values)
+                out[rec.id] = rec
+        return out
+
+
+class LiveMachine:
+    """One board record; quacks like Machine for the OEE / alert hooks."""
+    __slots__ = ("id", "status", "live", "produced_qty", "target_qty", "seconds_per_meter",
+                 "last_meter", "updated", "meters", "completions", "work_order", "location", "name")
+
+    def __init__(self, values: tuple):
+        (_, self.id, status, live, self.produced_qty, self.target_qty, self.seconds_per_meter,
+         self.last_meter, self.updated, self.meters, self.completions, wo, loc, name) = values
+        self.status = STATUSES[status] if status < len(STATUSES) else None
+        self.live = bool(live)
+        self.work_order, self.location, self.name = _untext(wo), _untext(loc), _untext(name)
+
+    def remaining(self) -> int:
+        return max(0, (self.target_qty or 0) - (self.produced_qty or 0))
+
+    def as_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "location": self.location,
+            "status": self.status,
+            "work_order": self.work_order or None,
+            "produced_qty": self.produced_qty,
+            "target_qty": self.target_qty,
+            "remaining_qty": self.remaining(),
+            "seconds_per_meter": self.seconds_per_meter,
+            "telemetry_live": self.live,
+            "last_meter": self.last_meter or None,
+            "updated": self.updated,
+        }
+
+# =====================================================
+# TELEMETRY RELAY (any web worker → engine)
+# The owner's inbox queue only reaches its own child, so the
+# engine also listens on a local socket named after the board;
+# the connection key sits in the board header.
+# =====================================================
+def relay_address(board_name: str) -> Tuple[str, str]:
+    if sys.platform == "win32":
+        return rf"\\.\pipe\{board_name}", "AF_PIPE"
+    return os.path.join(tempfile.gettempdir(), f"{board_name}.sock"), "AF_UNIX"
+
+
+class TelemetryRelay:
+    """Engine side: readings from every connected worker → on_readings, on the event loop."""
+
+    def __init__(self, board_name: str, key: bytes, on_readings: Callable[[list], None]):
+        address, family = relay_address(board_name)
+        if family == "AF_UNIX" and os.path.exists(address):
+            os.unlink(address)  # left behind by a crashed engine
+        self.listener = Listener(address, family, authkey=key)
+        self.on_readings = on_readings
+        self.loop = asyncio.get_running_loop()
+        threading.Thread(target=self._accept, name="telemetry-relay", daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn = self.listener.accept()
+            except multiprocessing.AuthenticationError:
+                continue
+            except OSError:
+                return  # listener closed
+            threading.Thread(target=self._receive, args=(conn,), daemon=True).start()
+
+    def _receive(self, conn):
+        with conn:
+            while True:
+                try:
+                    readings = conn.recv()
+                except (EOFError, OSError):
+                    return
+                self.loop.call_soon_threadsafe(self.on_readings, readings)
+
+    def close(self):
+        self.listener.close()
+
+# =====================================================
+# ENGINE PROCESS
+# =====================================================
+class MeterEngine:
+    def __init__(self, board: MachineBoard):
+        self.board = board
+        self.meters: Dict[int, int] = {}       # cumulative, published
+        self.completions: Dict[int, int] = {}
+        self.last_meter: Dict[int, float] = {}
+        self.ticks = 0
+
+    def _credit(self, m: Machine, meters: int, at):
+        self.meters[m.id] = self.meters.get(m.id, 0) + meters
+        self.last_meter[m.id] = at.timestamp() if at else time.time()
+
+    def _completed(self, m: Machine, erp_update: Optional[tuple]):
+        """After the completion is committed: ERP push + board counter."""
+        from erpnext_sync import push_work_order_status
+
+        if erp_update:
+            push_work_order_status(*erp_update)
+        self.completions[m.id] = self.completions.get(m.id, 0) + 1
+
+    def publish(self, machines: List[Machine]):
+        from telemetry import ingestor
+
+        for m in machines:
+            self.board.publish(m, self.meters.get(m.id, 0), self.completions.get(m.id, 0),
+                               self.last_meter.get(m.id, 0.0), ingestor.is_live(m.id))
+
+    async def tick(self):
+        db = SessionLocal()
+        try:
+            machines = db.query(Machine).all()
+            now = clock.now()
+            credit_meters(db, [m for m in machines if m.status == "running"], now,
+                          lambda m, completing: self._credit(m, 1, now), self._completed)
+            self.publish(machines)  # every machine: operator / ERP changes show up within a tick
+        finally:
+            db.close()
+
+    def beat(self, lag: float, duration: float):
+        """Supervisor on_done for the tick job: heartbeat + timings into the board header."""
+        self.ticks += 1
+        self.board.beat(self.ticks, duration, lag)
+
+    async def run_inbox(self, inbox):
+        from telemetry import ingestor
+
+        loop = asyncio.get_running_loop()
+        while True:
+            readings = await loop.run_in_executor(None, inbox.get)
+            if readings is None:
+                return
+            ingestor.accept(readings)
+
+
+async def _engine(board_name: str, inbox):
+    from telemetry import ingestor
+
+    board = MachineBoard.attach(board_name, own_child=True)
+    engine = MeterEngine(board)
+    touched: Dict[int, Machine] = {}
+
+    def on_meter(m, ts, meters):
+        engine._credit(m, meters, ts)
+        touched[m.id] = m
+
+    def on_complete(m, erp_update):
+        engine._completed(m, erp_update)
+        touched[m.id] = m
+
+    def on_flush():
+        engine.publish(list(touched.values()))
+        touched.clear()
+
+    ingestor.on_meter, ingestor.on_complete, ingestor.on_flush = on_meter, on_complete, on_flush
+    relay = TelemetryRelay(board_name, board.header()["key"], ingestor.accept)
+    logging.info(f"⚙️ Meter engine running (pid {os.getpid()}, board '{board_name}')")
+    jobs = Supervisor()
+    jobs.every("meter_tick", 1.0, engine.tick, max_runtime=ENGINE_STALE_S, on_done=engine.beat,
+               max_backoff=ENGINE_STALE_S / 2)  # keep beating while a tick keeps failing
+    jobs.service("telemetry_ingestor", ingestor.run)
+    jobs.start()
+    try:
+        await engine.run_inbox(inbox)  # returns on shutdown sentinel
+    finally:
+        await jobs.stop()
+        relay.close()
+        board.close()
+
+
+def _engine_main(board_name: str, inbox):
+    # Ctrl+C reaches the whole process group: the server stops the engine itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    asyncio.run(_engine(board_name, inbox))
+
+# =====================================================
+# WEB PROCESS
+# =====================================================
+class MeterEngineClient:
+    """
+    Owns the board and the engine process (first web worker to start), or
+    attaches read-only when another worker already owns a live board.
+    """
+
+    def __init__(self, name: str = METER_BOARD_NAME):
+        self.name = name
+        self.board: Optional[MachineBoard] = None
+        self.process = None
+        self.inbox = None
+        self.relay = None  # non-owner: connection to the engine's relay socket
+        self.restarts = 0
+        self._last_start = 0.0
+        self._seen: Dict[int, LiveMachine] = {}
+        self._ticks = 0
+
+    @property
+    def owner(self) -> bool:
+        return bool(self.board and self.board.owner)
+
+    def start(self):
+        try:
+            self.board = MachineBoard.create(self.name)
+        except FileExistsError:
+            board = MachineBoard.attach(self.name)
+            if time.time() - board.header()["heartbeat"] < ENGINE_STALE_S:
+                self.board = board
+                logging.info(f"⚙️ Meter board '{self.name}' attached (engine pid {board.header()['pid']})")
+                return
+            # Left behind by a crashed server: take it over
+            board.owner = True
+            board.close()
+            self.board = MachineBoard.create(self.name)
+        self._spawn()
+
+    def _spawn(self):
+        ctx = multiprocessing.get_context("spawn")  # never fork the running server
+        self.inbox = ctx.Queue()
+        self.process = ctx.Process(target=_engine_main, args=(self.name, self.inbox),
+                                   name="meter-engine", daemon=True)
+        self.process.start()
+        self._last_start = time.monotonic()
+
+    def stop(self):
+        if self.process is not None:
+            if self.process.is_alive():
+                self.inbox.put(None)
+                self.process.join(timeout=5)
+            if self.process.is_alive():
+                self.process.terminate()
+            self.inbox.close()
+            self.inbox.join_thread()
+            self.process = None
+        self._close_relay()
+        if self.board is not None:
+            self.board.close()
+            self.board = None
+
+    def forward(self, readings):
+        """
+        telemetry.ingestor.forward (every worker): deduplicated readings →
+        engine process. Raises when the engine can't be reached.
+        """
+        if self.owner:
+            if self.inbox is not None:
+                self.inbox.put(readings)
+            return
+        try:
+            if self.relay is None:
+                address, family = relay_address(self.name)
+                self.relay = Client(address, family, authkey=self.board.header()["key"])
+            self.relay.send(readings)
+        except Exception:
+            self._close_relay()  # engine restarting: reconnect on the next batch
+            raise
+
+    def _close_relay(self):
+        if self.relay is not None:
+            self.relay.close()
+            self.relay = None
+
+    def healthy(self) -> bool:
+        return self.board is not None and time.time() - self.board.header()["heartbeat"] < ENGINE_STALE_S
+
+    def live(self) -> List[Dict]:
+        return [m.as_dict() for _, m in sorted(self.board.read().items())] if self.board else []
+
+    # -------------------------------
+    # WATCHER (board → in-process hooks)
+    # -------------------------------
+    def poll(self, on_meter: Callable, on_status: Callable) -> bool:
+        """Diff the board against the last read; → True if anything changed."""
+        from metrics import METER_TICK_SECONDS, METER_TICK_LAG
+
+        header = self.board.header()
+        if header["ticks"] != self._ticks:
+            if header["ticks"] > self._ticks:
+                METER_TICK_SECONDS.observe(header["tick_s"])
+                METER_TICK_LAG.observe(header["lag_s"])
+            self._ticks = header["ticks"]
+
+        changed = False
+        current = self.board.read()
+        for mid, rec in current.items():
+            prev = self._seen.get(mid)
+            if prev is None or rec.meters < prev.meters:  # first read / engine restarted
+                changed = changed or prev is None
+                continue
+            completed = rec.completions > prev.completions
+            if rec.meters > prev.meters:
+                on_meter(rec, rec.last_meter, rec.meters - prev.meters, completed)
+            if completed:
+                on_status(rec, "running", "completed")
+            if (rec.meters, rec.completions, rec.status, rec.produced_qty, rec.target_qty,
+                    rec.work_order, rec.name) != (prev.meters, prev.completions, prev.status,
+                                                  prev.produced_qty, prev.target_qty, prev.work_order, prev.name):
+                changed = True
+        self._seen = current
+        return changed
+
+    async def watch(self, on_meter: Callable, on_status: Callable, on_change: Callable[[], None],
+                    on_idle: Callable[[], None] = None):
+        """One watcher pass (supervised every METER_WATCH_MS): board → hooks, revive a crashed engine."""
+        if self.board is None:  # stop() closes the board
+            return
+        if self.poll(on_meter, on_status):
+            on_change()
+        if on_idle:
+            on_idle()
+        if (self.owner and self.process is not None and not self.process.is_alive()
+                and time.monotonic() - self._last_start >= ENGINE_RESTART_S):
+            code = self.process.exitcode
+            if code in STOP_EXIT_CODES:
+                logging.warning(f"Meter engine stopped (code {code}); not restarting")
+                self.process = None
+            else:
+                self.restarts += 1
+                logging.error(f"Meter engine exited (code {code}), restarting (#{self.restarts})")
+                self._spawn()
+
+
+meter_engine = MeterEngineClient()
+
+# =====================================================
+# API
+# =====================================================
+router = APIRouter(prefix="/api/live", tags=["Live Counters"])
+
+
+@router.get("")
+def live_counters():
+    """Machine counters straight from shared memory (no DB query)."""
+    if meter_engine.board is None:
+        return FastJSONResponse({"error": "Meter engine runs in-process (METER_ENGINE=inprocess)"},
+                                status_code=404)
+    header = meter_engine.board.header()
+    return FastJSONResponse({
+        "engine": {
+            "pid": header["pid"],
+            "owner": meter_engine.owner,
+            "healthy": meter_engine.healthy(),
+            "ticks": header["ticks"],
+            "heartbeat": header["heartbeat"],
+            "tick_ms": round(header["tick_s"] * 1000, 2),
+            "lag_ms": round(header["lag_s"] * 1000, 2),
+            "restarts": meter_engine.restarts,
+        },
+        "machines": meter_engine.live(),
+    })
@@ -0,0 +1,254 @@
+# =====================================================
+# metrics.py – Prometheus-Style Instrumentation
+# Counters / gauges / histograms rendered at GET /metrics
+# (text exposition format 0.0.4). Recording is a dict lookup
+# + bisect; callback gauges are only evaluated on scrape.
+# =====================================================
+import time
+import threading
+from bisect import bisect_left
+from functools import wraps
+from typing import Callable, Dict, Iterable, Tuple
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    """Label values escape backslash, double quote and newline (text format 0.0.4)."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+# =====================================================
+# METRIC TYPES
+# =====================================================
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, doc: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(labels.get(n, "") for n in self.label_names)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+
+    def _snapshot(self, values: Dict, copy=None) -> list:
+        """Items copied under the lock: recorders on other threads may add label sets mid-scrape."""
+        with self._lock:
+            return [(k, copy(v) if copy else v) for k, v in values.items()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, doc, labels=()):
+        super().__init__(name, doc, labels)
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = self.header()
+        for key, v in sorted(self._snapshot(self.values)):
+            lines.append(f"{self.name}{_fmt_labels(self.label_names, key)} {_fmt_value(v)}")
+        return lines
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, doc, labels=(), callback: Callable[[], float] = None):
+        super().__init__(name, doc, labels)
+        self.values: Dict[Tuple, float] = {}
+        self.callback = callback  # evaluated at scrape time only
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = value
+
+    def render(self):
+        lines = self.header()
+        if self.callback is not None:
+            lines.append(f"{self.name} {_fmt_value(self.callback())}")
+        for key, v in sorted(self._snapshot(self.values)):
+            lines.append(f"{self.name}{_fmt_labels(self.label_names, key)} {_fmt_value(v)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, doc, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.series: Dict[Tuple, list] = {}  # key → [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            s = self.series.get(key)
+            if s is None:
+                s = self.series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            s[idx] += 1
+            s[-2] += value
+            s[-1] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def timed(self, **labels):
+        """Decorator for sync functions."""
+        def deco(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - start, **labels)
+            return wrapper
+        return deco
+
+    def render(self):
+        lines = self.header()
+        for key, s in sorted(self._snapshot(self.series, list)):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), s[:-2]):
+                cumulative += count
+                le = f'le="{_fmt_value(bound) if bound != float("inf") else "+Inf"}"'
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.label_names, key)} {_fmt_value(s[-2])}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.label_names, key)} {s[-1]}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, hist: Histogram, labels: Dict):
+        self.hist = hist
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+# =====================================================
+# REGISTRY
+# =====================================================
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric: _Metric):
+        self.metrics.append(metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# =====================================================
+# HOT-PATH METRICS
+# =====================================================
+METER_TICK_SECONDS = Histogram("meter_tick_duration_seconds", "automatic_meter_counter iteration duration")
+METER_TICK_LAG = Histogram("meter_tick_lag_seconds", "Delay of a meter tick behind its 1 s schedule")
+DASHBOARD_BUILD_SECONDS = Histogram("dashboard_build_seconds", "get_dashboard_data build time")
+BROADCAST_SECONDS = Histogram("broadcast_fanout_seconds", "Time to send one frame to all WebSocket clients")
+BROADCAST_FRAMES = Counter("broadcast_frames_total", "WebSocket frames broadcast", ("kind",))
+WS_CLIENTS = Gauge("websocket_clients", "Connected dashboard WebSocket clients")
+ERP_SECONDS = Histogram("erp_request_duration_seconds", "ERPNext call latency", ("op",))
+ERP_ERRORS = Counter("erp_errors_total", "ERPNext call failures", ("op",))
+ERP_CIRCUIT = Gauge("erp_circuit_state", "ERPNext circuit breaker (0 closed, 1 half-open, 2 open)")
+ERP_PENDING = Gauge("erp_executor_pending", "ERP jobs queued or running on the ERP executor")
+DB_COMMIT_SECONDS = Histogram("db_commit_duration_seconds", "SQLAlchemy session commit latency (incl. flush)")
+HTTP_SECONDS = Histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route", "status"))
+JOB_SECONDS = Histogram("job_duration_seconds", "Supervised background job run duration", ("job",))
+JOB_LAG = Histogram("job_lag_seconds", "Delay of a supervised job run behind its fixed-rate schedule", ("job",))
+JOB_FAILURES = Counter("job_failures_total", "Supervised job failures / timeouts / service exits", ("job", "reason"))
+
+# =====================================================
+# DB COMMIT TIMING (session events)
+# =====================================================
+def instrument_sessions(session_factory):
+    from sqlalchemy import event
+
+    @event.listens_for(session_factory, "before_commit")
+    def _before_commit(session):
+        session.info["commit_started"] = time.perf_counter()
+
+    @event.listens_for(session_factory, "after_commit")
+    def _after_commit(session):
+        started = session.info.pop("commit_started", None)
+        if started is not None:
+            DB_COMMIT_SECONDS.observe(time.perf_counter() - started)
+
+# =====================================================
+# HTTP MIDDLEWARE (pure ASGI, labels by route template)
+# =====================================================
+class PrometheusMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            HTTP_SECONDS.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=status["code"]
+            )
+
+# =====================================================
+# ENDPOINT
+# =====================================================
+router = APIRouter(tags=["Monitoring"])
+
+
+@router.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
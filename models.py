@@ -3,7 +3,7 @@
 # Steps 1 → 43 FULLY UPDATED & ERPNext Ready
 # =====================================================
 
-from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, Index
+from sqlalchemy import Column, Integer, String, DateTime, Float, Boolean, ForeignKey, Index, UniqueConstraint
 from database import Base
 from datetime import datetime, timezone
 
@@ -25,6 +25,7 @@ class Machine(Base):
     work_order = Column(String, nullable=True, default="")
     pipe_size = Column(String, nullable=True, default="")
     erpnext_work_order_id = Column(String, nullable=True, default="")
+    is_locked = Column(Boolean, nullable=False, default=False)
 
     # -------------------------------
     # HELPER METHODS
@@ -111,9 +112,148 @@ class ScheduledJob(Base):
     timestamp = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
 
 
+# =====================================================
+# ALERT STATE (persisted so restarts don't re-fire alerts; one row per
+# machine, rule and work order of the machine's current job)
+# =====================================================
+class AlertState(Base):
+    __tablename__ = "alert_state"
+    __table_args__ = (
+        UniqueConstraint("machine_id", "rule", "work_order", name="uq_alert_state_machine_rule_wo"),
+        {"extend_existing": True}
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    machine_id = Column(Integer, ForeignKey("machines.id"), nullable=False, index=True)
+    rule = Column(String, nullable=False)  # progress | stall | rate_drop
+    level = Column(Integer, nullable=False, default=0)
+    work_order = Column(String, nullable=True)
+    message = Column(String, nullable=True)
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+
+# =====================================================
+# OEE HOURLY BUCKETS (checkpoint of the in-memory OEE engine)
+# =====================================================
+class OEEHourly(Base):
+    __tablename__ = "oee_hourly"
+    __table_args__ = (
+        UniqueConstraint("machine_id", "hour", name="uq_oee_hourly_machine_hour"),
+        {"extend_existing": True}
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    machine_id = Column(Integer, ForeignKey("machines.id"), nullable=False, index=True)
+    hour = Column(Integer, nullable=False, index=True)  # epoch hour (unix seconds // 3600)
+    running_s = Column(Float, nullable=False, default=0)
+    planned_s = Column(Float, nullable=False, default=0)
+    meters = Column(Integer, nullable=False, default=0)
+    ideal_s = Column(Float, nullable=False, default=0)
+
+
+# =====================================================
+# OEE MINUTE BUCKETS (window edges; kept for OEE_MINUTE_RETENTION_H)
+# =====================================================
+class OEEMinute(Base):
+    __tablename__ = "oee_minute"
+    __table_args__ = (
+        UniqueConstraint("machine_id", "minute", name="uq_oee_minute_machine_minute"),
+        {"extend_existing": True}
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    machine_id = Column(Integer, ForeignKey("machines.id"), nullable=False, index=True)
+    minute = Column(Integer, nullable=False, index=True)  # epoch minute (unix seconds // 60)
+    running_s = Column(Float, nullable=False, default=0)
+    planned_s = Column(Float, nullable=False, default=0)
+    meters = Column(Integer, nullable=False, default=0)
+    ideal_s = Column(Float, nullable=False, default=0)
+
+
+# =====================================================
+# PRODUCTION HOURLY ROLLUP (closed hours of production_logs)
+# =====================================================
+class ProductionHourly(Base):
+    __tablename__ = "production_hourly"
+    __table_args__ = (
+        UniqueConstraint("machine_id", "hour", name="uq_production_hourly"),
+        {"extend_existing": True}
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    machine_id = Column(Integer, ForeignKey("machines.id"), nullable=False)
+    location = Column(String, nullable=False)
+    hour = Column(Integer, nullable=False)  # epoch hour (unix seconds // 3600)
+    meters = Column(Integer, nullable=False, default=0)
+
+
+# =====================================================
+# TELEMETRY COUNTER STATE (idempotent ingestion across restarts)
+# =====================================================
+class TelemetryState(Base):
+    __tablename__ = "telemetry_state"
+    __table_args__ = {"extend_existing": True}
+
+    machine_id = Column(Integer, ForeignKey("machines.id"), primary_key=True)
+    last_seq = Column(Integer, nullable=False, default=0)
+    last_length = Column(Float, nullable=False, default=0)  # cumulative counter (meters)
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+
+# =====================================================
+# MACHINE STATE TRANSITIONS (append-only event log)
+# =====================================================
+class MachineTransition(Base):
+    __tablename__ = "machine_transitions"
+    __table_args__ = {"extend_existing": True}
+
+    id = Column(Integer, primary_key=True, index=True)
+    machine_id = Column(Integer, ForeignKey("machines.id"), nullable=False)
+    location = Column(String, nullable=False)
+    from_status = Column(String, nullable=True)  # None = first observation
+    to_status = Column(String, nullable=False)
+    work_order = Column(String, nullable=True)
+    cause = Column(String, nullable=True)        # operator | batch | meter | erp_assign | scheduled_job | seed
+    at = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+
+
+# =====================================================
+# STATE INTERVALS (interval index over the transition log)
+# One row per stay in a status; end_ts NULL = still in it
+# =====================================================
+class StateInterval(Base):
+    __tablename__ = "machine_state_intervals"
+    __table_args__ = {"extend_existing": True}
+
+    id = Column(Integer, primary_key=True, index=True)
+    machine_id = Column(Integer, ForeignKey("machines.id"), nullable=False)
+    location = Column(String, nullable=False)
+    status = Column(String, nullable=False)
+    work_order = Column(String, nullable=True)
+    start_ts = Column(Float, nullable=False)  # unix seconds
+    end_ts = Column(Float, nullable=True)
+
+
 # =====================================================
 # INDEXING FOR PERFORMANCE
 # =====================================================
 Index("idx_machine_work_order", Machine.work_order)
 Index("idx_erp_metadata_work_order", ERPNextMetadata.work_order)
-Index("idx_production_log_location", ProductionLog.location)
\ No newline at end of file
+Index("idx_scheduled_job_work_order", ScheduledJob.work_order)
+Index("idx_production_log_location", ProductionLog.location)
+# Report day buckets + covering index for time-series GROUP BY over raw logs
+Index("idx_production_log_ts_cover", ProductionLog.timestamp, ProductionLog.machine_id,
+      ProductionLog.location, ProductionLog.produced_qty)
+# Work-order trace + time-series: every read of one work order is an index range scan
+Index("idx_production_log_work_order_cover", ProductionLog.work_order, ProductionLog.timestamp,
+      ProductionLog.machine_id, ProductionLog.produced_qty)
+Index("idx_production_history_work_order_ts", ProductionHistory.work_order, ProductionHistory.timestamp,
+      ProductionHistory.machine_id, ProductionHistory.status, ProductionHistory.produced_qty)
+Index("idx_production_hourly_cover", ProductionHourly.hour, ProductionHourly.machine_id,
+      ProductionHourly.location, ProductionHourly.meters)
+Index("idx_transition_machine_at", MachineTransition.machine_id, MachineTransition.at)
+Index("idx_state_interval_machine_end", StateInterval.machine_id, StateInterval.end_ts)
+Index("idx_state_interval_end", StateInterval.end_ts)
+Index("idx_state_interval_start", StateInterval.start_ts)
+Index("idx_transition_work_order_at", MachineTransition.work_order, MachineTransition.at)
+Index("idx_state_interval_work_order", StateInterval.work_order, StateInterval.start_ts)
@@ -0,0 +1,345 @@
+# =====================================================
+# oee.py – Incremental OEE Metrics Engine
+# Availability / Performance / Throughput per machine,
+# location and shift from status transitions + meter events
+# Window queries answer from pre-aggregated buckets
+# =====================================================
+import os
+import math
+import time
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Optional
+
+from fastapi import APIRouter, Query
+import clock
+from database import SessionLocal
+from models import Machine, OEEHourly, OEEMinute
+from wire import FastJSONResponse
+
+# =====================================================
+# CONFIG
+# =====================================================
+MINUTE_RETENTION = int(os.getenv("OEE_MINUTE_RETENTION_H", 48)) * 3600   # minute buckets kept in memory
+HOUR_RETENTION = int(os.getenv("OEE_HOUR_RETENTION_D", 90)) * 86400      # hour buckets kept in memory
+CHECKPOINT_INTERVAL = int(os.getenv("OEE_CHECKPOINT_S", 60))             # buckets → oee_hourly / oee_minute
+PLANT_UTC_OFFSET = float(os.getenv("PLANT_UTC_OFFSET", 3))               # Saudi Arabia = UTC+3
+SHIFTS_SPEC = os.getenv("OEE_SHIFTS", "A:06-14,B:14-22,C:22-06")
+
+# Statuses during which the machine is planned to produce (has a job)
+PLANNED_STATUSES = ("running", "paused", "stopped")
+
+RUN, PLANNED, METERS, IDEAL = 0, 1, 2, 3
+
+
+def parse_shifts(spec: str) -> Dict[int, str]:
+    """'A:06-14,B:14-22,C:22-06' → {local hour: shift name}"""
+    hours = {}
+    for part in spec.split(","):
+        try:
+            name, span = part.strip().split(":")
+            start, end = (int(x) for x in span.split("-"))
+        except ValueError:
+            logging.error(f"Invalid OEE shift spec: {part}")
+            continue
+        h = start
+        while True:
+            hours[h % 24] = name
+            h += 1
+            if h % 24 == end % 24:
+                break
+    return hours
+
+
+SHIFT_BY_HOUR = parse_shifts(SHIFTS_SPEC)
+
+
+def shift_of(ts: float) -> str:
+    local_hour = int((ts / 3600 + PLANT_UTC_OFFSET) % 24)
+    return SHIFT_BY_HOUR.get(local_hour, "-")
+
+
+def _ts(dt: Optional[datetime]) -> float:
+    if dt is None:
+        return clock.time()
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+def _upsert(db, model, column: str, rows: Dict):
+    """rows {(machine_id, bucket): [run, planned, meters, ideal]} → model rows keyed by `column`."""
+    if not rows:
+        return
+    col = getattr(model, column)
+    keys = [k for _, k in rows]
+    existing = {
+        (r.machine_id, getattr(r, column)): r
+        for r in db.query(model).filter(col >= min(keys), col <= max(keys)).all()
+    }
+    for (mid, key), (run, planned, meters, ideal) in rows.items():
+        r = existing.get((mid, key))
+        if not r:
+            r = model(machine_id=mid, **{column: key})
+            db.add(r)
+        r.running_s, r.planned_s, r.meters, r.ideal_s = run, planned, int(meters), ideal
+
+# =====================================================
+# ENGINE
+# =====================================================
+class OEEEngine:
+    """
+    Keeps two bucket resolutions per machine:
+      minute buckets (last MINUTE_RETENTION) for window edges
+      hour buckets   (last HOUR_RETENTION) for whole hours
+    Each bucket = [running_s, planned_s, meters, ideal_s]; a query sums
+    at most (hours in window + 120 minute edges) buckets per machine.
+    Both resolutions are checkpointed and restored on startup.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.machines: Dict[int, Dict] = {}
+        self.minutes: Dict[int, Dict[int, list]] = defaultdict(dict)
+        self.hours: Dict[int, Dict[int, list]] = defaultdict(dict)
+        self._dirty_hours = set()
+        self._dirty_minutes = set()
+        self._last_checkpoint = clock.time()
+
+    # -------------------------------
+    # STARTUP / CHECKPOINT
+    # -------------------------------
+    def load(self):
+        db = SessionLocal()
+        try:
+            now = clock.time()
+            since_hour = int((now - HOUR_RETENTION) // 3600)
+            for r in db.query(OEEHourly).filter(OEEHourly.hour >= since_hour).all():
+                self.hours[r.machine_id][r.hour] = [r.running_s, r.planned_s, r.meters, r.ideal_s]
+            since_minute = int((now - MINUTE_RETENTION) // 60)
+            for r in db.query(OEEMinute).filter(OEEMinute.minute >= since_minute).all():
+                self.minutes[r.machine_id][r.minute] = [r.running_s, r.planned_s, r.meters, r.ideal_s]
+            with self.lock:
+                for m in db.query(Machine).all():
+                    self._track(m, now)
+            logging.info(f"📈 OEE engine tracking {len(self.machines)} machines")
+        finally:
+            db.close()
+
+    def checkpoint(self):
+        """Persist dirty hour and minute buckets and prune expired minute buckets."""
+        with self.lock:
+            now = clock.time()
+            self._accrue_all(now)
+            cutoff = int((now - MINUTE_RETENTION) // 60)
+            for buckets in self.minutes.values():
+                for k in [k for k in buckets if k < cutoff]:
+                    del buckets[k]
+            dirty, self._dirty_hours = self._dirty_hours, set()
+            hour_rows = {key: list(self.hours[key[0]][key[1]]) for key in dirty}
+            dirty, self._dirty_minutes = self._dirty_minutes, set()
+            minute_rows = {key: list(self.minutes[key[0]][key[1]]) for key in dirty if key[1] in self.minutes[key[0]]}
+            self._last_checkpoint = now
+        if not hour_rows and not minute_rows:
+            return
+        db = SessionLocal()
+        try:
+            _upsert(db, OEEHourly, "hour", hour_rows)
+            _upsert(db, OEEMinute, "minute", minute_rows)
+            db.query(OEEMinute).filter(OEEMinute.minute < cutoff).delete(synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            with self.lock:
+                self._dirty_hours |= set(hour_rows)
+                self._dirty_minutes |= set(minute_rows)
+            logging.error(f"OEE checkpoint error: {e}")
+        finally:
+            db.close()
+
+    def maybe_checkpoint(self):
+        if clock.time() - self._last_checkpoint >= CHECKPOINT_INTERVAL:
+            self.checkpoint()
+
+    # -------------------------------
+    # EVENT HOOKS
+    # -------------------------------
+    def on_status(self, m: Machine, at: datetime = None):
+        """Call after m.status changed (any module, any thread)."""
+        now = _ts(at)
+        with self.lock:
+            if m.id in self.machines:
+                self._accrue(m.id, now)
+            self._track(m, now)
+
+    def on_meter(self, m: Machine, at: datetime = None, meters: int = 1):
+        now = _ts(at)
+        with self.lock:
+            if m.id not in self.machines:
+                self._track(m, now)
+            self._accrue(m.id, now)
+            ideal = meters * (m.seconds_per_meter or 0)
+            for bucket in self._buckets(m.id, now):
+                bucket[METERS] += meters
+                bucket[IDEAL] += ideal
+
+    # -------------------------------
+    # ACCRUAL
+    # -------------------------------
+    def _track(self, m: Machine, now: float):
+        self.machines[m.id] = {
+            "location": m.location,
+            "name": m.name,
+            "status": m.status,
+            "since": now
+        }
+
+    def _buckets(self, mid: int, ts: float):
+        hour, minute = int(ts // 3600), int(ts // 60)
+        self._dirty_hours.add((mid, hour))
+        self._dirty_minutes.add((mid, minute))
+        yield self.hours[mid].setdefault(hour, [0.0, 0.0, 0, 0.0])
+        yield self.minutes[mid].setdefault(minute, [0.0, 0.0, 0, 0.0])
+
+    def _accrue_all(self, now: float):
+        for mid in self.machines:
+            self._accrue(mid, now)
+
+    def _accrue(self, mid: int, now: float):
+        st = self.machines[mid]
+        start, st["since"] = st["since"], now
+        if st["status"] not in PLANNED_STATUSES or now <= start:
+            return
+        running = st["status"] == "running"
+        minute_floor = now - MINUTE_RETENTION
+        t = start
+        while t < now:
+            hour = int(t // 3600)
+            h_end = min(now, (hour + 1) * 3600)
+            bucket = self.hours[mid].setdefault(hour, [0.0, 0.0, 0, 0.0])
+            self._dirty_hours.add((mid, hour))
+            bucket[PLANNED] += h_end - t
+            if running:
+                bucket[RUN] += h_end - t
+            m = max(t, minute_floor)
+            while m < h_end:
+                minute = int(m // 60)
+                m_end = min(h_end, (minute + 1) * 60)
+                mb = self.minutes[mid].setdefault(minute, [0.0, 0.0, 0, 0.0])
+                self._dirty_minutes.add((mid, minute))
+                mb[PLANNED] += m_end - m
+                if running:
+                    mb[RUN] += m_end - m
+                m = m_end
+            t = h_end
+
+    # -------------------------------
+    # QUERY
+    # -------------------------------
+    def _window(self, mid: int, start: float, end: float, key_fn, out: Dict, per_bucket_key: bool):
+        hours, minutes = self.hours.get(mid, {}), self.minutes.get(mid, {})
+        minute_floor = clock.time() - MINUTE_RETENTION
+        fixed = None if per_bucket_key else out.setdefault(key_fn(mid, start), [0.0, 0.0, 0.0, 0.0])
+
+        def add(bucket, ts, fraction=1.0):
+            acc = fixed or out.setdefault(key_fn(mid, ts), [0.0, 0.0, 0.0, 0.0])
+            acc[RUN] += bucket[RUN] * fraction
+            acc[PLANNED] += bucket[PLANNED] * fraction
+            acc[METERS] += bucket[METERS] * fraction
+            acc[IDEAL] += bucket[IDEAL] * fraction
+
+        h0, h1 = math.ceil(start / 3600), math.floor(end / 3600)
+        if h0 < h1:
+            for h in (range(h0, h1) if h1 - h0 < len(hours) else [h for h in hours if h0 <= h < h1]):
+                bucket = hours.get(h)
+                if bucket:
+                    add(bucket, h * 3600)
+            edges = [(start, h0 * 3600), (h1 * 3600, end)]
+        else:
+            edges = [(start, end)]
+
+        for a, b in edges:
+            if b <= a:
+                continue
+            if a >= minute_floor:
+                for k in range(int(a // 60), math.ceil(b / 60)):
+                    if k in minutes:
+                        add(minutes[k], k * 60)
+            else:
+                # Minute detail expired → pro-rata share of the hour bucket
+                h = int(a // 3600)
+                if h in hours:
+                    add(hours[h], h * 3600, (b - a) / 3600)
+
+    def query(self, start: datetime, end: datetime, group_by: str = "machine", location: str = None):
+        t0 = time.perf_counter()
+        start_ts, end_ts = _ts(start), _ts(end)
+        totals: Dict = {}
+        with self.lock:
+            self._accrue_all(clock.time())
+            machines = {
+                mid: st for mid, st in self.machines.items()
+                if not location or st["location"] == location
+            }
+            if group_by == "location":
+                key_fn = lambda mid, ts: machines[mid]["location"]
+            elif group_by == "shift":
+                key_fn = lambda mid, ts: shift_of(ts)
+            elif group_by == "plant":
+                key_fn = lambda mid, ts: "plant"
+            else:
+                key_fn = lambda mid, ts: mid
+            for mid in machines:
+                self._window(mid, start_ts, end_ts, key_fn, totals, group_by == "shift")
+
+        window_h = max(end_ts - start_ts, 1) / 3600
+        rows = []
+        for key, (run, planned, meters, ideal) in sorted(totals.items(), key=lambda kv: str(kv[0])):
+            availability = run / planned if planned else 0.0
+            performance = ideal / run if run else 0.0
+            row = {
+                "key": key,
+                "availability": round(availability * 100, 1),
+                "performance": round(performance * 100, 1),
+                "oee": round(availability * performance * 100, 1),  # quality not tracked → 100%
+                "throughput_mph": round(meters / window_h, 2),
+                "running_s": round(run, 1),
+                "planned_s": round(planned, 1),
+                "meters": int(meters)
+            }
+            if group_by == "machine":
+                row["machine_id"] = key
+                row["name"] = machines[key]["name"]
+                row["location"] = machines[key]["location"]
+                row["status"] = machines[key]["status"]
+            rows.append(row)
+
+        return {
+            "start": datetime.fromtimestamp(start_ts, timezone.utc).isoformat(),
+            "end": datetime.fromtimestamp(end_ts, timezone.utc).isoformat(),
+            "group_by": group_by,
+            "rows": rows,
+            "elapsed_ms": round((time.perf_counter() - t0) * 1000, 2)
+        }
+
+
+oee_engine = OEEEngine()
+
+# =====================================================
+# API
+# =====================================================
+router = APIRouter(prefix="/api/metrics", tags=["Production Metrics"])
+
+
+@router.get("/oee")
+def get_oee(
+    hours: float = Query(8, description="Window length ending now (ignored if start given)"),
+    start: Optional[datetime] = Query(None, description="ISO start"),
+    end: Optional[datetime] = Query(None, description="ISO end (default now)"),
+    group_by: str = Query("machine", pattern="^(machine|location|shift|plant)$"),
+    location: str = Query(None, description="Filter by location")
+):
+    end = end or clock.now()
+    start = start or (end - timedelta(hours=hours))
+    return FastJSONResponse(oee_engine.query(start, end, group_by, location))
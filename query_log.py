@@ -0,0 +1,164 @@
+# =====================================================
+# query_log.py – Slow-Query Log + Query-Plan Capture
+# Times every statement via SQLAlchemy engine events,
+# logs statements over SLOW_QUERY_MS with their parameter
+# shape + EXPLAIN QUERY PLAN, aggregates top-N by total time
+# =====================================================
+import os
+import re
+import time
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict
+
+from fastapi import APIRouter, Query
+from sqlalchemy import event
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 100))
+MAX_STATEMENTS = int(os.getenv("QUERY_STATS_MAX", 500))   # distinct statements tracked
+SLOW_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", 200))
+OTHER_STATEMENTS = "<other statements>"  # stats bucket once MAX_STATEMENTS are tracked
+
+logger = logging.getLogger("slow_query")
+
+_IN_LIST = re.compile(r"\((\s*\?\s*,)+\s*\?\s*\)|\((\s*%\(\w+\)s\s*,)+\s*%\(\w+\)s\s*\)")
+_SPACES = re.compile(r"\s+")
+
+# =====================================================
+# STATE
+# =====================================================
+_lock = threading.Lock()
+_stats: Dict[str, list] = {}            # statement → [count, total_s, max_s, rows]
+_plans: Dict[str, list] = {}            # statement → EXPLAIN output (captured once)
+_slow = deque(maxlen=SLOW_LOG_SIZE)
+
+
+def normalize(statement: str) -> str:
+    """Collapse whitespace and variable-length IN (?, ?, ...) lists."""
+    return _IN_LIST.sub("(?...)", _SPACES.sub(" ", statement).strip())
+
+
+def param_shape(parameters, executemany: bool) -> str:
+    if executemany:
+        first = parameters[0] if parameters else ()
+        return f"executemany[{len(parameters)}] x {param_shape(first, False)}"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{k}: {type(v).__name__}" for k, v in parameters.items()) + "}"
+    if isinstance(parameters, (list, tuple)):
+        return "(" + ", ".join(type(v).__name__ for v in parameters) + ")"
+    return type(parameters).__name__
+
+
+def _explain(conn, statement: str, parameters, executemany: bool):
+    if executemany or not statement.lstrip().upper().startswith(("SELECT", "WITH", "UPDATE", "DELETE")):
+        return None
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    try:
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute(prefix + statement, parameters)
+            return [" | ".join(str(c) for c in row) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+    except Exception as e:
+        return [f"explain failed: {e}"]
+
+# =====================================================
+# ENGINE EVENTS
+# =====================================================
+def install_query_log(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("query_start")
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        key = normalize(statement)
+        rows = cursor.rowcount if cursor.rowcount and cursor.rowcount > 0 else 0
+        slow = elapsed * 1000 >= SLOW_QUERY_MS
+        capture = False
+        with _lock:
+            s = _stats.get(key)
+            if s is None:
+                tracked = len(_stats) < MAX_STATEMENTS
+                s = _stats.setdefault(key if tracked else OTHER_STATEMENTS, [0, 0.0, 0.0, 0])
+            else:
+                tracked = True
+            s[0] += 1
+            s[1] += elapsed
+            s[2] = max(s[2], elapsed)
+            s[3] += rows
+            # One EXPLAIN per tracked statement; the overflow bucket mixes statements, so it gets none
+            if slow and tracked and key not in _plans:
+                _plans[key] = None
+                capture = True
+            plan = _plans.get(key)
+
+        if not slow:
+            return
+        if capture:
+            plan = _explain(conn, statement, parameters, executemany)
+            with _lock:
+                _plans[key] = plan
+        entry = {
+            "at": datetime.now(timezone.utc).isoformat(),
+            "ms": round(elapsed * 1000, 2),
+            "statement": key,
+            "params": param_shape(parameters, executemany),
+            "plan": plan
+        }
+        _slow.append(entry)
+        logger.warning(f"SLOW QUERY {entry['ms']} ms {entry['params']}: {key[:300]} | plan: {entry['plan']}")
+
+# =====================================================
+# REPORTING
+# =====================================================
+def top_statements(n: int = 20, order: str = "total"):
+    idx = {"count": 0, "total": 1, "max": 2}.get(order, 1)
+    with _lock:
+        items = sorted(_stats.items(), key=lambda kv: kv[1][idx], reverse=True)[:n]
+    return [{
+        "statement": stmt,
+        "count": count,
+        "total_ms": round(total * 1000, 2),
+        "avg_ms": round(total / count * 1000, 3) if count else 0,
+        "max_ms": round(mx * 1000, 2),
+        "rows": rows,
+        "plan": _plans.get(stmt)
+    } for stmt, (count, total, mx, rows) in items]
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+        _plans.clear()
+        _slow.clear()
+
+
+router = APIRouter(prefix="/api/admin", tags=["Admin"])
+
+
+@router.get("/queries")
+def query_report(
+    top: int = Query(20, ge=1, le=200),
+    order: str = Query("total", pattern="^(total|max|count)$"),
+    slow: int = Query(50, ge=0, le=SLOW_LOG_SIZE, description="Recent slow queries to include")
+):
+    return {
+        "slow_query_ms": SLOW_QUERY_MS,
+        "tracked_statements": len(_stats),
+        "top": top_statements(top, order),
+        "recent_slow": list(_slow)[-slow:][::-1] if slow else []
+    }
+
+
+@router.post("/queries/reset")
+def query_report_reset():
+    reset()
+    return {"ok": True}
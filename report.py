@@ -2,107 +2,296 @@
 # production_report.py
 # Step 35 – Production Report Module (Updated & ERPNext Metadata)
 # =====================================================
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Query
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from database import SessionLocal
+from database import ReadSessionLocal
 from models import ProductionLog, Machine, ERPNextMetadata
-from datetime import datetime
+from datetime import datetime, timedelta, time as dtime
+from typing import Dict, Optional
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import multiprocessing
+import os
+import re
 import csv
+import asyncio
 from io import StringIO
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, Response
+from wire import FastJSONResponse, dumps
+from report_cache import DayBucket, report_cache, closed_before, invalidate_report_cache, REPORT_CACHE_LOOKUPS
 
 router = APIRouter(prefix="/api/report", tags=["Production Report"])
 
 # =====================================================
-# DB Dependency
+# Isolated read path: read-only sessions on their own pool,
+# run on dedicated report workers so month-long reports never
+# take the live loop's connections, FastAPI's threadpool or
+# (in process mode) the server's GIL
 # =====================================================
-def get_db():
-    db = SessionLocal()
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", 2))           # concurrent report queries
+REPORT_MAX_PENDING = int(os.getenv("REPORT_MAX_PENDING", 8))   # running + queued before 503
+REPORT_EXECUTOR = os.getenv("REPORT_EXECUTOR", "process")      # process | thread
+
+_report_executor = None
+_report_slots = None
+
+
+def report_executor():
+    global _report_executor
+    if _report_executor is None:
+        if REPORT_EXECUTOR == "process":
+            # spawn: never fork the running server (event loop + threads)
+            _report_executor = ProcessPoolExecutor(max_workers=REPORT_WORKERS,
+                                                   mp_context=multiprocessing.get_context("spawn"))
+        else:
+            _report_executor = ThreadPoolExecutor(max_workers=REPORT_WORKERS, thread_name_prefix="report")
+    return _report_executor
+
+
+def shutdown_reports():
+    if _report_executor is not None:
+        _report_executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _read(fn, *args):
+    db = ReadSessionLocal()
     try:
-        yield db
+        return fn(db, *args)
     finally:
         db.close()
 
+
+async def run_report(fn, *args):
+    """Run fn(read_db, *args) on the report executor; None when the queue is full."""
+    global _report_slots
+    if _report_slots is None:
+        _report_slots = asyncio.Semaphore(REPORT_MAX_PENDING)
+    if _report_slots.locked():
+        return None
+    async with _report_slots:
+        return await asyncio.get_running_loop().run_in_executor(report_executor(), _read, fn, *args)
+
+
+def busy_response():
+    return FastJSONResponse({"error": "Report queue full, retry shortly"}, status_code=503,
+                            headers={"Retry-After": "5"})
+
+
 # =====================================================
 # FETCH PRODUCTION LOGS
+# Rows are encoded per closed UTC day by the report worker and
+# cached in report_cache with the ERP status/comments they were
+# built with; a day is rebuilt if those have changed since.
+# Machine names are encoded as id tokens and resolved when the
+# body is served, so a rename leaves cached days valid.
 # =====================================================
+LOG_FIELDS = ["machine_id", "machine_name", "location", "work_order", "pipe_size",
+              "produced_qty", "timestamp", "erp_status", "erp_comments"]
+NO_META = (None, None)
+NAME_TOKEN = {  # how _name_token(machine_id) comes out of each encoder
+    "json": re.compile(rb'"\\u0000m(\d+)\\u0000"'),
+    "csv": re.compile(rb"\x00m(\d+)\x00"),
+}
+
+
+def _name_token(machine_id: int) -> str:
+    return f"\x00m{machine_id}\x00"
+
+
+def _resolve_names(fmt: str, body: bytes, names: Dict[int, str]) -> bytes:
+    """Replace machine-name tokens with the machines' current names."""
+    encoded = {}
+
+    def name(match):
+        mid = int(match.group(1))
+        if mid not in encoded:
+            if fmt == "json":
+                encoded[mid] = dumps(names.get(mid))
+            else:
+                out = StringIO()
+                csv.writer(out, lineterminator="").writerow([names.get(mid)])
+                encoded[mid] = out.getvalue().encode("utf-8")
+        return encoded[mid]
+
+    return NAME_TOKEN[fmt].sub(name, body)
+
+
+def _parse_date(value: str) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        return None  # ignored, as before
+
+
+def _log_rows(db: Session, location: str, start: datetime, end: datetime = None, end_inclusive: bool = False):
+    # Plain column tuples: no ORM identity map for month-long result sets
+    query = db.query(
+        ProductionLog.machine_id, Machine.name, Machine.location, ProductionLog.work_order,
+        ProductionLog.pipe_size, ProductionLog.produced_qty, ProductionLog.timestamp
+    ).join(Machine, Machine.id == ProductionLog.machine_id).filter(ProductionLog.timestamp >= start)
+    if end is not None:
+        query = query.filter(ProductionLog.timestamp <= end if end_inclusive else ProductionLog.timestamp < end)
+    if location:
+        query = query.filter(Machine.location == location)
+    return query.order_by(ProductionLog.timestamp.desc()).all()
+
+
+def _erp_metadata(db: Session) -> Dict[str, tuple]:
+    # ERPNext metadata once per report (was one query per log row)
+    meta = {}
+    for work_order, erp_status, erp_comments in db.query(
+        ERPNextMetadata.work_order, ERPNextMetadata.erp_status, ERPNextMetadata.erp_comments
+    ).order_by(ERPNextMetadata.id):
+        meta.setdefault(work_order, (erp_status, erp_comments))  # first match, as .first() did
+    return meta
+
+
+def _encode_day(fmt: str, rows, meta: Dict[str, tuple]) -> DayBucket:
+    """Rows → one encoded body fragment (names as tokens) + the ERP values baked into it."""
+    used, data = {}, []
+    for machine_id, _, machine_location, work_order, pipe_size, produced_qty, timestamp in rows:
+        erp = used.get(work_order)
+        if erp is None:
+            erp = used[work_order] = meta.get(work_order, NO_META)
+        data.append([machine_id, _name_token(machine_id), machine_location, work_order, pipe_size, produced_qty,
+                     timestamp.isoformat(), erp[0], erp[1]])
+    if not data:
+        return b"", used
+    if fmt == "json":
+        return dumps([dict(zip(LOG_FIELDS, row)) for row in data])[1:-1], used  # rows without [ ]
+    out = StringIO()
+    csv.writer(out).writerows(data)
+    return out.getvalue().encode("utf-8"), used
+
+
+def production_log_buckets(db: Session, fmt: str, location: str, start_dt: Optional[datetime],
+                           end_dt: Optional[datetime], cached: frozenset) -> Dict:
+    """
+    Report worker: encode the closed days in range that are not in
+    `cached`, plus the live tail (today, or the rows stamped exactly
+    at end_date midnight, which the inclusive filter has always kept).
+    """
+    today = closed_before()
+    first_day = start_dt.date() if start_dt else None
+    if first_day is None:
+        oldest = db.query(func.min(ProductionLog.timestamp)).scalar()
+        first_day = oldest.date() if oldest else today
+    closed_end = min(end_dt.date(), today) if end_dt else today  # exclusive
+
+    meta = _erp_metadata(db)
+    days = [first_day + timedelta(days=i) for i in range((closed_end - first_day).days)]
+    missing = [d for d in days if d not in cached]
+    built = {}
+    if missing:
+        by_day = {d: [] for d in missing}
+        for row in _log_rows(db, location, datetime.combine(missing[0], dtime()),
+                             datetime.combine(missing[-1] + timedelta(days=1), dtime())):
+            rows = by_day.get(row[6].date())
+            if rows is not None:
+                rows.append(row)
+        built = {d: _encode_day(fmt, rows, meta) for d, rows in by_day.items()}
+
+    live_start = datetime.combine(closed_end, dtime())
+    if start_dt and start_dt > live_start:
+        live_start = start_dt
+    live = _encode_day(fmt, _log_rows(db, location, live_start, end_dt, end_inclusive=True), meta)
+    names = dict(db.query(Machine.id, Machine.name).all())
+
+    return {"days": days, "built": built, "live": live, "meta": meta, "names": names}
+
+
+def _stale(bucket: DayBucket, meta: Dict[str, tuple]) -> bool:
+    return any(meta.get(wo, NO_META) != erp for wo, erp in bucket[1].items())
+
+
+async def production_log_report(fmt: str, start_date: str, end_date: str, location: str) -> Optional[bytes]:
+    """Report body assembled from cached days (b"" when empty); None when the report queue is full."""
+    key = ("production_logs", fmt, location or None)
+    args = (fmt, location, _parse_date(start_date), _parse_date(end_date))
+    cached = report_cache.snapshot(key)
+    generation = report_cache.generation
+    result = await run_report(production_log_buckets, *args, frozenset(cached))
+    if result is None:
+        return None
+
+    # ERP status of an old work order moved on → rebuild those days
+    stale = [d for d in result["days"] if d in cached and _stale(cached[d], result["meta"])]
+    if stale:
+        rebuilt = await run_report(production_log_buckets, *args, frozenset(cached) - set(stale))
+        if rebuilt is None:
+            return None
+        result = rebuilt
+
+    built = result["built"]
+    report_cache.store(key, built, generation)
+    report_cache.touch(key, result["days"])
+    REPORT_CACHE_LOOKUPS.inc(len(result["days"]) - len(built), result="hit")
+    REPORT_CACHE_LOOKUPS.inc(len(built), result="miss")
+
+    parts = [result["live"][0]] + [(built[d] if d in built else cached[d])[0] for d in reversed(result["days"])]
+    parts = [p for p in parts if p]
+    body = _resolve_names(fmt, b",".join(parts) if fmt == "json" else b"".join(parts), result["names"])
+    if fmt == "json":
+        return b'{"logs":[' + body + b"]}"
+    if not parts:
+        return b""
+    out = StringIO()
+    csv.writer(out).writerow(LOG_FIELDS)
+    return out.getvalue().encode("utf-8") + body
+
+
 @router.get("/logs")
-def get_production_logs(
+async def get_production_logs(
     start_date: str = Query(None, description="YYYY-MM-DD"),
     end_date: str = Query(None, description="YYYY-MM-DD"),
-    location: str = Query(None, description="Filter by location"),
-    db: Session = Depends(get_db)
+    location: str = Query(None, description="Filter by location")
 ):
-    query = db.query(ProductionLog, Machine).join(Machine, Machine.id == ProductionLog.machine_id)
-
-    # FILTER BY START DATE
-    if start_date:
-        try:
-            start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-            query = query.filter(ProductionLog.timestamp >= start_dt)
-        except ValueError:
-            pass
-
-    # FILTER BY END DATE
-    if end_date:
-        try:
-            end_dt = datetime.strptime(end_date, "%Y-%m-%d")
-            query = query.filter(ProductionLog.timestamp <= end_dt)
-        except ValueError:
-            pass
-
-    # FILTER BY LOCATION
-    if location:
-        query = query.filter(Machine.location == location)
-
-    logs = query.order_by(ProductionLog.timestamp.desc()).all()
-
-    result = []
-    for log, machine in logs:
-        # Fetch ERPNext metadata if available
-        meta = db.query(ERPNextMetadata).filter(ERPNextMetadata.work_order == log.work_order).first()
-        result.append({
-            "machine_id": log.machine_id,
-            "machine_name": machine.name,
-            "location": machine.location,
-            "work_order": log.work_order,
-            "pipe_size": log.pipe_size,
-            "produced_qty": log.produced_qty,
-            "timestamp": log.timestamp.isoformat(),
-            "erp_status": meta.erp_status if meta else None,
-            "erp_comments": meta.erp_comments if meta else None
-        })
-
-    return {"logs": result}
+    body = await production_log_report("json", start_date, end_date, location)
+    if body is None:
+        return busy_response()
+    # Pre-encoded day fragments; the event loop only joins bytes
+    return Response(body, media_type="application/json")
 
 # =====================================================
 # CSV EXPORT
 # =====================================================
 @router.get("/export")
-def export_production_csv(
+async def export_production_csv(
     start_date: str = Query(None, description="YYYY-MM-DD"),
     end_date: str = Query(None, description="YYYY-MM-DD"),
-    location: str = Query(None, description="Filter by location"),
-    db: Session = Depends(get_db)
+    location: str = Query(None, description="Filter by location")
 ):
-    data = get_production_logs(start_date, end_date, location, db).get("logs", [])
-
-    if not data:
+    csv_bytes = await production_log_report("csv", start_date, end_date, location)
+    if csv_bytes is None:
+        return busy_response()
+    if not csv_bytes:
         return {"error": "No data found"}
 
-    # CREATE CSV OUTPUT
-    output = StringIO()
-    writer = csv.DictWriter(output, fieldnames=list(data[0].keys()))
-    writer.writeheader()
-    for row in data:
-        writer.writerow(row)
-    output.seek(0)
-
     # FILENAME WITH TIMESTAMP
     filename = f"production_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
 
     return StreamingResponse(
-        iter([output.getvalue()]),
+        iter([csv_bytes]),
         media_type="text/csv",
         headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
+
+# =====================================================
+# REPORT CACHE
+# =====================================================
+@router.get("/cache")
+def get_report_cache():
+    return FastJSONResponse(report_cache.stats())
+
+
+@router.post("/cache/invalidate")
+def invalidate_report_days(
+    start_date: str = Query(None, description="YYYY-MM-DD (default: all cached days)"),
+    end_date: str = Query(None, description="YYYY-MM-DD inclusive")
+):
+    """For hand edits to historical production data."""
+    start, end = _parse_date(start_date), _parse_date(end_date)
+    dropped = invalidate_report_cache(start.date() if start else None, end.date() if end else None)
+    return {"ok": True, "invalidated": dropped}
@@ -0,0 +1,101 @@
+# =====================================================
+# report_cache.py – Closed-Day Report Result Cache
+# Production logs of a day that has ended never change, so each
+# report's rows are cached per (endpoint, filters, UTC day) and
+# kept until evicted (LRU, bounded in bytes) or explicitly
+# invalidated. Only today's partial bucket is recomputed.
+# =====================================================
+import os
+import logging
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Hashable, Iterable, Optional, Tuple
+
+from metrics import Counter, Gauge
+
+REPORT_CACHE_MB = float(os.getenv("REPORT_CACHE_MB", 256))          # LRU bound for cached day buckets
+REPORT_CACHE_GRACE_S = float(os.getenv("REPORT_CACHE_GRACE_S", 300))  # late writes after midnight
+
+REPORT_CACHE_LOOKUPS = Counter("report_cache_lookups_total", "Report day-bucket lookups", ("result",))
+REPORT_CACHE_BYTES = Gauge("report_cache_bytes", "Bytes held by the report day-bucket cache")
+
+# (encoded rows of one day, {work_order: (erp_status, erp_comments)} baked into them)
+DayBucket = Tuple[bytes, Dict[str, tuple]]
+
+
+def closed_before(now: datetime = None) -> date:
+    """First UTC day that may still receive rows; every earlier day is immutable."""
+    now = now or datetime.now(timezone.utc)
+    return (now - timedelta(seconds=REPORT_CACHE_GRACE_S)).date()
+
+
+def bucket_size(bucket: DayBucket) -> int:
+    return len(bucket[0]) + 200 * len(bucket[1])
+
+
+class DayCache:
+    def __init__(self, max_bytes: int = int(REPORT_CACHE_MB * 1024 * 1024)):
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[Tuple, Tuple[DayBucket, int]]" = OrderedDict()  # (key, day) → (bucket, size)
+        self.bytes = 0
+        self.generation = 0  # bumped on invalidation; results computed before it are not stored
+        self.evictions = 0
+        self.listeners = []  # fn(start, end) – other caches/rollups derived from history
+
+    def snapshot(self, key: Hashable) -> Dict[date, DayBucket]:
+        """Every cached day for key; held by the request so eviction can't race it."""
+        return {day: entry[0] for (k, day), entry in self.entries.items() if k == key}
+
+    def touch(self, key: Hashable, days: Iterable[date]):
+        for day in days:
+            if (key, day) in self.entries:
+                self.entries.move_to_end((key, day))
+
+    def store(self, key: Hashable, buckets: Dict[date, DayBucket], generation: int):
+        if generation != self.generation:
+            return  # invalidated while the worker was computing
+        for day, bucket in buckets.items():
+            size = bucket_size(bucket)
+            old = self.entries.pop((key, day), None)
+            if old is not None:
+                self.bytes -= old[1]
+            self.entries[(key, day)] = (bucket, size)
+            self.bytes += size
+        while self.bytes > self.max_bytes and self.entries:
+            _, (_, size) = self.entries.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+
+    def invalidate(self, start: Optional[date] = None, end: Optional[date] = None) -> int:
+        """Drop cached days in [start, end] (all days when both are None)."""
+        self.generation += 1
+        doomed = [k for k in self.entries
+                  if (start is None or k[1] >= start) and (end is None or k[1] <= end)]
+        for k in doomed:
+            self.bytes -= self.entries.pop(k)[1]
+        for listener in self.listeners:
+            listener(start, end)
+        if doomed:
+            logging.info(f"🧹 Report cache: invalidated {len(doomed)} day buckets "
+                         f"({start or 'beginning'} → {end or 'now'})")
+        return len(doomed)
+
+    def stats(self) -> Dict:
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "generation": self.generation,
+            "oldest_day": min((k[1] for k in self.entries), default=None),
+            "newest_day": max((k[1] for k in self.entries), default=None),
+        }
+
+
+report_cache = DayCache()
+REPORT_CACHE_BYTES.callback = lambda: report_cache.bytes
+
+
+def invalidate_report_cache(start: Optional[date] = None, end: Optional[date] = None) -> int:
+    """Call after editing historical production data."""
+    return report_cache.invalidate(start, end)
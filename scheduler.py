@@ -5,194 +5,222 @@
 # Step 24 → ProductionHistory Logging
 # Step 25 → Next Job Queue Info
 # Step 43 → ScheduledJob Auto-Assignment
+# Step 50 → Loops run as supervised jobs (supervisor.py)
 # =====================================================
-import asyncio
-from datetime import datetime, timezone
+import hashlib
+import logging
+from typing import Callable, Dict, List, Tuple
+from sqlalchemy import insert, select, update
 from sqlalchemy.orm import Session
+import clock
 from database import SessionLocal
 from models import Machine, ProductionHistory, ScheduledJob
-from Backend.erpnext_sync import get_work_orders, auto_assign_work_orders
-from main import manager  # WebSocket manager from main.py
+from erpnext_sync import get_work_orders, auto_assign_work_orders, resend_pending_statuses
+from erp_guard import run_erp, erp_breaker, CLOSED
+from oee import oee_engine
+from supervisor import Supervisor
+from transitions import record_transition
 
 SYNC_INTERVAL = 10           # seconds, ERPNext fetch interval
-AUTO_ASSIGN_INTERVAL = 15    # seconds, auto-assign unassigned Work Orders
+AUTO_ASSIGN_INTERVAL = 10    # seconds, auto-assign unassigned Work Orders
 HISTORY_INTERVAL = 30        # seconds, snapshot history logging
 SCHEDULED_JOB_INTERVAL = 10  # seconds, auto-assign ScheduledJobs
+JOB_JITTER = 1.0             # seconds, spreads the ERP / DB jobs apart
+ERP_JOB_TIMEOUT = 120        # seconds, watchdog for one ERP pass
+DB_JOB_TIMEOUT = 30          # seconds, watchdog for one DB pass
 
-# =====================================================
-# HELPER TO FORMAT DASHBOARD DATA
-# =====================================================
-def get_dashboard_data(db: Session):
-    response = []
-    machines = db.query(Machine).all()
-    locations = {}
-    
-    # Step 25: compute next job per location
-    next_jobs = {}
-    for m in machines:
-        if m.status in ["free", "stopped"] and m.work_order:
-            if m.location not in next_jobs:
-                next_jobs[m.location] = {
-                    "machine_id": m.id,
-                    "work_order": m.work_order,
-                    "pipe_size": m.pipe_size,
-                    "total_qty": m.target_qty,
-                    "produced_qty": m.produced_qty
-                }
-
-    for m in machines:
-        remaining_qty = (m.target_qty - m.produced_qty) if m.target_qty else 0
-        remaining_time = remaining_qty * m.seconds_per_meter if m.seconds_per_meter else None
-        progress_percent = (m.produced_qty / m.target_qty * 100) if m.target_qty else 0
-
-        locations.setdefault(m.location, []).append({
-            "id": m.id,
-            "name": m.name,
-            "status": m.status,
-            "job": {
-                "work_order": m.work_order,
-                "size": m.pipe_size,
-                "total_qty": m.target_qty,
-                "completed_qty": m.produced_qty,
-                "remaining_qty": remaining_qty,
-                "remaining_time": remaining_time,
-                "progress_percent": progress_percent
-            } if m.work_order else None,
-            "next_job": next_jobs.get(m.location)  # Step 25
-        })
+# Dashboard refresh hook; main.py points it at its CoalescingPublisher
+on_change: Callable[..., None] = lambda **changes: None
 
-    for loc, machines in locations.items():
-        response.append({
-            "name": loc,
-            "machines": machines
-        })
-    return response
+# Statuses a machine can take a scheduled job from (if it holds no unfinished job)
+ASSIGNABLE_STATUSES = ("free", "paused", "stopped", "completed")
 
 # =====================================================
 # STEP 20 → ERPNext SYNC LOOP
+# Bulk reconciliation: one query for the referenced machines,
+# per-machine content hash vs the ERP set, one bulk UPDATE of
+# the real differences only
 # =====================================================
-async def erpnext_sync_loop():
-    while True:
-        db = SessionLocal()
+SYNC_FIELDS = ("work_order", "pipe_size", "erpnext_work_order_id")
+
+
+def _content_hash(values) -> str:
+    return hashlib.blake2b(repr(tuple(values)).encode(), digest_size=8).hexdigest()
+
+
+def desired_assignments(work_orders: List[Dict]) -> Dict[Tuple[int, str], Dict]:
+    """ERP work orders carrying a machine → {(machine_id, location): field values}; last one wins."""
+    desired = {}
+    for wo in work_orders:
+        machine_id = wo.get("custom_machine_id")
+        location = wo.get("custom_location")
+        if not machine_id or not location:
+            continue
         try:
-            work_orders = get_work_orders()
-            updated = False
-
-            for wo in work_orders:
-                machine_id = wo.get("custom_machine_id")
-                location = wo.get("custom_location")
-                if not machine_id or not location:
-                    continue
-                m = db.query(Machine).filter(
-                    Machine.id == int(machine_id),
-                    Machine.location == location
-                ).first()
-                if not m:
-                    continue
-
-                if m.work_order != wo.get("name") or m.pipe_size != wo.get("custom_pipe_size"):
-                    m.work_order = wo.get("name")
-                    m.pipe_size = wo.get("custom_pipe_size")
-                    m.erpnext_work_order_id = wo.get("name")
-                    updated = True
-
-            if updated:
-                db.commit()
-                await manager.broadcast({"locations": get_dashboard_data(db)})
-
-        except Exception as e:
-            print(f"ERP SYNC ERROR: {e}")
-        finally:
-            db.close()
-
-        await asyncio.sleep(SYNC_INTERVAL)
+            key = (int(machine_id), location)
+        except (TypeError, ValueError):
+            continue
+        desired[key] = {
+            "work_order": wo.get("name"),
+            "pipe_size": wo.get("custom_pipe_size"),
+            "erpnext_work_order_id": wo.get("name"),
+        }
+    return desired
+
+
+def reconcile_work_orders(db: Session, work_orders: List[Dict]) -> List[int]:
+    """Apply the ERP machine assignments that differ locally; → changed machine ids."""
+    desired = desired_assignments(work_orders)
+    if not desired:
+        return []
+
+    rows = db.execute(
+        select(Machine.id, Machine.location, *(getattr(Machine, f) for f in SYNC_FIELDS))
+        .where(Machine.id.in_({mid for mid, _ in desired}))
+    ).all()
+
+    changes = []
+    for row in rows:
+        want = desired.get((row.id, row.location))
+        if want is None:
+            continue
+        if _content_hash(getattr(row, f) for f in SYNC_FIELDS) != _content_hash(want[f] for f in SYNC_FIELDS):
+            changes.append({"id": row.id, **want})
+
+    if changes:
+        db.execute(update(Machine), changes)  # executemany UPDATE by primary key
+        db.commit()
+    return [c["id"] for c in changes]
+
+
+async def erpnext_sync():
+    work_orders = await run_erp(get_work_orders)
+    if erp_breaker.state == CLOSED:
+        resend_pending_statuses()  # status pushes that were rejected since the last pass
+    db = SessionLocal()
+    try:
+        changed = reconcile_work_orders(db, work_orders)
+        if changed:
+            logging.info(f"ERP sync: {len(changed)} machine(s) reconciled")
+            on_change()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
 
 # =====================================================
-# STEP 23 → AUTO-ASSIGN LOOP (ERPNext Work Orders)
+# STEP 23 → AUTO-ASSIGN (ERPNext Work Orders)
 # =====================================================
-async def auto_assign_loop():
-    while True:
-        try:
-            auto_assign_work_orders()
-        except Exception as e:
-            print(f"Auto-assign loop error: {e}")
-        await asyncio.sleep(AUTO_ASSIGN_INTERVAL)
+async def auto_assign():
+    await run_erp(auto_assign_work_orders)
 
 # =====================================================
 # STEP 24 → PRODUCTION HISTORY LOGGING
 # =====================================================
-async def production_history_loop():
-    while True:
-        db = SessionLocal()
-        try:
-            machines = db.query(Machine).all()
-            timestamp = datetime.now(timezone.utc)
-            for m in machines:
-                remaining_qty = (m.target_qty - m.produced_qty) if m.target_qty else 0
-                history = ProductionHistory(
-                    machine_id=m.id,
-                    location=m.location,
-                    work_order=m.work_order,
-                    pipe_size=m.pipe_size,
-                    target_qty=m.target_qty,
-                    produced_qty=m.produced_qty,
-                    remaining_qty=remaining_qty,
-                    status=m.status,
-                    timestamp=timestamp
-                )
-                db.add(history)
-            db.commit()
-        except Exception as e:
-            print(f"Production history loop error: {e}")
-        finally:
-            db.close()
-        await asyncio.sleep(HISTORY_INTERVAL)
+HISTORY_FIELDS = ("id", "location", "work_order", "pipe_size", "target_qty", "produced_qty", "status")
+
+
+def record_history(db: Session) -> int:
+    """One ProductionHistory snapshot per machine, one bulk INSERT (commits); → rows written."""
+    timestamp = clock.now()
+    rows = []
+    for mid, location, work_order, pipe_size, target_qty, produced_qty, status in db.execute(
+        select(*(getattr(Machine, f) for f in HISTORY_FIELDS))
+    ):
+        rows.append({
+            "machine_id": mid,
+            "location": location,
+            "work_order": work_order,
+            "pipe_size": pipe_size,
+            "target_qty": target_qty,
+            "produced_qty": produced_qty,
+            "remaining_qty": (target_qty - produced_qty) if target_qty else 0,
+            "status": status,
+            "timestamp": timestamp
+        })
+    if rows:
+        db.execute(insert(ProductionHistory), rows)
+    db.commit()
+    return len(rows)
+
+
+async def production_history():
+    db = SessionLocal()
+    try:
+        record_history(db)
+    finally:
+        db.close()
 
 # =====================================================
 # STEP 43 → SCHEDULED JOB AUTO-ASSIGN LOOP
 # =====================================================
-async def scheduled_job_auto_assign_loop():
-    while True:
-        db = SessionLocal()
-        try:
-            jobs = db.query(ScheduledJob).filter(ScheduledJob.assigned_machine_id == None).all()
-            free_machines = db.query(Machine).filter(Machine.status.in_(["free", "paused", "stopped"])).all()
-
-            for job in jobs:
-                # find first free machine in the same location
-                location_machines = [m for m in free_machines if m.location == job.location]
-                if not location_machines:
-                    continue
-                machine = location_machines[0]
-
-                # assign job to machine
-                machine.work_order = job.work_order
-                machine.pipe_size = job.pipe_size
-                machine.target_qty = job.qty
-                machine.produced_qty = job.produced_qty
-                machine.status = "paused"
-                machine.erpnext_work_order_id = job.work_order
-                job.assigned_machine_id = machine.id
-
-                db.commit()
-                await manager.broadcast({"locations": get_dashboard_data(db), "scheduled_job_assigned": {
-                    "job_id": job.id,
-                    "machine_id": machine.id
-                }})
-        except Exception as e:
-            print(f"Scheduled Job Auto-Assign Error: {e}")
-        finally:
-            db.close()
-        await asyncio.sleep(SCHEDULED_JOB_INTERVAL)
+def _has_unfinished_job(m: Machine) -> bool:
+    return bool(m.work_order) and (m.produced_qty or 0) < (m.target_qty or 0)
+
+
+def assign_scheduled_jobs(db: Session, order=(ScheduledJob.id,)) -> int:
+    """
+    Give unassigned jobs (in `order`) to the first available machine of
+    their location, one job per machine per pass; → jobs assigned.
+    """
+    free_machines = [m for m in db.query(Machine).filter(Machine.status.in_(ASSIGNABLE_STATUSES))
+                     .order_by(Machine.id).all() if not _has_unfinished_job(m)]
+    if not free_machines:
+        return 0  # common case on a busy plant: don't load the backlog
+    jobs = db.query(ScheduledJob).filter(
+        ScheduledJob.assigned_machine_id == None,
+        ScheduledJob.location.in_({m.location for m in free_machines})
+    ).order_by(*order).all()
+    assigned = 0
+
+    for job in jobs:
+        # find first free machine in the same location
+        location_machines = [m for m in free_machines if m.location == job.location]
+        if not location_machines:
+            continue
+        machine = location_machines[0]
+        free_machines.remove(machine)
+
+        # assign job to machine
+        machine.work_order = job.work_order
+        machine.pipe_size = job.pipe_size
+        machine.target_qty = job.qty
+        machine.produced_qty = job.produced_qty
+        record_transition(db, machine, machine.status, "paused", cause="scheduled_job")
+        machine.status = "paused"
+        machine.erpnext_work_order_id = job.work_order
+        job.assigned_machine_id = machine.id
+
+        db.commit()
+        assigned += 1
+        oee_engine.on_status(machine)
+        on_change(scheduled_job_assigned={
+            "job_id": job.id,
+            "machine_id": machine.id
+        })
+    return assigned
+
+
+async def scheduled_job_auto_assign():
+    db = SessionLocal()
+    try:
+        assign_scheduled_jobs(db)
+    finally:
+        db.close()
 
 # =====================================================
-# STARTUP FUNCTION
+# REGISTRATION
 # =====================================================
-def start_scheduler():
+def register_jobs(supervisor: Supervisor):
     """
-    Call this from main.py startup_event
+    Call this from main.py before supervisor.start()
     """
-    asyncio.create_task(erpnext_sync_loop())
-    asyncio.create_task(auto_assign_loop())
-    asyncio.create_task(production_history_loop())
-    asyncio.create_task(scheduled_job_auto_assign_loop())  # Step 43 auto-assign
+    supervisor.every("erpnext_sync", SYNC_INTERVAL, erpnext_sync,
+                     jitter=JOB_JITTER, max_runtime=ERP_JOB_TIMEOUT)
+    supervisor.every("erpnext_auto_assign", AUTO_ASSIGN_INTERVAL, auto_assign,
+                     jitter=JOB_JITTER, max_runtime=ERP_JOB_TIMEOUT)
+    supervisor.every("production_history", HISTORY_INTERVAL, production_history,
+                     jitter=JOB_JITTER, max_runtime=DB_JOB_TIMEOUT)
+    supervisor.every("scheduled_job_assign", SCHEDULED_JOB_INTERVAL, scheduled_job_auto_assign,
+                     jitter=JOB_JITTER, max_runtime=DB_JOB_TIMEOUT)  # Step 43 auto-assign
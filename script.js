@@ -8,6 +8,10 @@
 
 const API_BASE = "http://127.0.0.1:8000/api";
 const WS_URL = "ws://127.0.0.1:8000/ws/dashboard";
+// "json" (default) or "compact" (schema + row arrays, ~3x smaller frames)
+const WS_FORMAT = "json";
+// After this many failed WebSocket attempts without ever connecting, use SSE (/api/dashboard/stream)
+const WS_MAX_FAILURES = 3;
 
 /************************
  * TEMP USERS (Login)
@@ -21,10 +25,11 @@ const users = [
 
 let currentUser = null;
 let socket = null;
-let etaIntervals = {};
-let nextJobIntervals = {};
 let suppressNextWSRender = false;
 let dashboardCache = {};
+let wsFailures = 0;
+let lastVersion = null;   // change-feed version of the last frame seen (resume point)
+let eventSource = null;
 
 /************************
  * LOGIN PERSISTENCE
@@ -82,10 +87,16 @@ restoreLogin();
  * WEBSOCKET (REALTIME)
  ************************/
 function initWebSocket() {
+    if (eventSource) return;
+    if (!("WebSocket" in window) || wsFailures >= WS_MAX_FAILURES) return initEventStream();
     if (socket && socket.readyState === WebSocket.OPEN) return;
-    socket = new WebSocket(WS_URL);
+    const params = new URLSearchParams();
+    if (WS_FORMAT !== "json") params.set("format", WS_FORMAT);
+    if (lastVersion != null) params.set("since", lastVersion);  // server replays only what we missed
+    socket = new WebSocket(params.toString() ? `${WS_URL}?${params}` : WS_URL);
 
     socket.onopen = () => { 
+        wsFailures = 0;
         socket.send("ready"); 
         console.log("✅ WS Connected"); 
         createAlert("WebSocket connected",0); 
@@ -93,24 +104,18 @@ function initWebSocket() {
 
     socket.onmessage = e => {
         try {
-            const data = JSON.parse(e.data);
-            if (suppressNextWSRender) { suppressNextWSRender = false; return; }
-            dashboardCache = data;
-
-            if(data.new_job) handleNewJob(data.new_job);
-
-            updateDashboardFromWS(data);
-            handleAlerts(data);
-            loadProductionLogs();
-            updateMetricsModal(data);
+            const data = expandFrame(JSON.parse(e.data));
+            if (data.resume === "changes") handleChanges(data);
+            else handleDashboardFrame(data);
         } catch (err) { 
             console.error("WS parse error", err); 
             createAlert("WebSocket data error",2); 
         }
     };
 
-    socket.onclose = () => { 
+    socket.onclose = e => { 
         socket = null; 
+        if (e.code === 1006) wsFailures++;
         createAlert("WebSocket disconnected. Reconnecting...",2); 
         setTimeout(initWebSocket,3000); 
     };
@@ -118,6 +123,79 @@ function initWebSocket() {
     socket.onerror = () => socket.close();
 }
 
+function handleDashboardFrame(data){
+    if (data.version != null) lastVersion = data.version;
+    // Priority-lane alert frames carry no dashboard state
+    if (data.alert) { createAlert(data.alert, data.level); return; }
+    if (suppressNextWSRender) { suppressNextWSRender = false; return; }
+    dashboardCache = data;
+
+    if(data.new_job) handleNewJob(data.new_job);
+
+    updateDashboardFromWS(data);
+    handleAlerts(data);
+    loadProductionLogs();
+    updateMetricsModal(data);
+}
+
+/************************
+ * SSE FALLBACK (terminals/proxies without WebSockets)
+ * Same change feed as /ws/dashboard; EventSource resumes with Last-Event-ID
+ ************************/
+function initEventStream() {
+    if (eventSource) return;
+    console.log("↪ WebSocket unavailable, using server-sent events");
+    eventSource = new EventSource(`${API_BASE}/dashboard/stream`);
+    eventSource.addEventListener("snapshot", e => {
+        const p = JSON.parse(e.data);
+        handleDashboardFrame({locations: p.snapshot, version: p.version});
+    });
+    eventSource.addEventListener("changes", e => handleChanges(JSON.parse(e.data)));
+}
+
+// Change-feed diff (SSE event or WebSocket resume) → merged full frame
+function handleChanges(p){
+    lastVersion = p.version;
+    (p.alerts || []).forEach(a => createAlert(a.alert, a.level));
+    if (!p.changes.length && !p.removed.length) return;
+    const {changes, removed, alerts, resume, ...extra} = p;
+    handleDashboardFrame({...applyChanges(dashboardCache, p), ...extra});
+}
+
+// Merge per-machine change rows ({...machine, location}) into a full dashboard frame
+function applyChanges(cache, p){
+    const locs = new Map((cache.locations || []).map(l => [l.name, {name: l.name, machines: [...l.machines]}]));
+    const gone = new Set([...(p.removed || []), ...p.changes.map(r => r.id)]);
+    locs.forEach(l => { l.machines = l.machines.filter(m => !gone.has(m.id) || p.changes.some(r => r.id === m.id && r.location === l.name)); });
+    p.changes.forEach(({location, ...m}) => {
+        if (!locs.has(location)) locs.set(location, {name: location, machines: []});
+        const list = locs.get(location).machines;
+        const i = list.findIndex(x => x.id === m.id);
+        if (i >= 0) list[i] = m; else list.push(m);
+    });
+    return {locations: [...locs.values()], version: p.version};
+}
+
+/************************
+ * COMPACT FRAME DECODER (see wire.py)
+ ************************/
+function expandFrame(frame){
+    if(!frame.l) return frame;
+    const zip = (fields,row) => row ? Object.fromEntries(fields.map((f,i)=>[f,row[i]])) : null;
+    const {machine, job, next_job} = frame.schema;
+    const out = {...frame};
+    delete out.l; delete out.schema;
+    out.locations = frame.l.map(([name, nextRow, rows]) => {
+        const next = zip(next_job, nextRow);
+        return {name, machines: rows.map(r => ({
+            ...zip(machine, r.slice(0, machine.length)),
+            job: zip(job, r[machine.length]),
+            next_job: r[machine.length + 1] ? next : null
+        }))};
+    });
+    return out;
+}
+
 /************************
  * DASHBOARD LOAD (HTTP)
  ************************/
@@ -164,12 +242,17 @@ async function loadProductionLogs() {
 
 /************************
  * RENDER DASHBOARD
+ * Location grids are rebuilt only when the visible layout (locations,
+ * machine ids, filters) changes; cards are kept by machine id and
+ * patched in place, touching only the fields whose value changed.
  ************************/
+let layoutKey = "";
+const cards = {};   // machine id → {el, location, role, ref, job, next}
+
 function renderDashboard(data){
     if(!currentUser) return; // Prevent showing dashboard if not logged in
     const container = document.getElementById("locations");
-    container.innerHTML = "";
-    if(!data?.locations) return;
+    if(!data?.locations){ container.innerHTML = ""; layoutKey = ""; return; }
 
     let visibleLocations = currentUser.location==="all"?data.locations:data.locations.filter(l=>l.name===currentUser.location);
     const locFilter = document.getElementById("filter-location")?.value||"all";
@@ -178,75 +261,145 @@ function renderDashboard(data){
 
     if(locFilter!=="all") visibleLocations = visibleLocations.filter(l=>l.name===locFilter);
 
-    visibleLocations.forEach(loc=>{
+    const visible = visibleLocations.map(loc=>{
         let machines = loc.machines;
         if(statusFilter!=="all") machines=machines.filter(m=>m.status===statusFilter);
         if(searchFilter) machines=machines.filter(m=>m.name.toLowerCase().includes(searchFilter)||(m.job?.work_order||"").toLowerCase().includes(searchFilter));
-        renderLocation(loc.name, machines);
+        return {name: loc.name, machines};
     });
+
+    const key = currentUser.role + "|" + visible.map(l=>`${l.name}:${l.machines.map(m=>m.id).join(",")}`).join("|");
+    if(key !== layoutKey){
+        layoutKey = key;
+        const frag = document.createDocumentFragment();
+        visible.forEach(loc=>frag.appendChild(renderLocation(loc.name, loc.machines)));
+        container.replaceChildren(frag);
+    }
+    visible.forEach(loc=>loc.machines.forEach(m=>patchMachineCard(m, loc.name)));
+}
+
+// One merged frame per broadcast interval (server-side coalescing)
+function updateDashboardFromWS(data){
+    if(data?.locations) renderDashboard(data);
 }
 
 function renderLocation(location,machines){
     const wrap=document.createElement("div");
     wrap.className="location";
     wrap.innerHTML=`<h2>${location}</h2><div class="machines-grid"></div>`;
-    document.getElementById("locations").appendChild(wrap);
     const grid=wrap.querySelector(".machines-grid");
-
-    machines.forEach(m=>{
-        createOrUpdateMachineCard(m, location, grid);
-    });
+    machines.forEach(m=>grid.appendChild(machineCard(m, location).el));   // existing cards are moved, not rebuilt
+    return wrap;
 }
 
 /************************
  * MACHINE CARD CREATION / UPDATE
  ************************/
-function createOrUpdateMachineCard(machine, location, parentGrid){
-    let card = document.getElementById(`machine-${machine.id}`);
-    const remainingTimeText = machine.job?.remaining_time!=null ? formatTime(machine.job.remaining_time) : "N/A";
-    const progressPercent = machine.job?.progress_percent != null ? Math.min(machine.job.progress_percent.toFixed(1),100) : 0;
-
-    const cardHTML = `<h3>${machine.name}${currentUser.role==="admin"?`<button type="button" class="btn edit" data-location="${location}" data-id="${machine.id}" data-name="${machine.name}">✏</button>`:""}</h3>
-        <p>Status: <b>${machine.status.toUpperCase()}</b></p>
-        ${machine.job?`
-            <div class="job-card">
-                <p>WO: ${machine.job.work_order}</p>
-                <p>Size: ${machine.job.size}</p>
-                <p>Produced: ${machine.job.completed_qty}/${machine.job.total_qty}</p>
-                <p>Remaining: <span id="eta-${machine.id}">${remainingTimeText}</span></p>
-                <p>Progress: ${progressPercent}%</p>
-                <div class="progress-bar-container">
-                    <div class="progress-bar" style="width:${progressPercent}%;background-color:${progressPercent>=90?'red':progressPercent>=75?'orange':'green'}"></div>
-                </div>
-            </div>`:`<div class="job-card"><p>No Job</p></div>`}
+function machineCard(machine, location){
+    let c = cards[machine.id];
+    if(c && c.location===location && c.role===currentUser.role) return c;
+
+    const el = document.createElement("div");
+    el.className = `machine status-${machine.status}`;
+    el.id = `machine-${machine.id}`;
+    el.innerHTML = `<h3><span class="machine-name"></span>${currentUser.role==="admin"?` <button type="button" class="btn edit" data-location="${location}" data-id="${machine.id}">✏</button>`:""}</h3>
+        <p>Status: <b class="machine-status"></b></p>
+        <div class="job-card"></div>
         ${currentUser.role==="operator"?`
             <div class="controls">
                 <button type="button" class="btn start" data-location="${location}" data-id="${machine.id}">▶</button>
                 <button type="button" class="btn pause" data-location="${location}" data-id="${machine.id}">⏸</button>
                 <button type="button" class="btn stop" data-location="${location}" data-id="${machine.id}">⛔</button>
             </div>`:""}
-        
-        ${machine.next_job?`
-            <div class="next-job-card">
-                <h4>Next Job Queue</h4>
-                <p>WO: ${machine.next_job.work_order}</p>
-                <p>Size: ${machine.next_job.pipe_size}</p>
-                <p>Produced: ${machine.next_job.produced_qty}/${machine.next_job.total_qty}</p>
-                <p>ETA: <span id="next-eta-${machine.id}">${formatTime(machine.next_job.remaining_time)}</span></p>
-            </div>`:""}`;
-
-    if(card){
-        card.innerHTML = cardHTML;
-    } else {
-        card = document.createElement("div");
-        card.className = `machine status-${machine.status}`;
-        card.id = `machine-${machine.id}`;
-        card.innerHTML = cardHTML;
-        parentGrid.appendChild(card);
+        <div class="next-job-card" style="display:none"></div>`;
+    c = cards[machine.id] = {
+        el, location, role: currentUser.role, job: null, next: null,
+        ref: {
+            name: el.querySelector(".machine-name"),
+            status: el.querySelector(".machine-status"),
+            edit: el.querySelector(".edit"),
+            job: el.querySelector(".job-card"),
+            next: el.querySelector(".next-job-card")
+        }
+    };
+    return c;
+}
+
+function patchMachineCard(machine, location){
+    const c = machineCard(machine, location), r = c.ref, id = machine.id;
+
+    if(setText(r.name, machine.name) && r.edit) r.edit.dataset.name = machine.name;
+    if(setText(r.status, machine.status.toUpperCase())) c.el.className = `machine status-${machine.status}`;
+
+    // Current job: skeleton swapped only when a job appears/disappears
+    const job = machine.job;
+    if(!!job !== !!c.job){
+        r.job.innerHTML = job ? `<p>WO: <span class="job-wo"></span></p>
+                <p>Size: <span class="job-size"></span></p>
+                <p>Produced: <span class="job-produced"></span></p>
+                <p>Remaining: <span id="eta-${id}"></span></p>
+                <p>Progress: <span class="job-progress"></span></p>
+                <div class="progress-bar-container"><div class="progress-bar"></div></div>`
+            : `<p>No Job</p>`;
+        c.job = job ? {
+            wo: r.job.querySelector(".job-wo"), size: r.job.querySelector(".job-size"),
+            produced: r.job.querySelector(".job-produced"), eta: r.job.querySelector(`#eta-${id}`),
+            progress: r.job.querySelector(".job-progress"), bar: r.job.querySelector(".progress-bar"), pct: null
+        } : null;
+        if(!job) countdowns.delete(`eta-${id}`);
+    }
+    if(job){
+        const j = c.job;
+        const pct = job.progress_percent != null ? Math.min(+job.progress_percent.toFixed(1), 100) : 0;
+        setText(j.wo, job.work_order);
+        setText(j.size, job.size);
+        setText(j.produced, `${job.completed_qty}/${job.total_qty}`);
+        setText(j.progress, `${pct}%`);
+        if(j.pct !== pct){
+            j.pct = pct;
+            j.bar.style.width = `${pct}%`;
+            j.bar.style.backgroundColor = pct>=90?'red':pct>=75?'orange':'green';
+        }
+        setCountdown(`eta-${id}`, j.eta, job.remaining_time, machine.status==="running");
     }
 
-    if(machine.job?.remaining_time!=null) setupETACountdown(machine.id, machine.job.remaining_time);
-    if(machine.next_job?.remaining_time!=null) setupNextJobCountdown(machine.id, machine.next_job.remaining_time);
+    // Next job queue
+    const next = machine.next_job;
+    if(!!next !== !!c.next){
+        r.next.style.display = next ? "" : "none";
+        r.next.innerHTML = next ? `<h4>Next Job Queue</h4>
+                <p>WO: <span class="next-wo"></span></p>
+                <p>Size: <span class="next-size"></span></p>
+                <p>Produced: <span class="next-produced"></span></p>
+                <p>ETA: <span id="next-eta-${id}"></span></p>` : "";
+        c.next = next ? {
+            wo: r.next.querySelector(".next-wo"), size: r.next.querySelector(".next-size"),
+            produced: r.next.querySelector(".next-produced"), eta: r.next.querySelector(`#next-eta-${id}`)
+        } : null;
+        if(!next) countdowns.delete(`next-eta-${id}`);
+    }
+    if(next){
+        const n = c.next;
+        setText(n.wo, next.work_order);
+        setText(n.size, next.pipe_size);
+        setText(n.produced, `${next.produced_qty}/${next.total_qty}`);
+        setCountdown(`next-eta-${id}`, n.eta, next.remaining_time, true);
+    }
+}
+
+// Kept for single-card updates outside a frame (machine actions)
+function createOrUpdateMachineCard(machine, location, parentGrid){
+    const c = machineCard(machine, location);
+    if(!c.el.isConnected) parentGrid.appendChild(c.el);
+    patchMachineCard(machine, location);
+}
+
+// Write only when the value differs (no layout/paint for unchanged fields)
+function setText(el, value){
+    const text = value==null ? "N/A" : String(value);
+    if(el.textContent === text) return false;
+    el.textContent = text;
+    return true;
 }
 
 /************************
@@ -275,40 +428,60 @@ async function machineAction(e,action,location,id){
 
 /************************
  * NEW JOB ALERT
+ * The same frame carries the machine's new job, which patchMachineCard renders
  ************************/
 function handleNewJob(job){
-    const {machine_id,work_order,qty,pipe_size,eta}=job;
-    const machineEl=document.getElementById(`machine-${machine_id}`);
-    if(!machineEl) return;
-    createAlert(`New job assigned to ${machineEl.querySelector("h3").innerText}: ${work_order}`,1);
-    const jobCard=machineEl.querySelector(".job-card");
-    if(jobCard){
-        jobCard.innerHTML=`<p>WO: ${work_order}</p>
-            <p>Size: ${pipe_size}</p>
-            <p>Produced: 0/${qty}</p>
-            <p>Remaining: <span id="eta-${machine_id}">${formatTime(eta)}</span></p>
-            <p>Progress: 0%</p>
-            <div class="progress-bar-container">
-                <div class="progress-bar" style="width:0%;background-color:green"></div>
-            </div>`;
-    }
-    setupETACountdown(machine_id,eta);
+    const c = cards[job.machine_id];
+    if(!c) return;
+    createAlert(`New job assigned to ${c.ref.name.textContent}: ${job.work_order}`,1);
 }
 
 /************************
- * ETA / NEXT JOB COUNTDOWN
+ * ETA / NEXT JOB COUNTDOWN (one shared 1 Hz clock)
+ * Each countdown stores a deadline; the clock derives the remaining
+ * time from it, so late ticks never drift and frames just move deadlines.
  ************************/
+const countdowns = new Map();   // element id → {el, seconds, deadline, ticking}
+let clockTimer = null;
+
 function formatTime(sec){if(!sec||sec<0)return "0:00"; const m=Math.floor(sec/60); const s=Math.floor(sec%60); return `${m}:${s.toString().padStart(2,'0')}`;}
-function setupETACountdown(id,sec){clearInterval(etaIntervals[id]);let t=sec; etaIntervals[id]=setInterval(()=>{const el=document.getElementById(`eta-${id}`);if(!el) return; el.textContent=formatTime(t--); if(t<0) clearInterval(etaIntervals[id]);},1000);}
-function setupNextJobCountdown(id,sec){clearInterval(nextJobIntervals[id]);let t=sec; nextJobIntervals[id]=setInterval(()=>{const el=document.getElementById(`next-eta-${id}`);if(!el) return; el.textContent=formatTime(t--); if(t<0) clearInterval(nextJobIntervals[id]);},1000);}
+
+function setCountdown(key, el, seconds, ticking){
+    if(seconds==null){ countdowns.delete(key); setText(el, "N/A"); return; }
+    const c = countdowns.get(key);
+    // Same server value while ticking: keep the running deadline (no jump back)
+    if(!c || c.el!==el || c.seconds!==seconds || c.ticking!==ticking){
+        countdowns.set(key, {el, seconds, deadline: performance.now() + seconds*1000, ticking});
+    }
+    renderCountdown(countdowns.get(key), performance.now());
+    if(!clockTimer) clockTimer = setInterval(tickClock, 1000);
+}
+
+function renderCountdown(c, now){
+    setText(c.el, formatTime(c.ticking ? (c.deadline-now)/1000 : c.seconds));
+}
+
+function tickClock(){
+    if(document.hidden) return;
+    const now = performance.now();
+    countdowns.forEach((c, key)=>{
+        if(!c.el.isConnected){ if(!cards[key.replace(/\D+/g,"")]) countdowns.delete(key); return; }
+        renderCountdown(c, now);
+    });
+}
 
 /************************
  * ALERTS PANEL
  ************************/
+// Progress alerts fire once when a machine crosses 75 / 90 / 100 %, not on every frame
+const progressLevels = {};
 function handleAlerts(data){
-    const alertsContainer=document.getElementById("alerts"); if(!alertsContainer) return; alertsContainer.innerHTML="";
     data.locations.forEach(loc=>{loc.machines.forEach(m=>{
-        if(m.job){const p=m.job.progress_percent;if(p>=75&&p<90) createAlert(`${m.name} reached 75% progress!`,1); else if(p>=90&&p<100) createAlert(`${m.name} reached 90% progress!`,2); else if(p>=100) createAlert(`${m.name} completed!`,3);}})});
+        const p=m.job?.progress_percent??0;
+        const level=p>=100?3:p>=90?2:p>=75?1:0;
+        const prev=progressLevels[m.id]; progressLevels[m.id]=level;
+        if(!level || (prev!==undefined && level<=prev)) return;
+        if(level===1) createAlert(`${m.name} reached 75% progress!`,1); else if(level===2) createAlert(`${m.name} reached 90% progress!`,2); else createAlert(`${m.name} completed!`,3);})});
 }
 function createAlert(message,level){
     const alertsContainer=document.getElementById("alerts"); 
@@ -324,17 +497,33 @@ function createAlert(message,level){
 /************************
  * METRICS MODAL (AUTO-REFRESH)
  ************************/
+let oeeCache = {};
+let oeeLoadedAt = 0;
+const OEE_REFRESH_MS = 30000;
+
+async function loadOEE(){
+    try{
+        const res = await fetch(`${API_BASE}/metrics/oee?hours=8&group_by=machine`);
+        const data = await res.json();
+        oeeCache = Object.fromEntries(data.rows.map(r=>[r.machine_id,r]));
+        oeeLoadedAt = Date.now();
+        if(dashboardCache?.locations) updateMetricsModal(dashboardCache);
+    }catch(err){ console.error("OEE fetch failed", err); }
+}
+
 function updateMetricsModal(data){
     const modal=document.getElementById("metrics-modal");
-    if(!modal) return;
+    if(!modal || modal.classList.contains("hidden") || !data?.locations) return;
+    if(Date.now()-oeeLoadedAt > OEE_REFRESH_MS){ oeeLoadedAt = Date.now(); loadOEE(); }
     const tbody=modal.querySelector("tbody"); tbody.innerHTML="";
     data.locations.forEach(loc=>{loc.machines.forEach(m=>{
+        const o=oeeCache[m.id];
         const tr=document.createElement("tr");
-        tr.innerHTML=`<td>${loc.name}</td><td>${m.name}</td><td>${m.status}</td><td>${m.job?m.job.work_order:"N/A"}</td><td>${m.job?`${m.job.completed_qty}/${m.job.total_qty}`:"-"}</td><td>${m.job?m.job.progress_percent:0}</td>`;
+        tr.innerHTML=`<td>${loc.name}</td><td>${m.name}</td><td>${m.status}</td><td>${m.job?m.job.work_order:"N/A"}</td><td>${m.job?`${m.job.completed_qty}/${m.job.total_qty}`:"-"}</td><td>${m.job?m.job.progress_percent.toFixed(1):0}</td><td>${o?o.availability:"-"}</td><td>${o?o.performance:"-"}</td><td>${o?o.oee:"-"}</td><td>${o?o.throughput_mph:"-"}</td>`;
         tbody.appendChild(tr);
     })});
 }
-function openMetricsModal(){document.getElementById("metrics-modal")?.classList.remove("hidden");}
+function openMetricsModal(){document.getElementById("metrics-modal")?.classList.remove("hidden"); loadOEE();}
 function closeMetricsModal(){document.getElementById("metrics-modal")?.classList.add("hidden");}
 function exportTableToCSV(tableId, filename='export.csv'){const table=document.getElementById(tableId); const rows=Array.from(table.querySelectorAll('tr')); const csv=rows.map(r=>Array.from(r.querySelectorAll('th,td')).map(c=>`"${c.textContent}"`).join(',')).join('\n'); const blob=new Blob([csv],{type:'text/csv'}); const link=document.createElement('a'); link.href=URL.createObjectURL(blob); link.download=filename; link.click();}
 
@@ -348,9 +537,11 @@ function initFilters(){
     users.filter(u=>u.location!=="all").forEach(u=>{
         if(!Array.from(locSelect.options).some(o=>o.value===u.location)) locSelect.innerHTML+=`<option value="${u.location}">${u.location}</option>`;
     });
-    locSelect.addEventListener("change",loadDashboard);
-    document.getElementById("filter-status").addEventListener("change",loadDashboard);
-    document.getElementById("search-machine").addEventListener("input",loadDashboard);
+    // Filters re-render from the last frame; no refetch
+    const rerender = () => renderDashboard(dashboardCache);
+    locSelect.addEventListener("change",rerender);
+    document.getElementById("filter-status").addEventListener("change",rerender);
+    document.getElementById("search-machine").addEventListener("input",rerender);
 }
 
 /************************
@@ -399,8 +590,8 @@ async function editMachineName(e, location, machineId, oldName) {
         // 🔄 Update UI instantly (no reload)
         const card = document.getElementById(`machine-${machineId}`);
         if (card) {
-            const h3 = card.querySelector("h3");
-            h3.childNodes[0].nodeValue = newName + " ";
+            card.querySelector(".machine-name").textContent = newName;
+            card.querySelector(".edit").dataset.name = newName;
         }
 
         createAlert(`✅ Machine renamed to ${newName}`, 0);
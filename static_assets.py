@@ -0,0 +1,161 @@
+# =====================================================
+# static_assets.py – In-Memory Frontend Asset Pipeline
+# index.html, script.js and style.css are loaded once, given
+# content-hashed URLs and precompressed (gzip, brotli when
+# installed). Hashed assets are immutable for a year; index.html
+# is revalidated with its ETag, so a reloading tablet gets a
+# 304 and nothing else.
+# =====================================================
+import os
+import re
+import gzip
+import hashlib
+import logging
+import threading
+from typing import Dict, Optional
+
+from fastapi import APIRouter, Request
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+ASSET_DIR = os.getenv("FRONTEND_DIR", os.path.dirname(os.path.abspath(__file__)))
+INDEX_FILE = "index.html"
+ASSET_FILES = ("script.js", "style.css")
+STATIC_RELOAD = os.getenv("STATIC_RELOAD", "0") == "1"  # dev: pick up edits without restart
+
+CONTENT_TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".js": "application/javascript; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+}
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+router = APIRouter(tags=["Frontend"])
+
+# =====================================================
+# ASSET
+# =====================================================
+class Asset:
+    """One file body with its precompressed variants and strong ETag."""
+
+    def __init__(self, name: str, body: bytes):
+        self.name = name
+        self.content_type = CONTENT_TYPES.get(os.path.splitext(name)[1], "application/octet-stream")
+        self.digest = hashlib.sha256(body).hexdigest()[:12]
+        self.etag = f'"{self.digest}"'
+        self.variants = {"identity": body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.variants["br"] = brotli.compress(body, quality=11)
+
+    @property
+    def hashed_name(self) -> str:
+        stem, ext = os.path.splitext(self.name)
+        return f"{stem}.{self.digest}{ext}"
+
+    def pick(self, accept_encoding: str) -> str:
+        accepted = {part.split(";")[0].strip() for part in accept_encoding.lower().split(",")}
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and encoding in accepted:
+                return encoding
+        return "identity"
+
+    def response(self, request: Request, cache_control: str) -> Response:
+        headers = {"ETag": self.etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+        if self.etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+        encoding = self.pick(request.headers.get("accept-encoding", ""))
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(self.variants[encoding], media_type=self.content_type, headers=headers)
+
+# =====================================================
+# PIPELINE
+# =====================================================
+class AssetPipeline:
+    def __init__(self, directory: str = ASSET_DIR):
+        self.directory = directory
+        self.index: Optional[Asset] = None
+        self.assets: Dict[str, Asset] = {}   # plain and hashed name → Asset
+        self.hashed: Dict[str, str] = {}     # plain name → hashed name
+        self._mtimes: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _read(self, name: str) -> Optional[bytes]:
+        path = os.path.join(self.directory, name)
+        try:
+            self._mtimes[name] = os.path.getmtime(path)
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            logging.error(f"Frontend asset missing: {path}")
+            return None
+
+    def build(self):
+        assets, hashed = {}, {}
+        for name in ASSET_FILES:
+            body = self._read(name)
+            if body is None:
+                continue
+            asset = Asset(name, body)
+            assets[name] = assets[asset.hashed_name] = asset
+            hashed[name] = asset.hashed_name
+
+        index = None
+        html = self._read(INDEX_FILE)
+        if html is not None:
+            # /static/script.js → /static/script.<hash>.js
+            pattern = re.compile(r'(["\'])/static/(' + "|".join(map(re.escape, hashed)) + r')\1')
+            text = pattern.sub(lambda m: f"{m.group(1)}/static/{hashed[m.group(2)]}{m.group(1)}",
+                               html.decode("utf-8")) if hashed else html.decode("utf-8")
+            index = Asset(INDEX_FILE, text.encode("utf-8"))
+
+        with self._lock:
+            self.assets, self.hashed, self.index = assets, hashed, index
+        logging.info(f"🗂️ Frontend assets loaded: {', '.join(hashed.values()) or 'none'}")
+
+    def _maybe_reload(self):
+        if not STATIC_RELOAD:
+            return
+        for name, mtime in list(self._mtimes.items()):
+            try:
+                if os.path.getmtime(os.path.join(self.directory, name)) != mtime:
+                    self.build()
+                    return
+            except OSError:
+                continue
+
+    def get_index(self) -> Optional[Asset]:
+        self._maybe_reload()
+        return self.index
+
+    def get(self, name: str) -> Optional[Asset]:
+        self._maybe_reload()
+        return self.assets.get(name)
+
+
+pipeline = AssetPipeline()
+pipeline.build()
+
+# =====================================================
+# ROUTES
+# =====================================================
+@router.get("/", include_in_schema=False)
+def get_dashboard(request: Request):
+    index = pipeline.get_index()
+    if index is None:
+        return Response("<h1>Dashboard HTML not found!</h1>", status_code=404, media_type="text/html")
+    return index.response(request, REVALIDATE)
+
+
+@router.get("/static/{name}", include_in_schema=False)
+def get_static(name: str, request: Request):
+    asset = pipeline.get(name)
+    if asset is None:
+        return Response(status_code=404)
+    # Only the content-hashed URL may be cached forever; plain names revalidate
+    return asset.response(request, IMMUTABLE if name != asset.name else REVALIDATE)
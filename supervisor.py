@@ -0,0 +1,294 @@
+# =====================================================
+# supervisor.py – Background Job Supervisor
+# Periodic loops (meter tick, ERP sync, history, rollup, …) are
+# registered here instead of running as `while True: work; sleep(n)`:
+#  • fixed rate: run k is due at anchor + k·interval, so the time
+#    spent working never adds up to drift; slots missed by a slow
+#    run are skipped, not replayed as a burst
+#  • jitter: random offset per run, so jobs with the same interval
+#    don't all hit the DB in the same loop iteration
+#  • watchdog: a run over max_runtime is cancelled (coroutines) or
+#    abandoned (thread jobs) and counted as a failure
+#  • no overlap: a slot is skipped while an abandoned run is
+#    still in flight
+#  • failures back off exponentially, then the schedule re-anchors
+#  • long-lived services (publisher, ingestor) are restarted with
+#    the same backoff when they crash or return; one that stays up
+#    past its grace period counts as recovered
+# GET /api/health/jobs → per-job last run, duration, lag, errors
+# =====================================================
+import os
+import random
+import asyncio
+import logging
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from fastapi import APIRouter
+
+import clock
+from metrics import JOB_SECONDS, JOB_LAG, JOB_FAILURES
+from wire import FastJSONResponse
+
+JOB_BACKOFF_MAX_S = float(os.getenv("JOB_BACKOFF_MAX_S", 300))  # cap for failure / restart backoff
+JOB_STALE_RUNS = float(os.getenv("JOB_STALE_RUNS", 3))  # unhealthy after this many intervals without a run
+JOB_SERVICE_GRACE_S = float(os.getenv("JOB_SERVICE_GRACE_S", 30))  # service up this long → failures reset
+
+
+def _iso(dt: Optional[datetime]) -> Optional[str]:
+    return dt.isoformat() if dt else None
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+class Job:
+    """One registered job and its run statistics (interval None → service)."""
+
+    def __init__(self, name: str, func: Callable, interval: Optional[float] = None, jitter: float = 0.0,
+                 max_runtime: Optional[float] = None, thread: bool = False, initial_delay: float = 0.0,
+                 on_done: Optional[Callable[[float, float], None]] = None,
+                 max_backoff: float = JOB_BACKOFF_MAX_S, grace: float = JOB_SERVICE_GRACE_S):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.max_runtime = max_runtime
+        self.thread = thread
+        self.initial_delay = initial_delay
+        self.on_done = on_done  # (lag_s, duration_s) after every run
+        self.max_backoff = max_backoff
+        self.grace = grace  # services only
+
+        self.task: Optional[asyncio.Task] = None
+        self.inflight: Optional[asyncio.Future] = None  # thread run abandoned by the watchdog
+        self.running = False
+        self.runs = self.failures = self.timeouts = self.skipped = self.overlaps = self.restarts = 0
+        self.consecutive_failures = 0
+        self.last_started: Optional[datetime] = None
+        self.last_finished: Optional[datetime] = None
+        self.last_success: Optional[datetime] = None
+        self.last_duration: Optional[float] = None
+        self.last_lag: Optional[float] = None
+        self.max_lag = 0.0
+        self.last_error: Optional[str] = None
+        self.next_due: Optional[float] = None  # loop time
+
+    @property
+    def kind(self) -> str:
+        return "service" if self.interval is None else "periodic"
+
+    def backoff(self) -> float:
+        base = self.interval or 1.0
+        return min(self.max_backoff, base * 2 ** max(0, self.consecutive_failures - 1))
+
+    def healthy(self) -> bool:
+        if self.task is None or self.task.done() or self.consecutive_failures:
+            return False
+        if self.kind == "service":
+            return self.running
+        if self.last_started is None:
+            return True  # not due yet
+        age = (clock.now() - self.last_started).total_seconds()
+        return age <= self.interval * JOB_STALE_RUNS + self.jitter + (self.max_runtime or 0)
+
+    def status(self, now: float) -> Dict:
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "healthy": self.healthy(),
+            "running": self.running,
+            "interval_s": self.interval,
+            "jitter_s": self.jitter,
+            "max_runtime_s": self.max_runtime,
+            "runs": self.runs,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "timeouts": self.timeouts,
+            "skipped": self.skipped,
+            "overlaps": self.overlaps,
+            "restarts": self.restarts,
+            "last_run": _iso(self.last_started),
+            "last_success": _iso(self.last_success),
+            "last_duration_ms": _ms(self.last_duration),
+            "last_lag_ms": _ms(self.last_lag),
+            "max_lag_ms": _ms(self.max_lag),
+            "next_run_in_s": round(max(0.0, self.next_due - now), 3) if self.next_due is not None else None,
+            "last_error": self.last_error,
+        }
+
+
+class Supervisor:
+    def __init__(self):
+        self.jobs: Dict[str, Job] = {}
+        self.started = False
+
+    # -------------------------------
+    # REGISTRATION
+    # -------------------------------
+    def every(self, name: str, interval: float, func: Callable, jitter: float = 0.0,
+              max_runtime: Optional[float] = None, thread: bool = False, initial_delay: float = 0.0,
+              on_done: Optional[Callable[[float, float], None]] = None,
+              max_backoff: float = JOB_BACKOFF_MAX_S) -> Job:
+        """
+        Run `func` every `interval` seconds: an async callable, or a sync
+        one on the default executor with thread=True. Failures delay the
+        next run by interval · 2^(n-1), capped at max_backoff.
+        """
+        if name in self.jobs:
+            raise ValueError(f"Job '{name}' already registered")
+        job = self.jobs[name] = Job(name, func, interval, jitter, max_runtime, thread, initial_delay, on_done,
+                                        max_backoff)
+        if self.started:
+            self._launch(job)
+        return job
+
+    def service(self, name: str, factory: Callable[[], Awaitable], grace: float = JOB_SERVICE_GRACE_S) -> Job:
+        """
+        Keep the long-running coroutine `factory()` alive (restart with
+        backoff). A run that survives `grace` seconds resets the failure
+        streak, so the next crash starts the backoff over.
+        """
+        if name in self.jobs:
+            raise ValueError(f"Job '{name}' already registered")
+        job = self.jobs[name] = Job(name, factory, grace=grace)
+        if self.started:
+            self._launch(job)
+        return job
+
+    def start(self):
+        self.started = True
+        for job in self.jobs.values():
+            self._launch(job)
+        logging.info(f"🗓️ Supervisor started ({len(self.jobs)} jobs)")
+
+    def _launch(self, job: Job):
+        runner = self._run_periodic if job.interval is not None else self._run_service
+        job.task = asyncio.create_task(runner(job), name=f"job:{job.name}")
+
+    async def stop(self):
+        tasks = [job.task for job in self.jobs.values() if job.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.started = False
+
+    # -------------------------------
+    # RUNNERS
+    # -------------------------------
+    def _failed(self, job: Job, reason: str, error: str):
+        job.failures += 1
+        job.consecutive_failures += 1
+        job.last_error = error
+        JOB_FAILURES.inc(job=job.name, reason=reason)
+        logging.error(f"JOB {job.name} {reason.upper()}: {error} (retry in {job.backoff():.0f}s)")
+
+    async def _execute(self, job: Job, lag: float) -> bool:
+        loop = asyncio.get_running_loop()
+        job.running = True
+        job.runs += 1
+        job.last_lag = lag
+        job.max_lag = max(job.max_lag, lag)
+        job.last_started = clock.now()
+        started = loop.time()
+        try:
+            if job.thread:
+                job.inflight = loop.run_in_executor(None, job.func)
+                # shield: on timeout the thread can't be stopped, only abandoned (inflight stays set)
+                await asyncio.wait_for(asyncio.shield(job.inflight), job.max_runtime)
+            else:
+                await asyncio.wait_for(job.func(), job.max_runtime)
+            job.consecutive_failures = 0
+            job.last_success = clock.now()
+            return True
+        except asyncio.TimeoutError:
+            job.timeouts += 1
+            self._failed(job, "timeout", f"still running after {job.max_runtime:.0f}s")
+            return False
+        except Exception as e:
+            self._failed(job, "error", f"{type(e).__name__}: {e}")
+            return False
+        finally:
+            duration = loop.time() - started
+            job.running = False
+            job.last_finished = clock.now()
+            job.last_duration = duration
+            JOB_SECONDS.observe(duration, job=job.name)
+            JOB_LAG.observe(lag, job=job.name)
+            if job.on_done:
+                job.on_done(lag, duration)
+
+    async def _run_periodic(self, job: Job):
+        loop = asyncio.get_running_loop()
+        anchor, k = loop.time() + job.initial_delay, 0
+        while True:
+            due = anchor + k * job.interval + (random.uniform(0, job.jitter) if job.jitter else 0.0)
+            job.next_due = due
+            await asyncio.sleep(max(0.0, due - loop.time()))
+
+            if job.inflight is not None and not job.inflight.done():
+                job.overlaps += 1  # the abandoned run still holds its resources
+                ok = True
+            else:
+                job.inflight = None
+                ok = await self._execute(job, max(0.0, loop.time() - due))
+
+            if not ok:
+                anchor, k = loop.time() + job.backoff(), 0
+                continue
+            k += 1
+            behind = loop.time() - (anchor + k * job.interval)
+            if behind > 0:  # the run overran whole slots: skip them, stay on the grid
+                missed = int(behind // job.interval) + 1
+                job.skipped += missed
+                k += missed
+
+    async def _run_service(self, job: Job):
+        while True:
+            job.running = True
+            job.last_started = clock.now()
+            run = asyncio.ensure_future(job.func())
+            try:
+                done, _ = await asyncio.wait({run}, timeout=job.grace)
+                if not done:  # stayed up: the crash streak is over
+                    job.consecutive_failures = 0
+                    job.last_success = clock.now()
+                await run
+                error = ("exit", "service returned")
+            except asyncio.CancelledError:
+                run.cancel()
+                raise
+            except Exception as e:
+                error = ("error", f"{type(e).__name__}: {e}")
+            finally:
+                job.running = False
+                job.last_finished = clock.now()
+            self._failed(job, *error)
+            await asyncio.sleep(job.backoff())
+            job.restarts += 1
+
+    # -------------------------------
+    # HEALTH
+    # -------------------------------
+    def status(self) -> List[Dict]:
+        try:
+            now = asyncio.get_running_loop().time()
+        except RuntimeError:
+            now = 0.0
+        return [job.status(now) for _, job in sorted(self.jobs.items())]
+
+
+supervisor = Supervisor()
+
+# =====================================================
+# API
+# =====================================================
+router = APIRouter(prefix="/api/health", tags=["Monitoring"])
+
+
+@router.get("/jobs")
+async def job_health():
+    jobs = supervisor.status()
+    ok = supervisor.started and all(j["healthy"] for j in jobs)
+    return FastJSONResponse({"ok": ok, "jobs": jobs}, status_code=200 if ok else 503)
@@ -0,0 +1,282 @@
+# =====================================================
+# telemetry.py – High-Rate Counter Ingestion (PLC / Encoder)
+# Batched, idempotent readings → deduplicated + reordered
+# in memory → one bulk DB transaction per flush interval
+# =====================================================
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Set
+
+from fastapi import APIRouter
+from pydantic import BaseModel
+from sqlalchemy import insert
+
+from database import SessionLocal
+from models import Machine, ProductionLog, ERPNextMetadata, TelemetryState
+from transitions import apply_status
+
+FLUSH_INTERVAL = float(os.getenv("TELEMETRY_FLUSH_MS", 250)) / 1000
+LIVE_WINDOW = float(os.getenv("TELEMETRY_LIVE_S", 30))  # simulated meters pause while telemetry is live
+MACHINE_RELOAD_S = float(os.getenv("TELEMETRY_MACHINE_RELOAD_S", 5))  # valid machine ids reloaded this often
+
+# =====================================================
+# Pydantic Models
+# =====================================================
+class CounterReading(BaseModel):
+    machine_id: int
+    seq: int          # monotonically increasing per machine (per counter source)
+    length: float     # cumulative meters reported by the counter
+    ts: datetime
+
+class ReadingBatch(BaseModel):
+    readings: List[CounterReading]
+
+# =====================================================
+# INGESTOR
+# =====================================================
+class TelemetryIngestor:
+    """
+    Counters are cumulative, so only the highest-seq reading per machine
+    matters for a flush: lower sequence numbers arriving late are implied
+    by it (reorder), repeats of an applied seq are dropped (dedup).
+    Memory is bounded by the number of machines, not the reading rate:
+    readings for ids that are not machines are rejected (the id set is
+    reloaded by a supervisor job every MACHINE_RELOAD_S), and a seq only
+    counts as seen once its flush has committed (or its batch has been
+    handed to the meter engine). Flushes run their transaction on a
+    worker thread, so ingest never waits on the database.
+    """
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self.pending: Dict[int, CounterReading] = {}
+        self.seen_seq: Dict[int, int] = {}
+        self.last_seen: Dict[int, float] = {}
+        self.machine_ids: Optional[Set[int]] = None  # loaded by load(); None → not validated
+        self.stats = {"accepted": 0, "duplicates": 0, "out_of_order": 0, "rejected": 0, "unknown": 0,
+                      "flushes": 0, "failed_flushes": 0, "meters": 0, "last_flush_ms": 0.0}
+        # Hooks wired by main.py
+        self.on_meter: Optional[Callable[[Machine, datetime, int], None]] = None
+        self.on_complete: Optional[Callable[[Machine, Optional[tuple]], None]] = None  # after commit
+        self.on_flush: Optional[Callable[[], None]] = None
+        # Set when the meter engine runs out of process: deduplicated batches go there
+        self.forward: Optional[Callable[[List[CounterReading]], None]] = None
+        self._wake = asyncio.Event()
+
+    def load(self):
+        db = SessionLocal()
+        try:
+            self.machine_ids = {mid for (mid,) in db.query(Machine.id)}
+            for st in db.query(TelemetryState).all():
+                self.seen_seq[st.machine_id] = st.last_seq
+        finally:
+            db.close()
+
+    def reload_machine_ids(self):
+        """Supervisor job (worker thread): pick up machines added since startup."""
+        db = SessionLocal()
+        try:
+            self.machine_ids = {mid for (mid,) in db.query(Machine.id)}
+        finally:
+            db.close()
+
+    def is_live(self, machine_id: int) -> bool:
+        seen = self.last_seen.get(machine_id)
+        return seen is not None and time.monotonic() - seen < LIVE_WINDOW
+
+    # -------------------------------
+    # INGEST (no DB access)
+    # -------------------------------
+    def ingest(self, readings: List[CounterReading]) -> Dict:
+        accepted = duplicates = out_of_order = 0
+        rejected = set()
+        now = time.monotonic()
+        for r in readings:
+            if self.machine_ids is not None and r.machine_id not in self.machine_ids:
+                rejected.add(r.machine_id)
+                continue
+            pending = self.pending.get(r.machine_id)
+            if pending is not None and r.seq < pending.seq:
+                out_of_order += 1  # superseded by a newer cumulative reading
+                continue
+            if r.seq <= self.seen_seq.get(r.machine_id, -1) or (pending is not None and r.seq == pending.seq):
+                duplicates += 1
+                continue
+            self.pending[r.machine_id] = r
+            self.last_seen[r.machine_id] = now
+            accepted += 1
+        self.stats["accepted"] += accepted
+        self.stats["duplicates"] += duplicates
+        self.stats["out_of_order"] += out_of_order
+        self.stats["rejected"] += len(rejected)
+        if accepted:
+            self._wake.set()
+        return {"accepted": accepted, "duplicates": duplicates, "out_of_order": out_of_order,
+                "rejected": sorted(rejected)}
+
+    def _mark_seen(self, batch: Dict[int, CounterReading]):
+        for mid, r in batch.items():
+            if r.seq > self.seen_seq.get(mid, -1):
+                self.seen_seq[mid] = r.seq
+
+    def _requeue(self, batch: Dict[int, CounterReading]):
+        """A batch that didn't persist goes back, unless a newer reading replaced it meanwhile."""
+        for mid, r in batch.items():
+            pending = self.pending.get(mid)
+            if pending is None or pending.seq < r.seq:
+                self.pending[mid] = r
+        self._wake.set()
+
+    def accept(self, readings: List[CounterReading]):
+        """Engine side of forward(): readings already deduplicated by the web process."""
+        now = time.monotonic()
+        for r in readings:
+            pending = self.pending.get(r.machine_id)
+            if pending is None or r.seq > pending.seq:
+                self.pending[r.machine_id] = r
+            self.last_seen[r.machine_id] = now
+        self._wake.set()
+
+    # -------------------------------
+    # FLUSH (one transaction)
+    # -------------------------------
+    async def flush(self):
+        self._wake.clear()
+        if not self.pending:
+            return
+        started = time.perf_counter()
+        batch, self.pending = self.pending, {}
+        try:
+            credited, completed, unknown = await asyncio.get_running_loop().run_in_executor(None, self._write, batch)
+        except Exception as e:
+            self.stats["failed_flushes"] += 1
+            self._requeue(batch)  # retried next interval; seen_seq untouched, so resends are accepted
+            logging.error(f"TELEMETRY FLUSH ERROR: {e}")
+        else:
+            self._mark_seen(batch)
+            self.stats["unknown"] += unknown
+            try:
+                for m, ts, meters in credited:
+                    self.stats["meters"] += meters
+                    if self.on_meter:
+                        self.on_meter(m, ts, meters)
+                for m, erp_update in completed:
+                    if self.on_complete:
+                        self.on_complete(m, erp_update)
+                if credited and self.on_flush:
+                    self.on_flush()
+            except Exception as e:
+                logging.error(f"TELEMETRY HOOK ERROR: {e}")
+        self.stats["flushes"] += 1
+        self.stats["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+    def _write(self, batch: Dict[int, CounterReading]):
+        """
+        One transaction on a worker thread: counter deltas → meters, logs
+        and completions. → (credited [(m, ts, meters)], completed
+        [(m, erp_update)], unknown ids); hooks run on the loop afterwards.
+        """
+        db = SessionLocal()
+        try:
+            ids = list(batch)
+            machines = {m.id: m for m in db.query(Machine).filter(Machine.id.in_(ids)).all()}
+            states = {s.machine_id: s for s in db.query(TelemetryState).filter(TelemetryState.machine_id.in_(ids)).all()}
+            now = datetime.now(timezone.utc)
+            logs, credited, completed, unknown = [], [], [], 0
+
+            for mid, r in batch.items():
+                m = machines.get(mid)
+                if not m:
+                    unknown += 1
+                    continue
+                st = states.get(mid)
+                if st is None:
+                    # First reading from this counter only sets the baseline
+                    db.add(TelemetryState(machine_id=mid, last_seq=r.seq, last_length=r.length, updated_at=now))
+                    continue
+                if r.seq <= st.last_seq:
+                    continue
+                if r.length >= st.last_length:
+                    delta = int(r.length) - int(st.last_length)
+                else:
+                    delta = int(r.length)  # counter reset / rollover
+                st.last_seq, st.last_length, st.updated_at = r.seq, r.length, now
+
+                if delta <= 0 or not m.work_order or m.produced_qty >= m.target_qty:
+                    continue
+                delta = min(delta, m.target_qty - m.produced_qty)
+                m.produced_qty += delta
+                m.last_tick_time = r.ts
+                logs.append({
+                    "machine_id": m.id,
+                    "location": m.location,
+                    "work_order": m.work_order,
+                    "pipe_size": m.pipe_size,
+                    "target_qty": m.target_qty,
+                    "produced_qty": delta,
+                    "remaining_qty": m.remaining(),
+                    "status": m.status,
+                    "timestamp": r.ts
+                })
+                credited.append((m, r.ts, delta))
+                if m.produced_qty >= m.target_qty:
+                    completed.append((m, apply_status(db, m, "completed", "telemetry")))
+
+            if credited:
+                done = {m.work_order for m, _ in completed}
+                for meta in db.query(ERPNextMetadata).filter(
+                    ERPNextMetadata.work_order.in_({m.work_order for m, _, _ in credited})
+                ).all():
+                    meta.erp_status = "Completed" if meta.work_order in done else "In Progress"
+                    meta.last_synced = now
+            if logs:
+                db.execute(insert(ProductionLog), logs)
+            db.commit()
+            return credited, completed, unknown
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        logging.info(f"📟 Telemetry ingestor started ({self.flush_interval * 1000:.0f} ms flush)")
+        while True:
+            await self._wake.wait()
+            started = loop.time()
+            if self.forward:
+                self._wake.clear()
+                batch, self.pending = self.pending, {}
+                try:
+                    self.forward(list(batch.values()))
+                except Exception as e:
+                    self.stats["failed_flushes"] += 1
+                    self._requeue(batch)
+                    logging.error(f"TELEMETRY FORWARD ERROR: {e}")
+                else:
+                    self._mark_seen(batch)  # handed to the engine, which persists it
+            else:
+                await self.flush()
+            await asyncio.sleep(max(0.0, self.flush_interval - (loop.time() - started)))
+
+
+ingestor = TelemetryIngestor()
+
+# =====================================================
+# API
+# =====================================================
+router = APIRouter(prefix="/api/telemetry", tags=["Telemetry"])
+
+
+@router.post("/ingest")
+async def ingest_readings(batch: ReadingBatch):
+    return {"ok": True, **ingestor.ingest(batch.readings)}
+
+
+@router.get("/stats")
+def telemetry_stats():
+    return {"pending": len(ingestor.pending), **ingestor.stats}
@@ -0,0 +1,62 @@
+import asyncio
+
+import alerts
+from alerts import AlertEngine, LEVEL_OK, LEVEL_WARNING
+from models import AlertState, Machine
+
+
+def _machine(db, work_order="WO-1", produced=80):
+    m = Machine(location="L1", name="M1", status="running", target_qty=100, produced_qty=produced,
+                seconds_per_meter=1.0, work_order=work_order)
+    db.add(m)
+    db.commit()
+    return m
+
+
+def test_alert_state_is_keyed_by_work_order_and_survives_restart(session_factory, monkeypatch):
+    monkeypatch.setattr(alerts, "SessionLocal", session_factory)
+
+    async def scenario():
+        published = []
+
+        async def publish(payload):
+            published.append(payload)
+
+        db = session_factory()
+        m = _machine(db)
+
+        engine = AlertEngine(publish)
+        engine.load()
+        engine.on_meter(m)
+        await asyncio.sleep(0)
+        assert [p["level"] for p in published if p["rule"] == "progress"] == [LEVEL_WARNING]
+        engine.checkpoint()
+        assert {(a.rule, a.work_order, a.level) for a in db.query(AlertState)} >= {("progress", "WO-1", LEVEL_WARNING)}
+
+        # Restart: the warning is restored, so the same meter event does not fire it again
+        published.clear()
+        restarted = AlertEngine(publish)
+        restarted.load()
+        assert restarted.state[(m.id, "progress", "WO-1")] == LEVEL_WARNING
+        restarted.on_meter(m)
+        await asyncio.sleep(0)
+        assert not [p for p in published if p["rule"] == "progress"]
+
+        # New job on the same machine: fresh alert cycle, previous job's rows pruned
+        m.work_order, m.produced_qty = "WO-2", 10
+        restarted.on_meter(m)
+        assert (m.id, "progress", "WO-1") not in restarted.state
+        assert restarted.state.get((m.id, "progress", "WO-2"), LEVEL_OK) == LEVEL_OK
+        m.produced_qty = 80
+        restarted.on_meter(m)
+        await asyncio.sleep(0)
+        assert [p["level"] for p in published if p["rule"] == "progress"] == [LEVEL_WARNING]
+        restarted.checkpoint()
+        db.expire_all()
+        assert {a.work_order for a in db.query(AlertState)} == {"WO-2"}
+
+        for timer in list(restarted._stall_timers.values()) + list(engine._stall_timers.values()):
+            timer.cancel()
+        db.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,28 @@
+from change_feed import ChangeFeed
+
+
+def _frame(*machines):
+    return {"locations": [{"name": "L1", "machines": [{"id": mid, "produced_qty": qty} for mid, qty in machines]}]}
+
+
+def test_since_merges_changes_and_falls_back_to_snapshot_on_gaps():
+    feed = ChangeFeed(size=3)
+    feed.record_frame(_frame((1, 0), (2, 0)))            # v1
+    feed.record_frame(_frame((1, 5), (2, 0)))            # v2
+    feed.record_event({"alert": "M2 stalled"})            # v3
+    feed.record_frame(_frame((1, 7)))                    # v4: machine 2 removed
+    assert feed.record_frame(_frame((1, 7))) is None     # unchanged frame: no version
+    assert feed.version == 4
+
+    # v2..v4 still buffered: latest row per machine, removals and alerts merged
+    resumed = feed.since(1)
+    assert resumed["version"] == 4
+    assert resumed["changes"] == [{"id": 1, "produced_qty": 7, "location": "L1"}]
+    assert resumed["removed"] == [2]
+    assert resumed["alerts"] == [{"alert": "M2 stalled"}]
+
+    assert feed.since(4)["changes"] == []                # up to date: empty diff
+    assert "snapshot" in feed.since(0)                   # v1 fell out of the ring buffer
+    assert "snapshot" in feed.since(9)                   # client from before a server restart
+    assert "snapshot" in feed.since(None)
+    assert feed.since(0)["snapshot"] == [{"name": "L1", "machines": [{"id": 1, "produced_qty": 7}]}]
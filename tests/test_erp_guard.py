@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+import erp_guard
+from erp_guard import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+def _outage():
+    raise requests.ConnectionError("ERPNext down")
+
+
+def _not_found():
+    response = requests.Response()
+    response.status_code = 404
+    raise requests.HTTPError("404", response=response)
+
+
+def test_breaker_opens_probes_and_closes(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(erp_guard, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    closed = []
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30, half_open_probes=1)
+    breaker.on_close = lambda: closed.append(breaker.state)
+
+    # 4xx means ERP answered: never counts as an outage
+    for _ in range(3):
+        with pytest.raises(requests.HTTPError):
+            breaker.call(_not_found)
+    assert breaker.state == CLOSED and breaker.failures == 0
+
+    # Consecutive outages open the circuit; calls then fail fast without running
+    for _ in range(2):
+        with pytest.raises(requests.ConnectionError):
+            breaker.call(_outage)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: pytest.fail("called while open"))
+    assert breaker.rejected == 1
+
+    # After the reset timeout one probe is let through; a failed probe reopens at once
+    now[0] += 30
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    assert not breaker.allow()  # only one concurrent probe
+    breaker.record_failure()
+    assert breaker.state == OPEN and not breaker.allow()
+
+    # A successful probe closes the circuit and fires on_close exactly once
+    now[0] += 30
+    assert breaker.call(lambda: "ok") == "ok"
+    assert breaker.state == CLOSED and closed == [CLOSED]
+    breaker.call(lambda: "ok")
+    assert closed == [CLOSED]
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+import main
+from main import MachineBatch, machine_batch
+from models import Machine, MachineTransition
+
+
+@pytest.fixture
+def hooks(monkeypatch):
+    """Record everything the batch does after its commit."""
+    calls = []
+    monkeypatch.setattr(main, "update_work_order_statuses", lambda updates: calls.append(("erp", updates)))
+    monkeypatch.setattr(main.oee_engine, "on_status", lambda m: calls.append(("oee", m.id)))
+    monkeypatch.setattr(main.alert_engine, "on_status", lambda m, old, new: calls.append(("alert", m.id)))
+    monkeypatch.setattr(main.publisher, "mark_dirty", lambda: calls.append(("publish",)))
+    return calls
+
+
+def _machines(db):
+    machines = [
+        Machine(location="L1", name="M1", status="free", work_order="WO-1", erpnext_work_order_id="ERP-1"),
+        Machine(location="L1", name="M2", status="running", work_order="WO-2", erpnext_work_order_id="ERP-2"),
+    ]
+    db.add_all(machines)
+    db.commit()
+    return machines
+
+
+def _batch(m1, m2):
+    return MachineBatch(actions=[
+        {"location": "L1", "machine_id": m1.id, "action": "start"},
+        {"location": "L1", "machine_id": m2.id, "action": "stop"},
+    ])
+
+
+def test_batch_commits_all_actions_then_runs_hooks(session_factory, hooks):
+    db = session_factory()
+    m1, m2 = _machines(db)
+
+    result = asyncio.run(machine_batch(_batch(m1, m2), db=db))
+
+    assert result["ok"] and [r["status"] for r in result["results"]] == ["running", "stopped"]
+    check = session_factory()
+    assert {m.id: m.status for m in check.query(Machine)} == {m1.id: "running", m2.id: "stopped"}
+    assert check.query(MachineTransition).count() == 2
+    assert ("publish",) in hooks and [c for c in hooks if c[0] == "erp"]
+    check.close()
+    db.close()
+
+
+def test_batch_failed_commit_rolls_back_every_action(session_factory, hooks):
+    db = session_factory()
+    m1, m2 = _machines(db)
+
+    @event.listens_for(db, "after_flush")
+    def fail(session, context):
+        raise OperationalError("COMMIT", {}, Exception("database is locked"))
+
+    result = asyncio.run(machine_batch(_batch(m1, m2), db=db))
+
+    assert not result["ok"]
+    assert all(not r["ok"] and r["error"] == "transaction failed" and "erp" not in r for r in result["results"])
+    check = session_factory()
+    assert {m.id: m.status for m in check.query(Machine)} == {m1.id: "free", m2.id: "running"}
+    assert check.query(MachineTransition).count() == 0
+    assert hooks == []  # no ERP push, engine update or frame for a batch that never happened
+    check.close()
+    db.close()
@@ -0,0 +1,29 @@
+import os
+import asyncio
+
+from meter_engine import MachineBoard, MeterEngineClient, TelemetryRelay
+
+
+def test_non_owner_worker_forwards_telemetry_to_engine():
+    async def scenario():
+        name = f"taco_test_board_{os.getpid()}"
+        board = MachineBoard.create(name, capacity=4)
+        received = []
+        relay = TelemetryRelay(name, board.header()["key"], received.extend)
+        worker = MeterEngineClient(name)
+        worker.board = MachineBoard.attach(name)
+        try:
+            assert not worker.owner
+            worker.forward(["r1", "r2"])
+            worker.forward(["r3"])
+            for _ in range(100):
+                if len(received) == 3:
+                    break
+                await asyncio.sleep(0.01)
+            assert received == ["r1", "r2", "r3"]
+        finally:
+            worker.stop()
+            relay.close()
+            board.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,10 @@
+from metrics import Counter, REGISTRY
+
+
+def test_label_values_are_escaped():
+    c = Counter("test_escape_total", "Escaping", ["error"])
+    try:
+        c.inc(error='bad "value"\\path\nnext')
+        assert c.render()[-1] == 'test_escape_total{error="bad \\"value\\"\\\\path\\nnext"} 1'
+    finally:
+        REGISTRY.metrics.remove(c)
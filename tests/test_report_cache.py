@@ -0,0 +1,56 @@
+import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timezone
+
+import report
+import report_cache
+from models import Machine, ProductionLog
+from report_cache import DayCache
+
+
+def test_closed_before_keeps_yesterday_open_for_the_grace_period(monkeypatch):
+    monkeypatch.setattr(report_cache, "REPORT_CACHE_GRACE_S", 300)
+    assert report_cache.closed_before(datetime(2026, 10, 19, 0, 4, tzinfo=timezone.utc)) == date(2026, 10, 18)
+    assert report_cache.closed_before(datetime(2026, 10, 19, 0, 6, tzinfo=timezone.utc)) == date(2026, 10, 19)
+
+
+def test_day_is_cached_only_after_it_closes(session_factory, monkeypatch):
+    cache = DayCache()
+    monkeypatch.setattr(report, "report_cache", cache)
+    monkeypatch.setattr(report, "ReadSessionLocal", session_factory)
+    monkeypatch.setattr(report, "_report_executor", ThreadPoolExecutor(max_workers=1))
+    monkeypatch.setattr(report, "_report_slots", None)
+    monkeypatch.setattr(report_cache, "REPORT_CACHE_GRACE_S", 300)
+    now = {"t": datetime(2026, 10, 19, 0, 2, tzinfo=timezone.utc)}
+    monkeypatch.setattr(report, "closed_before", lambda: report_cache.closed_before(now["t"]))
+
+    db = session_factory()
+    m = Machine(location="L1", name="M1", status="running", work_order="WO-1")
+    db.add(m)
+    db.commit()
+
+    def log(ts, qty):
+        db.add(ProductionLog(machine_id=m.id, location="L1", work_order="WO-1", produced_qty=qty,
+                             status="running", timestamp=ts))
+        db.commit()
+
+    def logs():
+        body = asyncio.run(report.production_log_report("json", "2026-10-17", None, None))
+        return [row["produced_qty"] for row in json.loads(body)["logs"]]
+
+    log(datetime(2026, 10, 17, 12, 0), 1)
+    log(datetime(2026, 10, 18, 23, 59), 2)
+
+    # 00:02: the 17th is closed and cached, the 18th is still served live
+    assert logs() == [2, 1]
+    assert {day for _, day in cache.entries} == {date(2026, 10, 17)}
+
+    # A late write for the 18th inside the grace period is not lost
+    log(datetime(2026, 10, 18, 23, 59, 30), 3)
+    now["t"] = datetime(2026, 10, 19, 0, 6, tzinfo=timezone.utc)
+    assert logs() == [3, 2, 1]
+    assert {day for _, day in cache.entries} == {date(2026, 10, 17), date(2026, 10, 18)}
+
+    report._report_executor.shutdown()
+    db.close()
@@ -0,0 +1,32 @@
+import asyncio
+
+from supervisor import Supervisor
+
+
+def test_service_recovers_after_crash_and_restart():
+    async def scenario():
+        sup = Supervisor()
+        calls = 0
+
+        async def flaky():
+            nonlocal calls
+            calls += 1
+            if calls == 1:
+                raise RuntimeError("boom")
+            await asyncio.Event().wait()  # runs normally from now on
+
+        job = sup.service("flaky", flaky, grace=0.05)
+        sup.start()
+        try:
+            await asyncio.sleep(0.01)
+            assert job.consecutive_failures == 1 and not job.healthy()
+
+            await asyncio.sleep(1.2)  # 1 s backoff, restart, then past the grace period
+            assert job.restarts == 1 and job.running
+            assert job.consecutive_failures == 0
+            assert job.healthy()
+            assert job.backoff() == 1.0
+        finally:
+            await sup.stop()
+
+    asyncio.run(scenario())
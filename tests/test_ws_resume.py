@@ -0,0 +1,50 @@
+import json
+import asyncio
+
+from change_feed import ChangeFeed
+from main import ConnectionManager
+from wire import WireFormat
+
+
+def _frame(*machines):
+    return {"locations": [{"name": "L1", "machines": [{"id": mid, "produced_qty": qty} for mid, qty in machines]}]}
+
+
+class FakeSocket:
+    """Records sent frames; a frame published while the first one is in flight."""
+
+    def __init__(self, feed: ChangeFeed):
+        self.feed = feed
+        self.sent = []
+
+    async def send_text(self, text: str):
+        self.sent.append(json.loads(text))
+        if len(self.sent) == 1:
+            self.feed.record_frame(_frame((1, 9), (2, 3)))
+
+
+def test_resume_replays_missed_versions_without_a_gap():
+    feed = ChangeFeed()
+    feed.record_frame(_frame((1, 0), (2, 0)))  # v1: last version the client saw
+    feed.record_frame(_frame((1, 4), (2, 0)))  # v2
+    manager = ConnectionManager(feed)
+    ws = FakeSocket(feed)
+
+    asyncio.run(manager.resume(ws, WireFormat(), since=1))
+
+    # Catch-up up to v2, then the v3 published mid-send, then live frames take over
+    assert [(m["resume"], m["version"]) for m in ws.sent] == [("changes", 2), ("changes", 3)]
+    assert ws.sent[0]["changes"] == [{"id": 1, "produced_qty": 4, "location": "L1"}]
+    assert {m["id"] for m in ws.sent[1]["changes"]} == {1, 2}
+
+
+def test_resume_sends_snapshot_when_gap_is_no_longer_buffered():
+    feed = ChangeFeed(size=2)
+    for qty in range(4):
+        feed.record_frame(_frame((1, qty)))
+    ws = FakeSocket(ChangeFeed())  # nothing published while sending
+
+    asyncio.run(ConnectionManager(feed).resume(ws, WireFormat(), since=1))
+
+    assert [(m["resume"], m["version"]) for m in ws.sent] == [("snapshot", 4)]
+    assert ws.sent[0]["locations"] == [{"name": "L1", "machines": [{"id": 1, "produced_qty": 3}]}]
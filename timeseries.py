@@ -0,0 +1,257 @@
+# =====================================================
+# timeseries.py – Bucketed Production Time-Series
+# Produced meters per minute / hour / day for charts, computed
+# with SQL GROUP BY. Closed hours come from a per-machine hourly
+# rollup of production_logs (kept current by the supervised
+# production_rollup job in main.py); the open hour, partial edge
+# hours and work-order queries are grouped from the raw rows
+# through covering (…, timestamp, produced_qty) indexes.
+# =====================================================
+import os
+import math
+import time
+import logging
+from datetime import date, datetime, timezone
+from typing import Dict, Literal, Optional
+
+from fastapi import APIRouter, Query
+from sqlalchemy import Integer, cast, delete, func, insert, literal, select
+from sqlalchemy.orm import Session
+
+from database import IS_SQLITE, SessionLocal
+from models import Machine, ProductionHourly, ProductionLog
+from oee import _ts
+from report import busy_response, run_report
+from report_cache import REPORT_CACHE_GRACE_S, report_cache
+from wire import FastJSONResponse
+
+ROLLUP_INTERVAL_S = float(os.getenv("ROLLUP_INTERVAL_S", 60))
+ROLLUP_CHUNK_H = 24  # hours per rollup transaction (short write locks)
+RAW_SEGMENTS = 4     # raw ranges spanning ≤ this many buckets are summed per bucket
+TIMESERIES_MAX_POINTS = int(os.getenv("TIMESERIES_MAX_POINTS", 500))
+
+BUCKET_WIDTHS = {"minute": 60, "hour": 3600, "day": 86400}
+# Downsampling ladder: the narrowest width ≥ the requested bucket that fits max_points
+LADDER = (60, 300, 900, 1800, 3600, 3 * 3600, 6 * 3600, 12 * 3600, 86400, 7 * 86400)
+
+
+def epoch_bucket(column, width: int):
+    """SQL expression: unix seconds of a timestamp column // width."""
+    if IS_SQLITE:
+        return cast(func.strftime("%s", column), Integer) // width
+    return cast(func.floor(func.extract("epoch", column) / width), Integer)
+
+
+def _naive(ts: float) -> datetime:
+    # production_logs timestamps are compared as naive UTC (as in report.py)
+    return datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None)
+
+
+def _width_label(width: int) -> str:
+    for unit, seconds in (("d", 86400), ("h", 3600), ("m", 60)):
+        if width % seconds == 0:
+            return f"{width // seconds}{unit}"
+    return f"{width}s"
+
+# =====================================================
+# HOURLY ROLLUP (server process, write session)
+# =====================================================
+class HourlyRollup:
+    """
+    Recomputes whole closed hours (delete + INSERT … SELECT GROUP BY),
+    so re-running a range is idempotent. Watermark = last rolled hour
+    with production; history edits mark their range dirty.
+    """
+
+    def __init__(self):
+        self.dirty_from: Optional[int] = None  # epoch hour to recompute from
+        self.rolled_hours = 0
+
+    def mark_dirty(self, start: Optional[date] = None, _end: Optional[date] = None):
+        hour = int(_ts(datetime.combine(start, datetime.min.time())) // 3600) if start else 0
+        self.dirty_from = hour if self.dirty_from is None else min(self.dirty_from, hour)
+
+    def roll(self, db: Session, from_hour: int, to_hour: int):
+        hour = epoch_bucket(ProductionLog.timestamp, 3600)
+        db.execute(delete(ProductionHourly).where(ProductionHourly.hour >= from_hour,
+                                                  ProductionHourly.hour < to_hour))
+        db.execute(insert(ProductionHourly).from_select(
+            ["machine_id", "hour", "location", "meters"],
+            select(ProductionLog.machine_id, hour,
+                   func.max(ProductionLog.location), func.sum(ProductionLog.produced_qty))
+            .where(ProductionLog.timestamp >= _naive(from_hour * 3600),
+                   ProductionLog.timestamp < _naive(to_hour * 3600))
+            .group_by(ProductionLog.machine_id, hour)
+        ))
+
+    def run_once(self, now: float = None) -> int:
+        """Roll every closed hour not rolled yet; → hours processed."""
+        closed = int(((now or time.time()) - REPORT_CACHE_GRACE_S) // 3600)  # hours < closed are final
+        db = SessionLocal()
+        try:
+            start = self.dirty_from
+            if start is None:
+                last = db.query(func.max(ProductionHourly.hour)).scalar()
+                if last is not None:
+                    start = last + 1
+                else:
+                    first = db.query(func.min(ProductionLog.timestamp)).scalar()
+                    start = int(_ts(first) // 3600) if first else closed
+            if start == 0:  # dirty "everything"
+                first = db.query(func.min(ProductionLog.timestamp)).scalar()
+                start = int(_ts(first) // 3600) if first else closed
+            self.dirty_from = None
+
+            for chunk in range(start, closed, ROLLUP_CHUNK_H):
+                self.roll(db, chunk, min(chunk + ROLLUP_CHUNK_H, closed))
+                db.commit()
+            processed = max(0, closed - start)
+            self.rolled_hours += processed
+            if processed > ROLLUP_CHUNK_H:
+                logging.info(f"📈 Production rollup: {processed} hours rolled up")
+            return processed
+        except Exception:
+            db.rollback()
+            self.mark_dirty()  # unknown state → recompute everything next time
+            raise
+        finally:
+            db.close()
+
+
+hourly_rollup = HourlyRollup()
+report_cache.listeners.append(hourly_rollup.mark_dirty)
+
+# =====================================================
+# QUERY (report worker, read-only session)
+# =====================================================
+def pick_width(bucket: str, start_ts: float, end_ts: float, max_points: int) -> int:
+    minimum = BUCKET_WIDTHS.get(bucket, LADDER[0])
+    for width in LADDER:
+        if width < minimum:
+            continue
+        if math.ceil(end_ts / width) - math.floor(start_ts / width) <= max_points:
+            return width
+    return LADDER[-1]
+
+
+def production_timeseries(db: Session, start_ts: float, end_ts: float, width: int,
+                          machine_id: Optional[int], location: Optional[str], work_order: Optional[str],
+                          series: Optional[str]) -> Dict:
+    t0 = time.perf_counter()
+    totals: Dict = {}
+
+    def collect(query):
+        for b, key, meters in query:
+            per_key = totals.setdefault(key, {})
+            per_key[b] = per_key.get(b, 0) + (meters or 0)
+
+    def grouped(table, bucket, value, *where):
+        """bucket: SQL expression, or an int when the whole range is one bucket."""
+        key = getattr(table, series) if series else literal(0)
+        query = select(literal(bucket) if isinstance(bucket, int) else bucket, key, func.sum(value)).where(*where)
+        machine_col, location_col = table.machine_id, table.location
+        if table is ProductionLog:
+            # Keep SQLite (no ANALYZE stats) off the single-column machine/location
+            # indexes, which read every row of that machine: the time range on the
+            # covering timestamp index is far narrower
+            machine_col, location_col = machine_col + 0, location_col.concat("")
+        if machine_id is not None:
+            query = query.where(machine_col == machine_id)
+        if location:
+            query = query.where(location_col == location)
+        if work_order:
+            query = query.where(table.work_order == work_order)
+        group = ([] if isinstance(bucket, int) else [bucket]) + ([key] if series else [])
+        collect(db.execute(query.group_by(*group) if group else query))
+
+    def raw(a: float, b: float):
+        if b <= a:
+            return
+        first, last = math.floor(a / width), math.ceil(b / width)
+        if last - first > RAW_SEGMENTS:
+            grouped(ProductionLog, epoch_bucket(ProductionLog.timestamp, width), ProductionLog.produced_qty,
+                    ProductionLog.timestamp >= _naive(a), ProductionLog.timestamp < _naive(b))
+            return
+        # Edge pieces span a bucket or two: plain range sums, no per-row strftime
+        for bucket in range(first, last):
+            grouped(ProductionLog, bucket, ProductionLog.produced_qty,
+                    ProductionLog.timestamp >= _naive(max(a, bucket * width)),
+                    ProductionLog.timestamp < _naive(min(b, (bucket + 1) * width)))
+
+    h0, h1 = math.ceil(start_ts / 3600), math.floor(end_ts / 3600)   # whole hours inside the window
+    rolled = None
+    # The rollup has no work orders: those are bounded by their quantity, read raw
+    if width % 3600 == 0 and h1 > h0 and not work_order and series != "work_order":
+        last = db.execute(select(func.max(ProductionHourly.hour))).scalar()
+        rolled = min(h1, last + 1) if last is not None else None
+    if rolled is not None and rolled > h0:
+        grouped(ProductionHourly, (ProductionHourly.hour * 3600) // width, ProductionHourly.meters,
+                ProductionHourly.hour >= h0, ProductionHourly.hour < rolled)
+        raw(start_ts, h0 * 3600)
+        raw(rolled * 3600, end_ts)
+        rollup_hours = rolled - h0
+    else:
+        raw(start_ts, end_ts)
+        rollup_hours = 0
+
+    first, last_b = math.floor(start_ts / width), math.ceil(end_ts / width)
+    names = {}
+    if series == "machine_id":
+        names = {mid: name for mid, name in db.query(Machine.id, Machine.name)}
+    keys = sorted(totals, key=str) if series else [0]
+    out = []
+    for key in keys:
+        per_key = totals.get(key, {})
+        values = [per_key.get(b, 0) for b in range(first, last_b)]
+        entry = {"key": key if series else None, "values": values, "total": sum(values)}
+        if series == "machine_id":
+            entry["name"] = names.get(key)
+        out.append(entry)
+
+    return {
+        "t": [b * width for b in range(first, last_b)],
+        "series": out,
+        "rollup_hours": rollup_hours,
+        "query_ms": round((time.perf_counter() - t0) * 1000, 2),
+    }
+
+# =====================================================
+# API
+# =====================================================
+router = APIRouter(prefix="/api/report", tags=["Production Report"])
+
+SERIES_COLUMNS = {"machine": "machine_id", "location": "location", "work_order": "work_order"}
+
+
+@router.get("/timeseries")
+async def get_timeseries(
+    bucket: Literal["auto", "minute", "hour", "day"] = Query("auto", description="Smallest bucket width"),
+    hours: float = Query(24, gt=0, description="Window length ending now (ignored if start given)"),
+    start: Optional[datetime] = Query(None, description="ISO start"),
+    end: Optional[datetime] = Query(None, description="ISO end (default now)"),
+    machine_id: int = Query(None, description="Filter by machine"),
+    location: str = Query(None, description="Filter by location"),
+    work_order: str = Query(None, description="Filter by work order"),
+    series: Optional[Literal["machine", "location", "work_order"]] = Query(None, description="One series per key"),
+    max_points: int = Query(TIMESERIES_MAX_POINTS, ge=2, le=5000, description="Per series; wider buckets beyond")
+):
+    end_ts = _ts(end)
+    start_ts = _ts(start) if start else end_ts - hours * 3600
+    if end_ts <= start_ts:
+        return FastJSONResponse({"error": "end must be after start"}, status_code=400)
+    width = pick_width(bucket, start_ts, end_ts, max_points)
+
+    result = await run_report(production_timeseries, start_ts, end_ts, width, machine_id, location,
+                              work_order, SERIES_COLUMNS.get(series))
+    if result is None:
+        return busy_response()
+    return FastJSONResponse({
+        "bucket": _width_label(width),
+        "width_s": width,
+        "requested": bucket,
+        "downsampled": width > BUCKET_WIDTHS.get(bucket, LADDER[0]),
+        "start": datetime.fromtimestamp(start_ts, timezone.utc).isoformat(),
+        "end": datetime.fromtimestamp(end_ts, timezone.utc).isoformat(),
+        "series_by": series,
+        **result,
+    })
@@ -0,0 +1,195 @@
+# =====================================================
+# transitions.py – Machine State Event Store + Interval Index
+# Every status change appends a MachineTransition and closes /
+# opens a StateInterval in the caller's transaction. Time-in-state
+# questions sum the intervals overlapping a window instead of
+# scanning 30 s ProductionHistory snapshots.
+# =====================================================
+import time
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Optional, Sequence
+
+from fastapi import APIRouter, Query
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+import clock
+from database import SessionLocal
+from models import Machine, MachineTransition, StateInterval
+from oee import shift_of, _ts
+from wire import FastJSONResponse
+
+STATUSES = ("free", "running", "paused", "stopped", "completed")
+DOWNTIME_STATUSES = ("paused", "stopped")  # has a job but is not producing
+GROUP_KEYS = ("machine", "location", "shift", "status")
+
+# =====================================================
+# WRITER (caller commits)
+# =====================================================
+def record_transition(db: Session, m: Machine, old_status: Optional[str], new_status: str,
+                      cause: str = None, at: datetime = None):
+    if old_status == new_status:
+        return
+    at = at or clock.now()
+    ts = _ts(at)
+    db.add(MachineTransition(
+        machine_id=m.id, location=m.location, from_status=old_status, to_status=new_status,
+        work_order=m.work_order, cause=cause, at=at
+    ))
+    db.query(StateInterval).filter(
+        StateInterval.machine_id == m.id, StateInterval.end_ts.is_(None)
+    ).update({"end_ts": ts}, synchronize_session=False)
+    db.add(StateInterval(
+        machine_id=m.id, location=m.location, status=new_status,
+        work_order=m.work_order, start_ts=ts, end_ts=None
+    ))
+
+
+def apply_status(db: Session, m: Machine, new_status: str, cause: str = "operator") -> Optional[tuple]:
+    """Mutate + log the transition (no commit); → (erp work order, ERP status) to push, if any."""
+    record_transition(db, m, m.status, new_status, cause)
+    m.status = new_status
+    if new_status == "running":
+        m.is_locked = True
+        m.last_tick_time = clock.now()
+        return m.erpnext_work_order_id, "In Process"
+    if new_status == "completed":
+        m.is_locked = False
+        return m.erpnext_work_order_id, "Completed"
+    return None
+
+
+def seed_open_intervals():
+    """Open an interval for machines with none (first run / machines added by hand)."""
+    db = SessionLocal()
+    try:
+        open_ids = {mid for (mid,) in db.query(StateInterval.machine_id).filter(StateInterval.end_ts.is_(None))}
+        seeded = 0
+        for m in db.query(Machine).all():
+            if m.id not in open_ids:
+                record_transition(db, m, None, m.status or "free", cause="seed")
+                seeded += 1
+        db.commit()
+        if seeded:
+            logging.info(f"⏱️ Opened state intervals for {seeded} machines")
+    finally:
+        db.close()
+
+# =====================================================
+# READER
+# =====================================================
+def _split_by_shift(a: float, b: float):
+    """Yield (shift, seconds) pieces of [a, b) at hour boundaries where the shift changes."""
+    cur, shift = a, shift_of(a)
+    hour = (int(a // 3600) + 1) * 3600
+    while hour < b:
+        nxt = shift_of(hour)
+        if nxt != shift:
+            yield shift, hour - cur
+            cur, shift = hour, nxt
+        hour += 3600
+    yield shift, b - cur
+
+
+def time_in_state(start: datetime, end: datetime, group_by: Sequence[str] = ("machine",),
+                  location: str = None, machine_id: int = None) -> Dict:
+    t0 = time.perf_counter()
+    start_ts, end_ts = _ts(start), _ts(end)
+    now = clock.time()
+    db = SessionLocal()
+    try:
+        q = db.query(
+            StateInterval.machine_id, StateInterval.location, StateInterval.status,
+            StateInterval.start_ts, StateInterval.end_ts
+        ).filter(
+            StateInterval.start_ts < end_ts,
+            or_(StateInterval.end_ts > start_ts, StateInterval.end_ts.is_(None))
+        )
+        if location:
+            q = q.filter(StateInterval.location == location)
+        if machine_id is not None:
+            q = q.filter(StateInterval.machine_id == machine_id)
+        intervals = q.all()
+        names = {mid: name for mid, name in db.query(Machine.id, Machine.name)} if "machine" in group_by else {}
+    finally:
+        db.close()
+
+    totals = defaultdict(lambda: defaultdict(float))
+    for mid, loc, status, a, b in intervals:
+        a, b = max(a, start_ts), min(b if b is not None else now, end_ts)
+        if b <= a:
+            continue
+        pieces = _split_by_shift(a, b) if "shift" in group_by else ((None, b - a),)
+        for shift, seconds in pieces:
+            values = {"machine": mid, "location": loc, "shift": shift, "status": status}
+            totals[tuple(values[k] for k in group_by)][status] += seconds
+
+    rows = []
+    for key, by_status in sorted(totals.items(), key=lambda kv: tuple(str(k) for k in kv[0])):
+        row = dict(zip(group_by, key))
+        if "machine" in group_by:
+            row["machine_id"] = row.pop("machine")
+            row["name"] = names.get(row["machine_id"])
+        for status in STATUSES:
+            row[f"{status}_s"] = round(by_status.get(status, 0.0), 1)
+        row["downtime_s"] = round(sum(by_status.get(s, 0.0) for s in DOWNTIME_STATUSES), 1)
+        row["total_s"] = round(sum(by_status.values()), 1)
+        rows.append(row)
+
+    return {
+        "start": datetime.fromtimestamp(start_ts, timezone.utc).isoformat(),
+        "end": datetime.fromtimestamp(end_ts, timezone.utc).isoformat(),
+        "group_by": list(group_by),
+        "intervals": len(intervals),
+        "rows": rows,
+        "elapsed_ms": round((time.perf_counter() - t0) * 1000, 2)
+    }
+
+# =====================================================
+# API
+# =====================================================
+router = APIRouter(prefix="/api/metrics", tags=["Production Metrics"])
+
+
+@router.get("/time_in_state")
+def get_time_in_state(
+    hours: float = Query(24 * 7, description="Window length ending now (ignored if start given)"),
+    start: Optional[datetime] = Query(None, description="ISO start"),
+    end: Optional[datetime] = Query(None, description="ISO end (default now)"),
+    group_by: str = Query("machine", pattern="^(machine|location|shift|status)(,(machine|location|shift|status))*$",
+                          description="Comma separated, e.g. location,shift"),
+    location: str = Query(None, description="Filter by location"),
+    machine_id: int = Query(None, description="Filter by machine")
+):
+    end = end or datetime.now(timezone.utc)
+    start = start or (end - timedelta(hours=hours))
+    keys = tuple(dict.fromkeys(group_by.split(",")))
+    return FastJSONResponse(time_in_state(start, end, keys, location, machine_id))
+
+
+@router.get("/transitions")
+def get_transitions(
+    machine_id: int = Query(None, description="Filter by machine"),
+    hours: float = Query(24, description="Look-back window"),
+    limit: int = Query(500, le=5000)
+):
+    since = datetime.now(timezone.utc) - timedelta(hours=hours)
+    db = SessionLocal()
+    try:
+        q = db.query(MachineTransition).filter(MachineTransition.at >= since)
+        if machine_id is not None:
+            q = q.filter(MachineTransition.machine_id == machine_id)
+        rows = q.order_by(MachineTransition.at.desc()).limit(limit).all()
+        return FastJSONResponse({"transitions": [{
+            "machine_id": t.machine_id,
+            "location": t.location,
+            "from": t.from_status,
+            "to": t.to_status,
+            "work_order": t.work_order,
+            "cause": t.cause,
+            "at": t.at.isoformat()
+        } for t in rows]})
+    finally:
+        db.close()
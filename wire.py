@@ -0,0 +1,152 @@
+# =====================================================
+# wire.py – Compact Wire Formats
+# Fast JSON responses + per-client WebSocket encodings
+# (json | compact | msgpack) with optional deflate
+# =====================================================
+import json
+import zlib
+import logging
+from typing import Dict, Optional, Union
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional – stdlib json fallback
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional – msgpack clients fall back to compact JSON
+    msgpack = None
+
+# =====================================================
+# FAST JSON
+# =====================================================
+def dumps(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    Return this directly from an endpoint to skip FastAPI's
+    jsonable_encoder pass; content must already be JSON-native
+    (datetimes as isoformat strings).
+    """
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+# =====================================================
+# COMPACT DASHBOARD FRAME
+# Keys are sent once per frame as a schema, rows are arrays
+# =====================================================
+MACHINE_FIELDS = ("id", "name", "status")
+JOB_FIELDS = (
+    "work_order", "size", "total_qty", "completed_qty", "remaining_qty",
+    "remaining_time", "progress_percent", "erp_status", "erp_comments"
+)
+NEXT_JOB_FIELDS = ("machine_id", "work_order", "pipe_size", "total_qty", "produced_qty", "remaining_time")
+
+SCHEMA = {"machine": MACHINE_FIELDS, "job": JOB_FIELDS, "next_job": NEXT_JOB_FIELDS}
+
+
+def _row(obj: Optional[Dict], fields) -> Optional[list]:
+    return [obj.get(f) for f in fields] if obj else None
+
+
+def compact_frame(frame: Dict) -> Dict:
+    """
+    {"locations": [{"name", "machines": [...]}]} →
+    {"schema": {...}, "l": [[name, next_job_row, [[id, name, status, job_row, has_next], ...]], ...]}
+    next_job is stored once per location; has_next keeps the per-machine
+    attachment exact. Non-dashboard keys pass through untouched.
+    """
+    if "locations" not in frame:
+        return frame
+    out = {k: v for k, v in frame.items() if k != "locations"}
+    out["schema"] = SCHEMA
+    rows = []
+    for loc in frame["locations"]:
+        next_job = next((m["next_job"] for m in loc["machines"] if m.get("next_job")), None)
+        rows.append([
+            loc["name"],
+            _row(next_job, NEXT_JOB_FIELDS),
+            [
+                _row(m, MACHINE_FIELDS) + [_row(m.get("job"), JOB_FIELDS), 1 if m.get("next_job") else 0]
+                for m in loc["machines"]
+            ]
+        ])
+    out["l"] = rows
+    return out
+
+
+def expand_frame(frame: Dict) -> Dict:
+    """Inverse of compact_frame (used by tests/benchmarks and Python clients)."""
+    if "l" not in frame:
+        return frame
+    out = {k: v for k, v in frame.items() if k not in ("l", "schema")}
+    locations = []
+    for name, next_row, machines in frame["l"]:
+        next_job = dict(zip(NEXT_JOB_FIELDS, next_row)) if next_row else None
+        locations.append({"name": name, "machines": [
+            {
+                **dict(zip(MACHINE_FIELDS, m[:3])),
+                "job": dict(zip(JOB_FIELDS, m[3])) if m[3] else None,
+                "next_job": next_job if m[4] else None
+            } for m in machines
+        ]})
+    out["locations"] = locations
+    return out
+
+# =====================================================
+# PER-CLIENT NEGOTIATION
+# ws://host/ws/dashboard?format=compact|msgpack&compress=deflate
+# =====================================================
+FORMATS = ("json", "compact", "msgpack")
+COMPRESSIONS = (None, "deflate")
+
+
+class WireFormat:
+    def __init__(self, fmt: str = "json", compress: Optional[str] = None):
+        if fmt not in FORMATS:
+            fmt = "json"
+        if fmt == "msgpack" and msgpack is None:
+            logging.warning("msgpack not installed, falling back to compact JSON")
+            fmt = "compact"
+        if compress not in COMPRESSIONS:
+            compress = None
+        self.fmt = fmt
+        self.compress = compress
+
+    @classmethod
+    def negotiate(cls, params) -> "WireFormat":
+        return cls(params.get("format", "json"), params.get("compress"))
+
+    @property
+    def key(self):
+        return (self.fmt, self.compress)
+
+    def encode(self, frame: Dict) -> Union[str, bytes]:
+        if self.fmt == "msgpack":
+            payload = msgpack.packb(compact_frame(frame), use_bin_type=True)
+        elif self.fmt == "compact":
+            payload = dumps(compact_frame(frame))
+        else:
+            payload = dumps(frame)
+        if self.compress == "deflate":
+            return zlib.compress(payload, 6)
+        # Plain JSON stays a text frame so existing clients keep working
+        return payload if self.fmt == "msgpack" else payload.decode("utf-8")
+
+    @staticmethod
+    async def send(ws, payload: Union[str, bytes]):
+        if isinstance(payload, bytes):
+            await ws.send_bytes(payload)
+        else:
+            await ws.send_text(payload)
+
+
+DEFAULT_FORMAT = WireFormat()
@@ -0,0 +1,165 @@
+# =====================================================
+# work_orders.py – Work-Order Traceability
+# One response with everything quality needs for a work order:
+# which machines ran it, merged production segments with meters,
+# time per status, status transitions, history snapshots and the
+# ERPNext metadata. Every query is a range scan on a
+# (work_order, time, …) index, so latency tracks the size of the
+# work order, not of the tables.
+# =====================================================
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from fastapi import APIRouter
+from sqlalchemy.orm import Session
+
+from models import (Machine, ProductionLog, ProductionHistory, MachineTransition, StateInterval,
+                    ERPNextMetadata, ScheduledJob)
+from report import busy_response, run_report
+from wire import FastJSONResponse
+
+# A pause in meters longer than this starts a new production segment
+TRACE_SEGMENT_GAP_S = float(os.getenv("TRACE_SEGMENT_GAP_S", 600))
+
+router = APIRouter(prefix="/api/work_orders", tags=["Work Orders"])
+
+
+def _iso(dt: Optional[datetime]) -> Optional[str]:
+    return dt.isoformat() if dt else None
+
+
+def _epoch(dt: datetime) -> float:
+    return (dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)).timestamp()
+
+# =====================================================
+# TRACE (report worker, read-only session)
+# =====================================================
+def work_order_trace(db: Session, work_order: str) -> Dict:
+    """→ the trace, or {} when nothing references the work order."""
+    t0 = time.perf_counter()
+    now = time.time()
+
+    # Production segments: consecutive meters on one machine, split on gaps
+    segments, open_segment = [], {}
+    for machine_id, ts, qty in db.query(
+        ProductionLog.machine_id, ProductionLog.timestamp, ProductionLog.produced_qty
+    ).filter(ProductionLog.work_order == work_order).order_by(ProductionLog.timestamp):
+        seg = open_segment.get(machine_id)
+        if seg is None or _epoch(ts) - seg["_last"] > TRACE_SEGMENT_GAP_S:
+            seg = open_segment[machine_id] = {"machine_id": machine_id, "start": ts, "end": ts, "meters": 0}
+            segments.append(seg)
+        seg["end"], seg["_last"] = ts, _epoch(ts)
+        seg["meters"] += qty or 0
+
+    # 30 s history snapshots (also covers machines fed by real counters)
+    snapshots = {}
+    for machine_id, ts, status, produced in db.query(
+        ProductionHistory.machine_id, ProductionHistory.timestamp, ProductionHistory.status,
+        ProductionHistory.produced_qty
+    ).filter(ProductionHistory.work_order == work_order).order_by(ProductionHistory.timestamp):
+        snap = snapshots.get(machine_id)
+        if snap is None:
+            snap = snapshots[machine_id] = {"first": ts, "last": ts, "count": 0, "running": 0, "max_produced_qty": 0}
+        snap["last"] = ts
+        snap["count"] += 1
+        snap["running"] += status == "running"
+        snap["max_produced_qty"] = max(snap["max_produced_qty"], produced or 0)
+
+    transitions = db.query(
+        MachineTransition.machine_id, MachineTransition.from_status, MachineTransition.to_status,
+        MachineTransition.cause, MachineTransition.at
+    ).filter(MachineTransition.work_order == work_order).order_by(MachineTransition.at).all()
+
+    # Time per status per machine from the interval index (open interval runs to now)
+    durations = defaultdict(lambda: defaultdict(float))
+    for machine_id, status, start_ts, end_ts in db.query(
+        StateInterval.machine_id, StateInterval.status, StateInterval.start_ts, StateInterval.end_ts
+    ).filter(StateInterval.work_order == work_order):
+        durations[machine_id][status] += (end_ts if end_ts is not None else now) - start_ts
+
+    erp = db.query(
+        ERPNextMetadata.machine_id, ERPNextMetadata.erp_status, ERPNextMetadata.erp_comments,
+        ERPNextMetadata.last_synced
+    ).filter(ERPNextMetadata.work_order == work_order).order_by(ERPNextMetadata.id).all()
+
+    current = db.query(Machine.id).filter(Machine.work_order == work_order).all()
+    scheduled = db.query(ScheduledJob).filter(ScheduledJob.work_order == work_order).all()
+
+    machine_ids = ({s["machine_id"] for s in segments} | set(snapshots) | {t[0] for t in transitions}
+                   | set(durations) | {e[0] for e in erp} | {mid for (mid,) in current})
+    if not machine_ids and not scheduled:
+        return {}
+    info = {mid: (name, location) for mid, name, location in
+            db.query(Machine.id, Machine.name, Machine.location).filter(Machine.id.in_(machine_ids))}
+    current_ids = {mid for (mid,) in current}
+
+    machines = []
+    for mid in sorted(machine_ids):
+        name, location = info.get(mid, (None, None))
+        own = [s for s in segments if s["machine_id"] == mid]
+        by_status = durations.get(mid, {})
+        machines.append({
+            "machine_id": mid,
+            "name": name,
+            "location": location,
+            "current": mid in current_ids,
+            "meters": sum(s["meters"] for s in own),
+            "segments": len(own),
+            "first_at": _iso(own[0]["start"]) if own else None,
+            "last_at": _iso(own[-1]["end"]) if own else None,
+            **{f"{status}_s": round(seconds, 1) for status, seconds in sorted(by_status.items())},
+        })
+
+    return {
+        "work_order": work_order,
+        "totals": {
+            "meters": sum(s["meters"] for s in segments),
+            "machines": len(machine_ids),
+            "segments": len(segments),
+            "running_s": round(sum(d.get("running", 0.0) for d in durations.values()), 1),
+            "first_at": _iso(segments[0]["start"]) if segments else None,
+            "last_at": _iso(max(s["end"] for s in segments)) if segments else None,
+        },
+        "machines": machines,
+        "segments": [{
+            "machine_id": s["machine_id"],
+            "start": _iso(s["start"]),
+            "end": _iso(s["end"]),
+            "duration_s": round(_epoch(s["end"]) - _epoch(s["start"]), 1),
+            "meters": s["meters"],
+        } for s in segments],
+        "transitions": [{
+            "machine_id": mid, "from": old, "to": new, "cause": cause, "at": _iso(at)
+        } for mid, old, new, cause, at in transitions],
+        "snapshots": [{
+            "machine_id": mid,
+            "first": _iso(s["first"]),
+            "last": _iso(s["last"]),
+            "count": s["count"],
+            "running": s["running"],
+            "max_produced_qty": s["max_produced_qty"],
+        } for mid, s in sorted(snapshots.items())],
+        "erp": [{
+            "machine_id": mid, "erp_status": status, "erp_comments": comments, "last_synced": _iso(synced)
+        } for mid, status, comments, synced in erp],
+        "scheduled": [{
+            "id": j.id, "location": j.location, "assigned_machine_id": j.assigned_machine_id,
+            "qty": j.qty, "produced_qty": j.produced_qty, "priority": j.priority, "timestamp": _iso(j.timestamp)
+        } for j in scheduled],
+        "elapsed_ms": round((time.perf_counter() - t0) * 1000, 2),
+    }
+
+# =====================================================
+# API
+# =====================================================
+@router.get("/{work_order}/trace")
+async def get_work_order_trace(work_order: str):
+    trace = await run_report(work_order_trace, work_order)
+    if trace is None:
+        return busy_response()
+    if not trace:
+        return FastJSONResponse({"error": "Unknown work order"}, status_code=404)
+    return FastJSONResponse(trace)